@@ -0,0 +1,103 @@
+# table_labeling_tool/benchmarks/bench_data_editor.py
+"""
+数据编辑页的重跑耗时与发送到浏览器的数据量：对比旧版 (整表 astype(str) 搜索 + 整表传给 st.data_editor)
+与 ui.paged_editor 的服务端分页编辑器 + core.table_search 的搜索索引。
+用 streamlit.testing 的 AppTest 运行两个最小页面，测量无修改的重跑 (点击其他控件) 与两次搜索的耗时；
+数据量为 data_editor 消息 (含 Arrow 数据) 的字节数。
+
+运行 (在项目根目录下):
+    python -m benchmarks.bench_data_editor --rows 500000
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+_SETUP = """
+import sys
+sys.path.insert(0, {root!r})
+import streamlit as st
+from benchmarks.bench_data_editor import build_frame
+if st.session_state.get('df') is None:
+    st.session_state.df = build_frame({rows})
+df_display = st.session_state.df
+search_term = st.text_input("search", key="data_search_term").strip()
+st.checkbox("other", key="other")
+"""
+
+LEGACY_PAGE = _SETUP + """
+active_df_view = df_display.copy()
+if search_term:
+    mask = active_df_view.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
+    active_df_view = active_df_view[mask]
+edited_df_view = st.data_editor(active_df_view, num_rows="dynamic", key="data_editor_0", height=400)
+if not active_df_view.equals(edited_df_view):
+    st.session_state.df = edited_df_view.copy()
+"""
+
+PAGED_PAGE = _SETUP + """
+from ui.paged_editor import paged_data_editor
+from ui.ui_utils import table_search_index
+row_mask = table_search_index(df_display).search(search_term) if search_term else None
+paged_data_editor(df_display, "data_editor", row_mask)
+"""
+
+STEPS = [
+    # (说明, 操作)
+    ("rerun (no edit)", lambda at: at.checkbox(key="other").check()),
+    ("search 'user_01'", lambda at: at.text_input(key="data_search_term").set_value("user_01")),
+    ("search 'user_012'", lambda at: at.text_input(key="data_search_term").set_value("user_012")),
+]
+
+
+def build_frame(rows):
+    """测试数据：整数、浮点、类别与文本列。"""
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "user": [f"user_{i % 50000:05d}" for i in range(rows)],
+        "score": rng.random(rows).round(4),
+        "category": rng.choice(["正面", "负面", "中性"], rows),
+        "text": [f"这是一段用于测试编辑器的评论文本 #{i}" for i in range(rows)],
+    })
+
+
+def _payload_bytes(at):
+    return sum(frame.proto.ByteSize() for frame in at.dataframe)
+
+
+def measure(page_source, rows):
+    root = str(Path(__file__).resolve().parent.parent)
+    at = AppTest.from_string(page_source.format(root=root, rows=rows), default_timeout=600)
+    at.run()
+    results = []
+    for step_name, action in STEPS:
+        action(at)
+        t0 = time.perf_counter()
+        at.run()
+        results.append((step_name, time.perf_counter() - t0, _payload_bytes(at)))
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"rows={args.rows}")
+    legacy = measure(LEGACY_PAGE, args.rows)
+    paged = measure(PAGED_PAGE, args.rows)
+    for (step_name, legacy_s, legacy_bytes), (_, paged_s, paged_bytes) in zip(legacy, paged):
+        print(
+            f"{step_name:<20} legacy: {legacy_s:7.2f} s {legacy_bytes / 1024 / 1024:8.1f} MB   "
+            f"paged: {paged_s:7.2f} s {paged_bytes / 1024 / 1024:8.3f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# table_labeling_tool/benchmarks/bench_data_loading.py
+"""
+数据加载耗时与峰值内存：对比旧版按编码逐个重试整文件解析的CSV读取、readlines 的JSONL读取，
+与 core.data_handler 中按样本判断编码、pyarrow 单次解析及分块JSONL读取。
+每种情况在全新的Python进程中运行，峰值内存取进程的最大常驻内存 (ru_maxrss，仅 Linux/macOS)。
+
+运行 (在项目根目录下，生成的测试文件放在 --workdir 中):
+    python -m benchmarks.bench_data_loading --size-mb 1024
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CASES = [
+    # (文件名, 编码, 格式)
+    ("bench_utf8.csv", "utf-8", "csv"),
+    ("bench_latin1.csv", "latin1", "csv"),
+    ("bench.jsonl", "utf-8", "jsonl"),
+]
+
+_PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+from benchmarks.bench_data_loading import legacy_load_data_from_path
+from core.data_handler import load_data_from_path
+loader = legacy_load_data_from_path if {legacy!r} else load_data_from_path
+t0 = time.perf_counter()
+df = loader({path!r})
+seconds = time.perf_counter() - t0
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    peak_kb //= 1024
+print(json.dumps({{"seconds": seconds, "peak_mb": peak_kb / 1024, "rows": len(df)}}))
+"""
+
+
+def legacy_load_data_from_path(file_path):
+    """旧版 load_data_from_path 中的CSV / JSONL读取逻辑。"""
+    path = Path(file_path)
+    if path.suffix == ".csv":
+        for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
+            try:
+                return pd.read_csv(path, encoding=encoding)
+            except UnicodeDecodeError:
+                continue
+        return pd.read_csv(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    return pd.DataFrame([json.loads(line.strip()) for line in lines if line.strip()])
+
+
+def build_file(path, encoding, file_format, size_mb):
+    """生成约 size_mb 大小的测试文件 (已存在则复用)。latin1 文件中含非ASCII字符，utf-8 解码会失败。"""
+    if path.exists():
+        return
+    text = "Ça coûte très cher, réponse déjà reçue" if encoding == "latin1" else "这是一段用于测试加载速度的中文评论文本"
+    rng = np.random.default_rng(0)
+    chunk = pd.DataFrame({
+        "id": np.arange(50000),
+        "user": [f"user_{i:07d}" for i in range(50000)],
+        "score": rng.random(50000).round(4),
+        "created": "2024-01-02 10:00:00",
+        "text": [f"{text} #{i}" for i in range(50000)],
+    })
+    target_bytes = size_mb * 1024 * 1024
+    with open(path, "w", encoding=encoding, newline="") as f:
+        first = True
+        while f.tell() < target_bytes:
+            if file_format == "csv":
+                chunk.to_csv(f, index=False, header=first)
+            else:
+                f.write(chunk.to_json(orient="records", lines=True, force_ascii=False))
+            first = False
+            chunk["id"] += len(chunk)
+
+
+def measure(path, legacy):
+    root = str(Path(__file__).resolve().parent.parent)
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(root=root, legacy=legacy, path=str(path))],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--workdir", default="bench_data")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"size≈{args.size_mb} MB per file, workdir={workdir}")
+    for file_name, encoding, file_format in CASES:
+        path = workdir / f"{args.size_mb}mb_{file_name}"
+        build_file(path, encoding, file_format, args.size_mb)
+        legacy = measure(path, True)
+        new = measure(path, False)
+        print(
+            f"{file_name:<18} legacy: {legacy['seconds']:7.2f} s {legacy['peak_mb']:8.0f} MB   "
+            f"new: {new['seconds']:7.2f} s {new['peak_mb']:8.0f} MB   rows={new['rows']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
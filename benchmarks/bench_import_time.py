@@ -0,0 +1,58 @@
+# table_labeling_tool/benchmarks/bench_import_time.py
+"""
+冷启动导入耗时：每个模块在全新的Python进程中导入，取多次运行的中位数，
+并检查导入后 streamlit 是否被一并加载 (core 引擎不应依赖界面)。
+
+运行 (在项目根目录下):
+    python -m benchmarks.bench_import_time --repeat 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "core.labeling_runner",
+    "core.cli",
+    "core.utils",
+    "streamlit",
+    "ui.ui_utils",
+]
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - t0, "streamlit": "streamlit" in sys.modules}}))
+"""
+
+
+def measure(module, repeat):
+    samples = []
+    loads_streamlit = False
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module)],
+            capture_output=True, text=True, check=True
+        )
+        probe = json.loads(proc.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        loads_streamlit = probe["streamlit"]
+    return statistics.median(samples), loads_streamlit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    print(f"repeat={args.repeat} (median of cold imports)")
+    for module in args.modules:
+        seconds, loads_streamlit = measure(module, args.repeat)
+        print(f"{module:<22}: {seconds * 1000:8.1f} ms  streamlit loaded: {'yes' if loads_streamlit else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
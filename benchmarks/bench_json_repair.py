@@ -0,0 +1,92 @@
+# table_labeling_tool/benchmarks/bench_json_repair.py
+"""
+对比旧版响应解析 (去除代码块标记后直接 json.loads，失败即重新请求) 与 core.json_repair 的容错解析：
+按常见的失败类型构造一批模型响应，统计需要重新请求的次数和解析耗时。
+
+运行 (在项目根目录下):
+    python -m benchmarks.bench_json_repair --responses 20000 --failure-rate 0.1
+"""
+import argparse
+import json
+import random
+import time
+
+from core.json_repair import PARSE_CLEAN, PARSE_PARTIAL, PARSE_REPAIRED, salvage_json
+
+TASKS = ["情感", "主题", "是否广告"]
+
+# 失败类型 -> 由完整JSON构造出错响应
+FAILURE_KINDS = {
+    "prose": lambda text: f"好的，以下是分析结果：\n{text}\n希望对您有帮助。",
+    "trailing_comma": lambda text: text[:-1].rstrip() + ",\n}",
+    "truncated": lambda text: text[:int(len(text) * 0.8)],
+    "missing_brace": lambda text: text[:-1],
+    "garbage": lambda text: "抱歉，我无法完成这个请求。",
+}
+
+
+def build_response(rng):
+    result = {task: {"value": rng.choice(["正面", "负面", "中性"]), "reason": "根据文本中的关键词判断。" * rng.randint(1, 4)} for task in TASKS}
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+def legacy_parse(text):
+    """旧版 parse_labeling_response。"""
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return json.loads(text.strip())
+
+
+def build_responses(count, failure_rate, seed=0):
+    rng = random.Random(seed)
+    kinds = list(FAILURE_KINDS)
+    responses = []
+    for _ in range(count):
+        text = build_response(rng)
+        if rng.random() < failure_rate:
+            text = FAILURE_KINDS[rng.choice(kinds)](text)
+        elif rng.random() < 0.5:
+            text = f"```json\n{text}\n```"
+        responses.append(text)
+    return responses
+
+
+def run(parse, responses):
+    failures = 0
+    t0 = time.perf_counter()
+    for text in responses:
+        try:
+            parse(text)
+        except json.JSONDecodeError:
+            failures += 1
+    return failures, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=20000)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    responses = build_responses(args.responses, args.failure_rate)
+    legacy_failures, legacy_s = run(legacy_parse, responses)
+    salvage_failures, salvage_s = run(salvage_json, responses)
+
+    outcomes = {PARSE_CLEAN: 0, PARSE_REPAIRED: 0, PARSE_PARTIAL: 0}
+    for text in responses:
+        try:
+            outcomes[salvage_json(text)[1]] += 1
+        except json.JSONDecodeError:
+            pass
+
+    print(f"responses={args.responses} failure_rate={args.failure_rate}")
+    print(f"legacy:  re-requests {legacy_failures:6d}   parse {legacy_s:6.2f} s")
+    print(f"salvage: re-requests {salvage_failures:6d}   parse {salvage_s:6.2f} s   {outcomes}")
+
+
+if __name__ == "__main__":
+    main()
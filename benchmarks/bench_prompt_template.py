@@ -0,0 +1,71 @@
+# table_labeling_tool/benchmarks/bench_prompt_template.py
+"""
+微基准：对比逐行 re.sub + str.format 的旧Prompt填充方式与预编译模板。
+
+运行 (在项目根目录下):
+    python -m benchmarks.bench_prompt_template --rows 20000 --cols 12
+"""
+import argparse
+import re
+import time
+
+import pandas as pd
+
+from core.prompt_template import compile_prompt_template
+
+
+def legacy_fill(template, ordered_keys, row_dict):
+    """旧版 process_single_row 中的Prompt填充逻辑 (逐行正则改写模板)。"""
+    ordered_string_values = []
+    for col_key in ordered_keys:
+        value = row_dict.get(col_key)
+        if pd.isna(value) or value is None:
+            ordered_string_values.append("")
+        else:
+            ordered_string_values.append(str(value))
+    indexed_template_str = template
+    for i, col_name_key in enumerate(ordered_keys):
+        escaped_col_name = re.escape(col_name_key)
+        indexed_template_str = re.sub(r'\{' + escaped_col_name + r'\}', f'{{{i}}}', indexed_template_str)
+    return indexed_template_str.format(*ordered_string_values)
+
+
+def build_case(n_rows, n_cols):
+    cols = [f"列_{i}" for i in range(n_cols)]
+    info = "".join(f"  {i}. {c}: \"{{{c}}}\"\n" for i, c in enumerate(cols, 1))
+    template = (
+        "请仔细分析以下提供的参考信息，并根据这些信息完成下列分析任务。\n\n提供的参考信息：\n"
+        + info
+        + "\n分析任务与要求：\n  任务 1 (目标输出: '结果'):\n    " + "根据参考信息判断类别。" * 20
+        + "\n\n{{\n  \"结果\": {{\n    \"value\": \"针对'结果'的标注结果\"\n  }}\n}}\n"
+    )
+    rows = [{c: f"值{r}_{j}" for j, c in enumerate(cols)} for r in range(n_rows)]
+    return template, cols, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--cols", type=int, default=12)
+    args = parser.parse_args()
+
+    template, cols, rows = build_case(args.rows, args.cols)
+
+    t0 = time.perf_counter()
+    legacy = [legacy_fill(template, cols, r) for r in rows]
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    compiled = compile_prompt_template(template, cols)
+    new = [compiled.render(r) for r in rows]
+    t_new = time.perf_counter() - t0
+
+    assert legacy == new, "预编译模板的输出与旧实现不一致"
+    print(f"rows={args.rows} cols={args.cols}")
+    print(f"legacy  re.sub+format : {t_legacy:.3f}s ({t_legacy / args.rows * 1e6:.1f} us/row)")
+    print(f"compiled template     : {t_new:.3f}s ({t_new / args.rows * 1e6:.1f} us/row)")
+    print(f"speedup               : {t_legacy / t_new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
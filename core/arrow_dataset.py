@@ -0,0 +1,163 @@
+# table_labeling_tool/core/arrow_dataset.py
+import bisect
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.data_handler import EXPORT_CHUNK_ROWS, save_chunks_to_path
+from core.notifier import notify_error
+from core.result_merge import labeling_output_columns, merge_labeling_results
+from core.results import RowResult
+
+# 超过此大小的 Parquet 文件以内存映射的只读数据集打开，不整体读入 pandas
+LARGE_DATASET_BYTES = 512 * 1024 * 1024
+
+
+class ArrowDataset:
+    """
+    以内存映射方式打开的 Parquet 文件 (只读)。行号 0..num_rows-1 即行索引。
+    只按需读取用到的 row group 与列：编辑器只取当前页，标注只取Prompt输入列，
+    导出逐页合并结果后写出，整个表不会一次性转换为 Python 对象。
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._file = pq.ParquetFile(str(self.path), memory_map=True)
+        metadata = self._file.metadata
+        self.num_rows = metadata.num_rows
+        self.schema = self._file.schema_arrow
+        self.columns: List[str] = list(self.schema.names)
+        # 每个 row group 的起始行号，用于定位某一页所在的 row group
+        self._row_group_starts: List[int] = []
+        start = 0
+        for i in range(metadata.num_row_groups):
+            self._row_group_starts.append(start)
+            start += metadata.row_group(i).num_rows
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def index(self) -> pd.RangeIndex:
+        return pd.RangeIndex(self.num_rows)
+
+    def read_page(self, start: int, stop: int, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """读取 [start, stop) 行 (只解码覆盖这些行的 row group)，行索引为原始行号。"""
+        start, stop = max(0, start), min(self.num_rows, stop)
+        columns = list(columns) if columns is not None else self.columns
+        if start >= stop or not self._row_group_starts:
+            empty_df = self.schema.empty_table().select(columns).to_pandas()
+            empty_df.index = pd.RangeIndex(start, start)
+            return empty_df
+        first_group = bisect.bisect_right(self._row_group_starts, start) - 1
+        last_group = bisect.bisect_right(self._row_group_starts, stop - 1) - 1
+        table = self._file.read_row_groups(range(first_group, last_group + 1), columns=columns)
+        offset = start - self._row_group_starts[first_group]
+        page_df = table.slice(offset, stop - start).to_pandas()
+        page_df.index = pd.RangeIndex(start, stop)
+        return page_df
+
+    def read_columns(self, columns: Sequence[str]) -> pd.DataFrame:
+        """只读取指定列的所有行 (如Prompt输入列)。"""
+        projected = [col for col in columns if col in self.columns]
+        if not projected:
+            return pd.DataFrame(index=self.index)
+        columns_df = self._file.read(columns=projected).to_pandas(split_blocks=True, self_destruct=True)
+        columns_df.index = self.index
+        return columns_df
+
+    def iter_pages(self, page_rows: int = EXPORT_CHUNK_ROWS, columns: Optional[Sequence[str]] = None) -> Iterator[pd.DataFrame]:
+        for start in range(0, self.num_rows, max(1, int(page_rows))):
+            yield self.read_page(start, start + page_rows, columns)
+
+    def merge_results_page(
+        self,
+        start: int,
+        stop: int,
+        labeling_results_map: Dict[Any, RowResult],
+        labeling_tasks: List[Dict[str, Any]]
+    ) -> pd.DataFrame:
+        """读取一页并合并该页的标注结果 (用于预览)。"""
+        page_df = self.read_page(start, stop)
+        page_results = {idx: labeling_results_map[idx] for idx in page_df.index if idx in labeling_results_map}
+        merged_df, _ = merge_labeling_results(page_df, page_results, labeling_tasks)
+        return merged_df
+
+    def _merge_output_columns(
+        self,
+        labeling_results_map: Dict[Any, RowResult],
+        labeling_tasks: List[Dict[str, Any]]
+    ) -> pd.DataFrame:
+        """对所有行合并输出列 (只含输出列，内存占用远小于整表)。数据中已有的同名列作为合并的基础。"""
+        output_cols = labeling_output_columns(labeling_tasks)
+        existing_output_cols = [col for col in self.columns if col in output_cols]
+        labels_df, _ = merge_labeling_results(self.read_columns(existing_output_cols), labeling_results_map, labeling_tasks)
+        return labels_df
+
+    def iter_merged_pages(self, labels_df: pd.DataFrame, page_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """逐页产出拼上了输出列 (见 _merge_output_columns) 的数据，列顺序与 merge_labeling_results 一致。"""
+        for page_df in self.iter_pages(page_rows):
+            page_labels = labels_df.iloc[page_df.index.start:page_df.index.stop]
+            for col in labels_df.columns:
+                page_df[col] = page_labels[col].to_numpy()
+            yield page_df
+
+    def _merged_schema(self, labels_df: pd.DataFrame) -> pa.Schema:
+        """合并结果的整表 schema：原始列沿用文件中的类型，输出列按所有行推断。"""
+        label_schema = pa.Schema.from_pandas(labels_df, preserve_index=False)
+        return pa.schema(
+            [label_schema.field(col) if col in labels_df.columns else self.schema.field(col) for col in self.columns]
+            + [label_schema.field(col) for col in labels_df.columns if col not in self.columns]
+        )
+
+    def export_merged(
+        self,
+        file_path: Union[str, Path],
+        format_type: str,
+        labeling_results_map: Dict[Any, RowResult],
+        labeling_tasks: List[Dict[str, Any]]
+    ) -> bool:
+        """逐页合并标注结果并写出到文件 (峰值内存约为一页加输出列)。返回是否成功。"""
+        labels_df = self._merge_output_columns(labeling_results_map, labeling_tasks)
+        arrow_schema = None
+        if format_type == 'parquet':
+            try:
+                arrow_schema = self._merged_schema(labels_df)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                notify_error(f"保存标注结果到 '{file_path}' (parquet) 时出错: {e}")
+                return False
+        return save_chunks_to_path(self.iter_merged_pages(labels_df), file_path, format_type, arrow_schema)
+
+    def export(self, file_path: Union[str, Path], format_type: str) -> bool:
+        """逐页写出原始数据。"""
+        return save_chunks_to_path(self.iter_pages(), file_path, format_type, arrow_schema=self.schema)
+
+
+def _has_stored_index(schema: pa.Schema) -> bool:
+    """文件中是否保存了 pandas 的非默认行索引 (此时行号与 pd.read_parquet 得到的索引不一致)。"""
+    pandas_metadata = (schema.metadata or {}).get(b'pandas')
+    if not pandas_metadata:
+        return False
+    index_columns = json.loads(pandas_metadata).get('index_columns', [])
+    return any(not isinstance(index_col, dict) for index_col in index_columns)
+
+
+def should_open_as_dataset(file_path: Union[str, Path]) -> bool:
+    """大于 LARGE_DATASET_BYTES 的 Parquet 文件以内存映射数据集打开。"""
+    path = Path(file_path)
+    return path.suffix.lower() == '.parquet' and path.exists() and path.stat().st_size >= LARGE_DATASET_BYTES
+
+
+def open_arrow_dataset(file_path: Union[str, Path]) -> Optional[ArrowDataset]:
+    """
+    打开 Parquet 文件为 ArrowDataset。文件中保存了自定义行索引时返回 None
+    (应整体读入 pandas，以保证行索引与断点记录一致)。
+    """
+    dataset = ArrowDataset(file_path)
+    if _has_stored_index(dataset.schema):
+        return None
+    return dataset
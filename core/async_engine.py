@@ -0,0 +1,289 @@
+# table_labeling_tool/core/async_engine.py
+import asyncio
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from openai import APIStatusError, AsyncOpenAI
+
+from core.batch_labeling import RowItem, batch_id_key, build_batch_prompt, chunk_rows, split_batch_result
+from core.client_pool import create_async_client
+from core.json_repair import PARSE_PARTIAL, PARSE_RETRIED, salvage_json
+from core.openai_caller import build_labeling_messages, describe_api_error
+from core.prompt_template import CompiledPromptTemplate
+from core.rate_limiter import estimate_request_tokens, get_rate_limiter
+from core.response_cache import ResponseCache, make_cache_key
+from core.results import ResultCallback, RowResult
+from core.retry_policy import RetryPolicy
+from core.run_metrics import RunMetrics
+from core.structured_output import (
+    build_response_format, get_endpoint_capabilities, is_response_format_rejected, with_batch_output_schema
+)
+
+DEFAULT_MAX_IN_FLIGHT = 100
+SUBMIT_WINDOW_FACTOR = 2  # 预先创建的批次协程数 = max_in_flight × 此值
+
+
+async def call_openai_api_async(
+    client: AsyncOpenAI,
+    messages: List[Dict[str, str]],
+    config: Dict[str, Any],
+    metrics: Optional[RunMetrics] = None,
+    attempt: int = 0
+) -> str:
+    """
+    异步调用 Chat Completion API，返回模型响应文本 (参数与 call_openai_api 一致)。
+    与线程引擎共用同一个RPM/TPM限流器，response_format 的选择与降级也与线程引擎相同。
+    """
+    rate_limiter = get_rate_limiter(config)
+    capabilities = get_endpoint_capabilities()
+    mode = capabilities.resolve_mode(config)
+    estimated_tokens = estimate_request_tokens(messages, config.get('max_tokens', 1500))
+    model_name = config.get('model_name', 'gpt-3.5-turbo')
+    while True:
+        await rate_limiter.acquire_async(estimated_tokens)
+        response_format = build_response_format(config, mode)
+        request_start = time.perf_counter()
+        try:
+            raw_response = await client.chat.completions.with_raw_response.create(
+                model=model_name,
+                messages=messages,
+                temperature=config.get('temperature', 0.05),
+                max_tokens=config.get('max_tokens', 1500),
+                stream=False,
+                **({'response_format': response_format} if response_format is not None else {}),
+            )
+        except APIStatusError as e:
+            rate_limiter.update_from_headers(e.response.headers)
+            if metrics is not None:
+                metrics.record_call(model_name, time.perf_counter() - request_start, attempt, e.status_code)
+            if response_format is not None and is_response_format_rejected(e):
+                mode = capabilities.record_rejected(config, mode)
+                continue
+            raise
+        except Exception:
+            if metrics is not None:
+                metrics.record_call(model_name, time.perf_counter() - request_start, attempt, None)
+            raise
+        break
+    rate_limiter.update_from_headers(raw_response.headers)
+    response = raw_response.parse()
+    rate_limiter.record_usage(estimated_tokens, getattr(response.usage, 'total_tokens', None))
+    if metrics is not None:
+        metrics.record_call(model_name, time.perf_counter() - request_start, attempt, raw_response.status_code, response.usage)
+    if response_format is not None:
+        capabilities.record_accepted(config, mode)
+    return response.choices[0].message.content
+
+
+async def request_labeling_result_async(
+    filled_prompt: str,
+    api_config: Dict[str, Any],
+    client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    retry_policy: RetryPolicy,
+    request_delay: float = 0.2,
+    response_cache: Optional[ResponseCache] = None,
+    expected_rows: Optional[int] = None
+) -> RowResult:
+    """
+    request_labeling_result 的异步版本：重试策略、响应缓存、JSON解析和返回的结果字典结构完全相同。
+    semaphore 限制同时在途的请求数；退避等待期间不占用并发名额。
+    """
+    cleaned_response: Optional[str] = None
+    messages = build_labeling_messages(filled_prompt)
+    cache_key = None
+    if response_cache is not None:
+        cache_key = make_cache_key(api_config, messages)
+        # SQLite 读写放到线程池中执行，不阻塞事件循环上其他在途的请求
+        cached = await asyncio.to_thread(response_cache.get, cache_key)
+        if cached is not None:
+            return {
+                "success": True, "result": cached['result'], "error": None,
+                "prompt_sent": filled_prompt, "raw_response": cached['raw_response']
+            }
+
+    retry_delay = 0.0
+    for attempt in range(retry_policy.max_retries + 1):
+        try:
+            async with semaphore:
+                # 取得并发名额后再检查暂停 / 熔断，排队等待名额的协程也会被拦住
+                await retry_policy.before_attempt_async(attempt)
+                api_response_content = await call_openai_api_async(client, messages, api_config, retry_policy.metrics, attempt)
+                cleaned_response = api_response_content.strip()
+                parsed_result, parse_outcome = salvage_json(cleaned_response, api_config.get('output_schema'), expected_rows)
+                retry_policy.record_success()
+                retry_policy.parse_stats.record(parse_outcome)
+                if cache_key is not None and parse_outcome != PARSE_PARTIAL:
+                    await asyncio.to_thread(response_cache.put, cache_key, parsed_result, cleaned_response)
+                # 与线程引擎一致：成功后占用并发名额等待 request_delay
+                if request_delay > 0: await asyncio.sleep(request_delay)
+            return {
+                "success": True, "result": parsed_result, "error": None,
+                "prompt_sent": filled_prompt, "raw_response": cleaned_response
+            }
+
+        except json.JSONDecodeError as je:
+            stop_reason = retry_policy.stop_reason(je, attempt)
+            if stop_reason is not None:
+                error_msg = f"JSON解析失败 ({stop_reason}): {je}。"
+                return {
+                    "success": False, "result": None, "error": error_msg,
+                    "prompt_sent": filled_prompt, "raw_response": cleaned_response
+                }
+            retry_policy.parse_stats.record(PARSE_RETRIED)
+
+        except Exception as e:
+            stop_reason = retry_policy.stop_reason(e, attempt)
+            if stop_reason is not None:
+                error_msg = f"API调用或处理失败 ({stop_reason}): {describe_api_error(e)}"
+                return {
+                    "success": False, "result": None, "error": error_msg,
+                    "prompt_sent": filled_prompt, "raw_response": cleaned_response
+                }
+
+        retry_delay = retry_policy.next_delay(retry_delay)
+        await asyncio.sleep(retry_delay)
+
+    return {
+        "success": False, "result": None, "error": f"已耗尽 {retry_policy.max_retries + 1} 次重试但未成功。",
+        "prompt_sent": filled_prompt, "raw_response": cleaned_response
+    }
+
+
+async def process_single_row_async(
+    row_data_tuple: Tuple[Any, Dict[str, Any]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    retry_policy: RetryPolicy,
+    request_delay: float = 0.2,
+    response_cache: Optional[ResponseCache] = None
+) -> Tuple[Any, RowResult]:
+    """process_single_row 的异步版本，返回 (行索引, 结果字典)。"""
+    row_idx, row_dict = row_data_tuple
+    filled_prompt: Optional[str] = None
+
+    try:
+        filled_prompt = compiled_template.render(row_dict)
+        return row_idx, await request_labeling_result_async(
+            filled_prompt, api_config, client, semaphore, retry_policy, request_delay, response_cache
+        )
+    except Exception as e:
+        return row_idx, {
+            "success": False, "result": None, "error": f"处理失败 (未知错误): {e}",
+            "prompt_sent": filled_prompt, "raw_response": None
+        }
+
+
+async def process_row_batch_async(
+    batch_rows: Sequence[RowItem],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    client: AsyncOpenAI,
+    semaphore: asyncio.Semaphore,
+    retry_policy: RetryPolicy,
+    request_delay: float = 0.2,
+    response_cache: Optional[ResponseCache] = None
+) -> List[Tuple[Any, RowResult]]:
+    """process_row_batch 的异步版本，回退的逐行请求并发执行。"""
+    missing_rows: List[RowItem] = list(batch_rows)
+    row_results: List[Tuple[Any, Dict[str, Any]]] = []
+    if len(batch_rows) > 1:
+        try:
+            id_key = batch_id_key(compiled_template.ordered_keys)
+            batch_prompt = build_batch_prompt(compiled_template, batch_rows)
+            batch_result = await request_labeling_result_async(
+                batch_prompt, with_batch_output_schema(api_config, id_key), client, semaphore,
+                retry_policy, request_delay, response_cache, expected_rows=len(batch_rows)
+            )
+            row_results, missing_rows = split_batch_result(batch_result, batch_rows, id_key)
+        except Exception:
+            row_results, missing_rows = [], list(batch_rows)
+
+    if missing_rows:
+        row_results.extend(await asyncio.gather(*(
+            process_single_row_async(
+                row_item, compiled_template, api_config, client, semaphore,
+                retry_policy, request_delay, response_cache
+            )
+            for row_item in missing_rows
+        )))
+    return row_results
+
+
+async def _run_rows_async(
+    row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    max_in_flight: int,
+    retry_policy: RetryPolicy,
+    request_delay: float,
+    on_result: Optional[ResultCallback],
+    response_cache: Optional[ResponseCache],
+    batch_size: int
+) -> Dict[Any, RowResult]:
+    results: Dict[Any, RowResult] = {}
+    semaphore = asyncio.Semaphore(max_in_flight)
+    client = create_async_client(api_config, min_pool_size=max_in_flight)
+    batches = chunk_rows(row_items, batch_size)
+    max_pending = max_in_flight * SUBMIT_WINDOW_FACTOR
+    pending_tasks: Set[asyncio.Future] = set()
+    done_tasks: Set[asyncio.Future] = set()
+
+    def submit_next_batch() -> None:
+        batch_rows = next(batches, None)
+        if batch_rows is not None:
+            pending_tasks.add(asyncio.ensure_future(process_row_batch_async(
+                batch_rows, compiled_template, api_config, client, semaphore, retry_policy, request_delay,
+                response_cache
+            )))
+
+    try:
+        try:
+            for _ in range(max_pending):
+                submit_next_batch()
+            while pending_tasks:
+                done_tasks, pending_tasks = await asyncio.wait(pending_tasks, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done_tasks:
+                    for row_idx, result_data in finished.result():
+                        if on_result is not None:
+                            on_result(row_idx, result_data)
+                        else:
+                            results[row_idx] = result_data
+                    submit_next_batch()
+        except BaseException:
+            # 被取消 (RunCancelled) 或中断时取消其余协程，不再发送新请求
+            for pending_task in pending_tasks:
+                pending_task.cancel()
+            await asyncio.gather(*pending_tasks, *done_tasks, return_exceptions=True)
+            raise
+    finally:
+        await client.close()
+    return results
+
+
+def run_rows_async(
+    row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    retry_policy: Optional[RetryPolicy] = None,
+    request_delay: float = 0.2,
+    on_result: Optional[ResultCallback] = None,
+    response_cache: Optional[ResponseCache] = None,
+    batch_size: int = 1
+) -> Dict[Any, RowResult]:
+    """
+    在单个事件循环上并发处理所有行，最多同时有 max_in_flight 个请求在途。
+    batch_size > 1 时每个请求携带 batch_size 行 (见 core.batch_labeling)。
+    retry_policy 为本次运行共享的重试策略，未提供时使用默认策略 (3次重试)。
+    行从 row_items 中按需读取，同一时间最多只有 max_in_flight × SUBMIT_WINDOW_FACTOR 个批次协程存在。
+    每完成一行即调用 on_result(行索引, 结果字典) (在调用线程中执行)，结果交给回调后即释放；
+    未提供 on_result 时收集并返回 {行索引: 结果字典}。
+    可在无界面的脚本中直接调用，也可在Streamlit脚本线程中调用。
+    """
+    return asyncio.run(_run_rows_async(
+        row_items, compiled_template, api_config, max(1, int(max_in_flight)),
+        retry_policy or RetryPolicy(), request_delay, on_result, response_cache, max(1, int(batch_size))
+    ))
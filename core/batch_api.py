@@ -0,0 +1,366 @@
+# table_labeling_tool/core/batch_api.py
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.client_pool import get_shared_client
+from core.config_manager import CONFIG_DIR
+from core.openai_caller import build_labeling_messages, parse_labeling_response
+from core.prompt_template import CompiledPromptTemplate
+from core.run_journal import RunJournal, index_key, load_journal_results
+from core.structured_output import build_response_format, get_endpoint_capabilities
+
+# 离线批处理 (OpenAI兼容的 /v1/files + /v1/batches 接口)：提交JSONL，后台轮询，按 custom_id 取回结果
+BATCH_JOBS_DIR = CONFIG_DIR / "batch_jobs"
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+MAX_REQUESTS_PER_BATCH = 50000      # 单个批处理输入文件的请求数上限
+DEFAULT_POLL_INTERVAL = 30.0        # 后台轮询间隔 (秒)
+UPLOAD_TIMEOUT = 600.0              # 上传/下载大文件时的超时 (秒)
+
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+BATCH_JOB_STATUS_LABELS = {
+    "submitted": "已提交",
+    "in_progress": "处理中",
+    "collected": "结果已取回",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
+
+def _job_file(job_id: str) -> Path:
+    return BATCH_JOBS_DIR / f"{job_id}.json"
+
+
+def _rows_file(job_id: str) -> Path:
+    """custom_id -> [行索引键] 的映射 (合并重复行时一个请求对应多行)。"""
+    return BATCH_JOBS_DIR / f"{job_id}_rows.json"
+
+
+def batch_results_path(job_id: str) -> Path:
+    """取回的结果以断点续跑记录的格式保存，可用 load_journal_results 读取。"""
+    return BATCH_JOBS_DIR / f"{job_id}_results.jsonl"
+
+
+def _input_file(job_id: str, part: int) -> Path:
+    return BATCH_JOBS_DIR / f"{job_id}_input_{part}.jsonl"
+
+
+def _temp_path(path: Path) -> Path:
+    """同目录下的唯一临时文件名 (写完后 replace 到目标路径，读取方不会看到写了一半的文件)。"""
+    return path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+_job_locks_lock = threading.Lock()
+_job_locks: Dict[str, threading.Lock] = {}
+
+
+def _job_lock(job_id: str) -> threading.Lock:
+    """同一任务的刷新 / 取回结果 / 取消互斥 (后台轮询线程与界面上的按钮可能同时操作同一任务)。"""
+    with _job_locks_lock:
+        return _job_locks.setdefault(job_id, threading.Lock())
+
+
+def save_batch_job(job: Dict[str, Any]) -> None:
+    BATCH_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = _temp_path(_job_file(job['job_id']))
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, indent=2, ensure_ascii=False)
+    tmp_path.replace(_job_file(job['job_id']))
+
+
+def load_batch_job(job_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_job_file(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_batch_jobs(flow_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """列出离线批处理任务 (可按任务流程名称过滤)，最新的在前。"""
+    if not BATCH_JOBS_DIR.exists():
+        return []
+    jobs = []
+    for path in BATCH_JOBS_DIR.glob("batchjob_*.json"):
+        if path.stem.endswith("_rows"):
+            continue
+        job = load_batch_job(path.stem)
+        if job is not None and (flow_name is None or job.get('flow_name') == flow_name):
+            jobs.append(job)
+    return sorted(jobs, key=lambda j: j.get('created_time', ''), reverse=True)
+
+
+def build_batch_request_line(custom_id: str, filled_prompt: str, api_config: Dict[str, Any]) -> str:
+    """
+    批处理输入文件中的一行 (与同步调用使用相同的模型参数和消息)。
+    批处理无法在请求被拒绝后降级，只使用该端点已确认可用的 response_format。
+    """
+    body = {
+        "model": api_config.get('model_name', 'gpt-3.5-turbo'),
+        "messages": build_labeling_messages(filled_prompt),
+        "temperature": api_config.get('temperature', 0.05),
+        "max_tokens": api_config.get('max_tokens', 1500),
+    }
+    response_format = build_response_format(api_config, get_endpoint_capabilities().known_mode(api_config))
+    if response_format is not None:
+        body["response_format"] = response_format
+    return json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}, ensure_ascii=False)
+
+
+def write_batch_input_files(
+    job_id: str,
+    row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    duplicate_groups: Optional[Dict[Any, List[Any]]] = None
+) -> Tuple[List[Path], Dict[str, List[str]]]:
+    """
+    把所有填充后的Prompt写入批处理输入JSONL (每个文件最多 MAX_REQUESTS_PER_BATCH 个请求)。
+    返回 (输入文件列表, custom_id -> [行索引键])。
+    """
+    BATCH_JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    input_paths: List[Path] = []
+    row_map: Dict[str, List[str]] = {}
+    out_file = None
+    try:
+        for request_no, (row_idx, row_dict) in enumerate(row_items):
+            if request_no % MAX_REQUESTS_PER_BATCH == 0:
+                if out_file is not None:
+                    out_file.close()
+                input_paths.append(_input_file(job_id, len(input_paths)))
+                out_file = open(input_paths[-1], 'w', encoding='utf-8')
+            custom_id = f"row-{request_no}"
+            members = (duplicate_groups or {}).get(row_idx, [row_idx])
+            row_map[custom_id] = [index_key(member_idx) for member_idx in members]
+            out_file.write(build_batch_request_line(custom_id, compiled_template.render(row_dict), api_config) + "\n")
+    finally:
+        if out_file is not None:
+            out_file.close()
+    return input_paths, row_map
+
+
+def submit_batch_job(
+    row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    flow_name: Optional[str] = None,
+    total_rows: Optional[int] = None,
+    duplicate_groups: Optional[Dict[Any, List[Any]]] = None
+) -> Dict[str, Any]:
+    """生成输入文件，上传 (purpose=batch) 并创建批处理，返回保存在磁盘上的任务记录。"""
+    job_id = f"batchjob_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    input_paths, row_map = write_batch_input_files(job_id, row_items, compiled_template, api_config, duplicate_groups)
+    if not input_paths:
+        raise ValueError("没有需要提交的数据行。")
+    with open(_rows_file(job_id), 'w', encoding='utf-8') as f:
+        json.dump(row_map, f, ensure_ascii=False)
+
+    client = get_shared_client(api_config).with_options(timeout=UPLOAD_TIMEOUT)
+    job = {
+        'job_id': job_id,
+        'flow_name': flow_name,
+        'created_time': datetime.now().isoformat(),
+        'model_name': api_config.get('model_name'),
+        'base_url': api_config.get('base_url'),
+        'total_rows': int(total_rows) if total_rows is not None else sum(len(v) for v in row_map.values()),
+        'total_requests': len(row_map),
+        'status': 'submitted',
+        'error': None,
+        'batches': [],
+    }
+    for input_path in input_paths:
+        with open(input_path, 'rb') as f:
+            uploaded = client.files.create(file=(input_path.name, f), purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT, completion_window=BATCH_COMPLETION_WINDOW
+        )
+        job['batches'].append(_batch_summary(batch))
+        save_batch_job(job)
+    return job
+
+
+def _batch_summary(batch: Any) -> Dict[str, Any]:
+    counts = getattr(batch, 'request_counts', None)
+    return {
+        'batch_id': batch.id,
+        'input_file_id': batch.input_file_id,
+        'status': batch.status,
+        'output_file_id': getattr(batch, 'output_file_id', None),
+        'error_file_id': getattr(batch, 'error_file_id', None),
+        'request_counts': {
+            'total': getattr(counts, 'total', 0),
+            'completed': getattr(counts, 'completed', 0),
+            'failed': getattr(counts, 'failed', 0),
+        } if counts is not None else {},
+    }
+
+
+def parse_batch_output_line(line: str) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    解析批处理输出 / 错误文件中的一行，返回 (custom_id, 结果字典)。
+    结果字典结构与 process_single_row 相同 (prompt_sent 为 None，Prompt保存在输入文件中)。
+    """
+    record = json.loads(line)
+    custom_id = record.get('custom_id')
+    response = record.get('response') or {}
+    body = response.get('body') or {}
+    if record.get('error') or response.get('status_code') != 200:
+        error_detail = record.get('error') or body.get('error') or f"HTTP {response.get('status_code')}"
+        return custom_id, {
+            "success": False, "result": None, "error": f"批处理请求失败: {error_detail}",
+            "prompt_sent": None, "raw_response": None
+        }
+    cleaned_response = None
+    try:
+        cleaned_response = (body['choices'][0]['message']['content'] or "").strip()
+        return custom_id, {
+            "success": True, "result": parse_labeling_response(cleaned_response), "error": None,
+            "prompt_sent": None, "raw_response": cleaned_response
+        }
+    except json.JSONDecodeError as je:
+        error_msg = f"JSON解析失败: {je}。"
+    except (KeyError, IndexError, TypeError) as e:
+        error_msg = f"批处理响应格式错误: {e}"
+    return custom_id, {
+        "success": False, "result": None, "error": error_msg,
+        "prompt_sent": None, "raw_response": cleaned_response
+    }
+
+
+def _collect_batch_results(job: Dict[str, Any], api_config: Dict[str, Any]) -> None:
+    """下载所有批处理的输出与错误文件，按 custom_id 映射回行，写入临时文件后替换结果文件。"""
+    with open(_rows_file(job['job_id']), 'r', encoding='utf-8') as f:
+        row_map: Dict[str, List[str]] = json.load(f)
+    client = get_shared_client(api_config).with_options(timeout=UPLOAD_TIMEOUT)
+    results_path = batch_results_path(job['job_id'])
+    tmp_path = _temp_path(results_path)
+    journal = RunJournal.open(tmp_path)
+    answered = set()
+    try:
+        for batch in job['batches']:
+            for file_id in (batch.get('output_file_id'), batch.get('error_file_id')):
+                if not file_id:
+                    continue
+                for line in client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    custom_id, result_data = parse_batch_output_line(line)
+                    if custom_id not in row_map or custom_id in answered:
+                        continue
+                    answered.add(custom_id)
+                    for member_key in row_map[custom_id]:
+                        journal.record(json.loads(member_key), result_data)
+        for custom_id, member_keys in row_map.items():
+            if custom_id in answered:
+                continue
+            for member_key in member_keys:
+                journal.record(json.loads(member_key), {
+                    "success": False, "result": None, "error": "批处理未返回该行的结果 (可能已过期或被取消)。",
+                    "prompt_sent": None, "raw_response": None
+                })
+    except BaseException:
+        journal.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    journal.close()
+    tmp_path.replace(results_path)
+
+
+def refresh_batch_job(job_id: str, api_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    查询所有批处理的状态；全部结束后取回结果 (含被取消 / 失败的批处理中已完成的部分，
+    取回后 results_collected 为 True)。返回更新后的任务记录。
+    """
+    with _job_lock(job_id):
+        return _refresh_batch_job_locked(job_id, api_config)
+
+
+def _refresh_batch_job_locked(job_id: str, api_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    job = load_batch_job(job_id)
+    if job is None or job.get('status') in ('collected', 'failed', 'cancelled'):
+        return job
+    client = get_shared_client(api_config)
+    try:
+        job['batches'] = [
+            _batch_summary(client.batches.retrieve(batch['batch_id']))
+            if batch.get('status') not in BATCH_TERMINAL_STATUSES else batch
+            for batch in job['batches']
+        ]
+        statuses = {batch['status'] for batch in job['batches']}
+        if statuses <= BATCH_TERMINAL_STATUSES:
+            all_unsuccessful = statuses <= {'failed', 'cancelled'}
+            # 中途取消 / 失败的批处理也可能带有已完成部分的输出或错误文件，同样取回
+            has_result_files = any(batch.get('output_file_id') or batch.get('error_file_id') for batch in job['batches'])
+            if has_result_files or not all_unsuccessful:
+                _collect_batch_results(job, api_config)
+                job['results_collected'] = True
+            if all_unsuccessful:
+                job['status'] = 'cancelled' if statuses == {'cancelled'} else 'failed'
+            else:
+                job['status'] = 'collected'
+        else:
+            job['status'] = 'in_progress'
+        job['error'] = None
+    except Exception as e:
+        job['error'] = str(e)
+    job['updated_time'] = datetime.now().isoformat()
+    save_batch_job(job)
+    return job
+
+
+def cancel_batch_job(job_id: str, api_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """取消尚未结束的批处理 (已完成的部分结果仍会在下次刷新时取回)。"""
+    with _job_lock(job_id):
+        job = load_batch_job(job_id)
+        if job is None:
+            return None
+        client = get_shared_client(api_config)
+        for batch in job['batches']:
+            if batch.get('status') not in BATCH_TERMINAL_STATUSES:
+                batch['status'] = client.batches.cancel(batch['batch_id']).status
+        save_batch_job(job)
+        return job
+
+
+def batch_job_has_results(job: Dict[str, Any]) -> bool:
+    """任务的结果是否已取回 (已取消 / 失败的任务也可能有部分结果)。"""
+    return job.get('status') == 'collected' or bool(job.get('results_collected'))
+
+
+def load_batch_job_results(job_id: str) -> Dict[str, Dict[str, Any]]:
+    """读取已取回的结果，返回 {行索引键: 结果字典} (用 map_journal_results_to_index 映射回DataFrame)。"""
+    return load_journal_results(batch_results_path(job_id))
+
+
+_pollers_lock = threading.Lock()
+_pollers: Dict[str, threading.Thread] = {}
+
+
+def _poll_until_done(job_id: str, api_config: Dict[str, Any], interval: float) -> None:
+    try:
+        while True:
+            job = refresh_batch_job(job_id, api_config)
+            if job is None or job.get('status') in ('collected', 'failed', 'cancelled'):
+                return
+            time.sleep(interval)
+    finally:
+        with _pollers_lock:
+            _pollers.pop(job_id, None)
+
+
+def ensure_batch_polling(job_id: str, api_config: Dict[str, Any], interval: float = DEFAULT_POLL_INTERVAL) -> None:
+    """为任务启动后台轮询线程 (已在轮询时不重复启动)，应用重启后再次调用即可恢复轮询。"""
+    with _pollers_lock:
+        if job_id in _pollers:
+            return
+        poller = threading.Thread(
+            target=_poll_until_done, args=(job_id, dict(api_config), interval),
+            name=f"batch-poll-{job_id}", daemon=True
+        )
+        _pollers[job_id] = poller
+        poller.start()
@@ -0,0 +1,161 @@
+# table_labeling_tool/core/batch_labeling.py
+import json
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from core.openai_caller import process_single_row, request_labeling_result
+from core.prompt_template import CompiledPromptTemplate, _cell_to_prompt_str
+from core.response_cache import ResponseCache
+from core.results import RowResult
+from core.retry_policy import RetryPolicy
+from core.structured_output import BATCH_RESULTS_KEY, with_batch_output_schema
+
+# 多行批量标注：每个请求携带 K 行数据，共用同一份任务指令
+DEFAULT_BATCH_SIZE = 1  # 1 表示逐行请求
+MAX_BATCH_SIZE = 50
+
+RowItem = Tuple[Any, Dict[str, Any]]
+
+
+def chunk_rows(row_items: Iterable[RowItem], batch_size: int) -> Iterator[List[RowItem]]:
+    """把行按 batch_size 分组 (惰性迭代)。"""
+    iterator = iter(row_items)
+    while True:
+        batch = list(islice(iterator, max(1, batch_size)))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_row_items(df: Any, columns: Sequence[str]) -> Iterator[RowItem]:
+    """
+    惰性地逐行产出 (行索引, {列名: 值})，只包含Prompt需要的列。
+    不会预先为整张表创建行字典，且不像 iterrows 那样把每行转换成 Series (也不会因此把整数列升级为浮点数)。
+    """
+    columns = list(columns)
+    projected_df = df[columns]
+    for row_idx, values in zip(projected_df.index, projected_df.itertuples(index=False, name=None)):
+        yield row_idx, dict(zip(columns, values))
+
+
+def batch_id_key(ordered_keys: Sequence[str]) -> str:
+    """批量请求中数据编号的字段名，避免与输入列重名。"""
+    return "id" if "id" not in ordered_keys else "_row_id"
+
+
+def build_batch_prompt(compiled_template: CompiledPromptTemplate, batch_rows: Sequence[RowItem]) -> str:
+    """
+    构建多行批量请求的Prompt：任务指令部分用字段引用代替占位符渲染一次，
+    数据部分为带编号的JSON数组 (编号从1开始)。要求模型返回 {"results": [...]}，与批量 Schema 一致，
+    无论 response_format 是 json_schema、json_object 还是未使用，输出格式都相同。
+    """
+    ordered_keys = compiled_template.ordered_keys
+    id_key = batch_id_key(ordered_keys)
+    instructions = compiled_template.render_values([f"（见下方每条数据的“{key}”字段）" for key in ordered_keys])
+    records = [
+        json.dumps(
+            {id_key: position, **{key: _cell_to_prompt_str(row_dict.get(key)) for key in ordered_keys}},
+            ensure_ascii=False
+        )
+        for position, (_, row_dict) in enumerate(batch_rows, 1)
+    ]
+    batch_count = len(batch_rows)
+    return (
+        f"{instructions}\n\n"
+        f"以下是需要分析的 {batch_count} 条数据（JSON数组，每个元素是一条数据，\"{id_key}\" 为数据编号）：\n"
+        "[\n" + ",\n".join(records) + "\n]\n\n"
+        "请对每一条数据分别独立完成上述全部分析任务。\n"
+        f"返回一个JSON对象，只有一个字段 \"{BATCH_RESULTS_KEY}\"，其值为JSON数组，"
+        f"每个元素对应一条数据：包含 \"{id_key}\" 字段（与输入的数据编号一致）以及上述JSON格式中的全部字段。\n"
+        f"\"{BATCH_RESULTS_KEY}\" 数组必须恰好包含 {batch_count} 个元素，不要遗漏或合并任何一条数据，不要添加任何额外的解释或说明文字。"
+    )
+
+
+def extract_batch_items(parsed_result: Any) -> Optional[List[Any]]:
+    """
+    从模型响应中取出结果数组：{"results": [...]} (Prompt 与 Schema 要求的格式)。
+    未遵循格式、直接返回数组时也接受；其他格式返回 None (整批回退为逐行请求)。
+    """
+    if isinstance(parsed_result, dict):
+        items = parsed_result.get(BATCH_RESULTS_KEY)
+        return items if isinstance(items, list) else None
+    if isinstance(parsed_result, list):
+        return parsed_result
+    return None
+
+
+def split_batch_result(
+    batch_result: Dict[str, Any],
+    batch_rows: Sequence[RowItem],
+    id_key: str
+) -> Tuple[List[Tuple[Any, RowResult]], List[RowItem]]:
+    """
+    校验批量响应并拆分为逐行结果。
+    返回 (成功匹配编号的 [(行索引, 结果字典)], 需要逐行重新请求的行)。
+    """
+    items = extract_batch_items(batch_result.get('result')) if batch_result.get('success') else None
+    if items is None:
+        return [], list(batch_rows)
+
+    items_by_position: Dict[int, Dict[str, Any]] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            position = int(item.get(id_key))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= position <= len(batch_rows) and position not in items_by_position:
+            items_by_position[position] = {k: v for k, v in item.items() if k != id_key}
+
+    row_results: List[Tuple[Any, Dict[str, Any]]] = []
+    missing_rows: List[RowItem] = []
+    for position, row_item in enumerate(batch_rows, 1):
+        row_result = items_by_position.get(position)
+        if row_result is None:
+            missing_rows.append(row_item)
+            continue
+        row_results.append((row_item[0], {
+            "success": True, "result": row_result, "error": None,
+            "prompt_sent": batch_result.get('prompt_sent'),
+            "raw_response": json.dumps(row_result, ensure_ascii=False)
+        }))
+    return row_results, missing_rows
+
+
+def process_row_batch(
+    batch_rows: Sequence[RowItem],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    retry_policy: RetryPolicy,
+    request_delay: float = 0.2,
+    response_cache: Optional[ResponseCache] = None
+) -> List[Tuple[Any, RowResult]]:
+    """
+    用一个请求标注多行数据。响应中缺失、编号不匹配或整体失败的行回退为逐行请求。
+    返回 [(行索引, 结果字典)]，结果字典结构与 process_single_row 相同。
+    """
+    ordered_keys = compiled_template.ordered_keys
+    if len(batch_rows) == 1:
+        return [process_single_row(
+            batch_rows[0], compiled_template, api_config, ordered_keys,
+            retry_policy.max_retries, request_delay, retry_policy=retry_policy, response_cache=response_cache
+        )]
+
+    try:
+        id_key = batch_id_key(ordered_keys)
+        batch_prompt = build_batch_prompt(compiled_template, batch_rows)
+        batch_result = request_labeling_result(
+            batch_prompt, with_batch_output_schema(api_config, id_key), retry_policy, request_delay, response_cache,
+            expected_rows=len(batch_rows)
+        )
+        row_results, missing_rows = split_batch_result(batch_result, batch_rows, id_key)
+    except Exception:
+        row_results, missing_rows = [], list(batch_rows)
+
+    for row_item in missing_rows:
+        row_results.append(process_single_row(
+            row_item, compiled_template, api_config, ordered_keys,
+            retry_policy.max_retries, request_delay, retry_policy=retry_policy, response_cache=response_cache
+        ))
+    return row_results
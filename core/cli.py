@@ -0,0 +1,260 @@
+# table_labeling_tool/core/cli.py
+"""
+命令行全量标注：按已保存的任务流程 (task_configs.json) 标注数据文件并写出结果文件，
+不依赖Streamlit界面，适合 cron / nohup 等后台长时间运行。
+
+用法:
+    python -m core.cli --flow 流程名称 --data data.csv --output labeled.xlsx
+
+退出码:
+    0   所有行均标注成功
+    1   部分行标注失败 (结果文件仍会写出，失败行的输出列为错误信息)
+    2   任务流程、数据或参数错误
+    130 被中断 (已完成的行保存在断点记录中，可加 --resume 继续)
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.arrow_dataset import open_arrow_dataset, should_open_as_dataset
+from core.async_engine import DEFAULT_MAX_IN_FLIGHT
+from core.batch_labeling import iter_row_items
+from core.config_manager import load_task_config
+from core.data_handler import load_data_from_path, save_dataframe_to_path
+from core.labeling_runner import ENGINE_THREAD, LABELING_ENGINES, run_labeling
+from core.prompt_template import compile_prompt_template
+from core.response_cache import get_response_cache
+from core.result_merge import merge_labeling_results
+from core.results import RowResult
+from core.row_dedup import deduplicate_rows
+from core.structured_output import with_output_schema
+from core.run_journal import (
+    RunJournal, compute_data_fingerprint, journal_path, load_journal_results, map_journal_results_to_index
+)
+
+EXIT_OK = 0
+EXIT_ROWS_FAILED = 1
+EXIT_CONFIG_ERROR = 2
+EXIT_INTERRUPTED = 130
+OUTPUT_FORMATS = ('csv', 'xlsx', 'parquet', 'jsonl')
+
+logger = logging.getLogger("table_labeling_tool.cli")
+
+
+class ProgressPrinter:
+    """统计每行结果，并按固定间隔向标准输出打印一行进度 (便于重定向到日志文件)。结果本身只写入断点记录。"""
+
+    def __init__(self, total_rows: int, already_done: int, interval: float, stream=None):
+        self.total_rows = total_rows
+        self.already_done = already_done
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.start_time = time.time()
+        self._last_print = 0.0
+
+    def on_result(self, row_idx: Any, result_data: RowResult) -> None:
+        self.processed += 1
+        if result_data.get('success'):
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        now = time.time()
+        if now - self._last_print >= self.interval or self.already_done + self.processed >= self.total_rows:
+            self._last_print = now
+            self.print_line()
+
+    def print_line(self) -> None:
+        processed = self.processed
+        completed = self.already_done + processed
+        elapsed = time.time() - self.start_time
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        eta = (self.total_rows - completed) / rate if rate > 0 else 0.0
+        percent = completed / self.total_rows * 100 if self.total_rows else 100.0
+        print(
+            f"[进度] {completed}/{self.total_rows} ({percent:.1f}%) 成功 {self.succeeded} 失败 {self.failed} "
+            f"速度 {rate:.2f} 行/秒 已用 {elapsed:.0f}s 预计剩余 {eta:.0f}s",
+            file=self.stream, flush=True
+        )
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m core.cli",
+        description="按已保存的任务流程对数据文件执行全量AI标注 (无需Streamlit界面)。"
+    )
+    parser.add_argument("--flow", required=True, help="已保存的任务流程名称 (task_configs.json 中的键)")
+    parser.add_argument("--data", help="数据文件路径 (csv/xlsx/parquet/jsonl)，默认使用任务流程关联的数据文件")
+    parser.add_argument("--output", help="结果文件路径，默认在数据文件旁生成 <文件名>_labeled_<时间>.<格式>")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="结果文件格式，默认由 --output 的扩展名决定，否则为 csv")
+    parser.add_argument("--engine", choices=list(LABELING_ENGINES), help="执行引擎，默认使用任务流程中的设置")
+    parser.add_argument("--workers", type=int, help="多线程引擎的并发线程数")
+    parser.add_argument("--max-in-flight", type=int, help="异步引擎的最大在途请求数")
+    parser.add_argument("--batch-size", type=int, help="每个请求标注的行数")
+    parser.add_argument("--no-dedup", action="store_true", help="不合并输入相同的行")
+    parser.add_argument("--no-cache", action="store_true", help="不使用本地响应缓存")
+    parser.add_argument("--resume", action="store_true", help="从该流程与数据的断点记录继续，跳过已成功的行")
+    parser.add_argument("--api-key", help="覆盖任务流程中的API密钥 (也可通过环境变量 OPENAI_API_KEY 提供)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="打印进度的间隔秒数 (默认5)")
+    return parser
+
+
+def _resolve_output_path(args: argparse.Namespace, data_path: str) -> Path:
+    if args.output:
+        return Path(args.output)
+    fmt = args.format or 'csv'
+    return Path(data_path).with_name(f"{Path(data_path).stem}_labeled_{time.strftime('%Y%m%d_%H%M%S')}.{fmt}")
+
+
+def _resolve_output_format(args: argparse.Namespace, output_path: Path) -> Optional[str]:
+    if args.format:
+        return args.format
+    suffix = output_path.suffix.lower().lstrip('.')
+    if not suffix:
+        return 'csv'
+    return suffix if suffix in OUTPUT_FORMATS else None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # 不逐条记录HTTP请求
+
+    task_config = load_task_config(args.flow)
+    if task_config is None:
+        logger.error(f"找不到任务流程 '{args.flow}'。")
+        return EXIT_CONFIG_ERROR
+
+    data_path = args.data or task_config.get('data_path')
+    if not data_path:
+        logger.error("任务流程未关联数据文件，请通过 --data 指定。")
+        return EXIT_CONFIG_ERROR
+    output_path = _resolve_output_path(args, data_path)
+    output_format = _resolve_output_format(args, output_path)
+    if output_format is None:
+        logger.error(f"无法从结果文件扩展名推断格式: {output_path}，请通过 --format 指定。")
+        return EXIT_CONFIG_ERROR
+
+    # 较大的 Parquet 文件以内存映射方式打开，只读取Prompt输入列，结果逐页合并写出
+    dataset = open_arrow_dataset(data_path) if should_open_as_dataset(data_path) else None
+    data = dataset if dataset is not None else load_data_from_path(data_path)
+    if data is None:
+        return EXIT_CONFIG_ERROR
+    if len(data) == 0:
+        logger.error(f"数据文件为空: {data_path}")
+        return EXIT_CONFIG_ERROR
+
+    final_prompt = (task_config.get('final_user_prompt') or '').strip()
+    ordered_keys = task_config.get('ordered_input_cols_for_prompt', [])
+    if not final_prompt or not ordered_keys:
+        logger.error("任务流程中缺少最终用户Prompt或有序输入列，请先在界面中生成并保存。")
+        return EXIT_CONFIG_ERROR
+    missing_cols = [col for col in ordered_keys if col not in data.columns]
+    if missing_cols:
+        logger.error(f"Prompt所需的列在数据中找不到: {', '.join(missing_cols)}")
+        return EXIT_CONFIG_ERROR
+    try:
+        compiled_prompt = compile_prompt_template(final_prompt, ordered_keys)
+    except (KeyError, IndexError, ValueError) as e:
+        logger.error(f"最终用户Prompt编译失败: {e}")
+        return EXIT_CONFIG_ERROR
+
+    api_config = with_output_schema(task_config.get('api_config') or {}, task_config.get('labeling_tasks', []))
+    if args.api_key:
+        api_config['api_key'] = args.api_key
+    elif not api_config.get('api_key') and os.environ.get('OPENAI_API_KEY'):
+        api_config['api_key'] = os.environ['OPENAI_API_KEY']
+    if not api_config.get('api_key'):
+        logger.error("未配置API密钥 (任务流程、--api-key 或环境变量 OPENAI_API_KEY)。")
+        return EXIT_CONFIG_ERROR
+
+    exec_config = {
+        'labeling_engine': args.engine or task_config.get('labeling_engine', ENGINE_THREAD),
+        'concurrent_workers': args.workers or task_config.get('concurrent_workers', 4),
+        'max_in_flight': args.max_in_flight or task_config.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT),
+        'retry_attempts': task_config.get('retry_attempts', 3),
+        'request_delay': task_config.get('request_delay', 0.2),
+        'batch_size': args.batch_size or task_config.get('batch_size', 1),
+    }
+
+    df = dataset.read_columns(ordered_keys) if dataset is not None else data
+    total_rows = len(df)
+    fingerprint = compute_data_fingerprint(df, ordered_keys, final_prompt, api_config.get('model_name', ''))
+    previous_results: Dict[Any, RowResult] = {}
+    if args.resume:
+        resume_path = journal_path(args.flow, fingerprint)
+        if resume_path.exists():
+            previous_results = map_journal_results_to_index(load_journal_results(resume_path), df.index)
+        else:
+            logger.warning("没有与当前数据、Prompt和模型匹配的断点记录，将从头开始标注。")
+    done_indices = [idx for idx, res_d in previous_results.items() if res_d.get('success')]
+    rows_df = df[~df.index.isin(done_indices)] if done_indices else df
+
+    duplicate_groups: Dict[Any, List[Any]] = {}
+    rows_to_run = len(rows_df)
+    if not args.no_dedup and task_config.get('dedup_rows', True):
+        rows_df, duplicate_groups = deduplicate_rows(rows_df, ordered_keys)
+    response_cache = None
+    if not args.no_cache and task_config.get('response_cache_enabled', True):
+        response_cache = get_response_cache()
+
+    logger.info(
+        f"任务流程 '{args.flow}'：共 {total_rows} 行，已完成 {len(done_indices)} 行，本次标注 {rows_to_run} 行"
+        f" ({len(rows_df)} 个唯一输入)，引擎 {LABELING_ENGINES.get(exec_config['labeling_engine'], exec_config['labeling_engine'])}。"
+    )
+    progress = ProgressPrinter(total_rows, len(done_indices), args.progress_interval)
+    journal = RunJournal.start(args.flow, fingerprint, total_rows, resume=args.resume)
+    try:
+        retry_policy = run_labeling(
+            iter_row_items(rows_df, ordered_keys),
+            compiled_prompt, api_config, exec_config,
+            on_result=progress.on_result, journal=journal,
+            response_cache=response_cache, duplicate_groups=duplicate_groups
+        )
+    except KeyboardInterrupt:
+        progress.print_line()
+        logger.warning(f"已中断。已完成的行保存在断点记录中，可加 --resume 继续: {journal.path}")
+        return EXIT_INTERRUPTED
+    finally:
+        journal.close()
+    progress.print_line()
+    if retry_policy.budget is not None and retry_policy.budget.retries_denied > 0:
+        logger.warning(f"重试预算已用尽，{retry_policy.budget.retries_denied} 次重试被跳过。")
+    run_metrics = retry_policy.metrics.summary(api_config.get('model_prices'))
+    if run_metrics['calls']:
+        cost_str = f"，估算费用 {run_metrics['cost']:.4f}" if run_metrics['cost'] is not None else ""
+        logger.info(
+            f"API用量：{run_metrics['calls']} 次请求 (重试 {run_metrics['retried_calls']})，"
+            f"输入 {run_metrics['prompt_tokens']} Token (缓存命中 {run_metrics['cached_tokens']})，输出 {run_metrics['completion_tokens']} Token；"
+            f"耗时 p50/p95/p99 {run_metrics['latency_p50']:.2f}/{run_metrics['latency_p95']:.2f}/{run_metrics['latency_p99']:.2f}s{cost_str}。"
+        )
+    parse_stats = retry_policy.parse_stats.snapshot()
+    if any(parse_stats.values()):
+        logger.info(
+            f"响应解析：直接解析 {parse_stats['clean']}，本地修复 {parse_stats['repaired']}，"
+            f"部分恢复 {parse_stats['partial']}，重新请求 {parse_stats['retried']}。"
+        )
+
+    # 本次与之前的结果都在断点记录中 (同一行以最后一次记录为准)，运行期间不在内存中保留结果
+    all_results = map_journal_results_to_index(load_journal_results(journal.path), df.index)
+    if dataset is not None:
+        saved = dataset.export_merged(output_path, output_format, all_results, task_config.get('labeling_tasks', []))
+    else:
+        result_df, _ = merge_labeling_results(df, all_results, task_config.get('labeling_tasks', []))
+        saved = save_dataframe_to_path(result_df, output_path, output_format)
+    if not saved:
+        return EXIT_CONFIG_ERROR
+
+    failed_rows = sum(1 for res_d in all_results.values() if not res_d.get('success'))
+    logger.info(f"结果已写入 {output_path} (成功 {len(all_results) - failed_rows} 行，失败 {failed_rows} 行)。")
+    return EXIT_ROWS_FAILED if failed_rows else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
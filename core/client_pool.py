@@ -0,0 +1,98 @@
+# table_labeling_tool/core/client_pool.py
+import atexit
+import threading
+from typing import Any, Dict, List, Tuple
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+# 连接池与超时的默认值 (可通过 api_config 中的同名键覆盖)
+DEFAULT_POOL_SIZE = 20        # api_config['pool_size']: 最大连接数 / keep-alive 连接数
+DEFAULT_REQUEST_TIMEOUT = 120.0  # api_config['request_timeout']: 单次请求的读写超时 (秒)
+DEFAULT_CONNECT_TIMEOUT = 10.0   # 建立连接的超时 (秒)
+
+_clients_lock = threading.Lock()
+# (api_key, base_url) -> (连接设置, OpenAI客户端)
+_shared_clients: Dict[Tuple[str, str], Tuple[Tuple[Any, ...], OpenAI]] = {}
+# 连接设置变化后被替换的客户端：可能仍有进行中的请求，保留引用，在 close_shared_clients 中关闭
+_retired_clients: List[OpenAI] = []
+
+
+def is_http2_available() -> bool:
+    """httpx 仅在安装了 h2 包时才支持 HTTP/2。"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _connection_settings(api_config: Dict[str, Any]) -> Tuple[int, float, bool]:
+    """从 api_config 中读取连接池大小、超时和是否启用HTTP/2。"""
+    pool_size = max(1, int(api_config.get('pool_size') or DEFAULT_POOL_SIZE))
+    request_timeout = float(api_config.get('request_timeout') or DEFAULT_REQUEST_TIMEOUT)
+    use_http2 = bool(api_config.get('http2', True)) and is_http2_available()
+    return pool_size, request_timeout, use_http2
+
+
+def build_httpx_client_kwargs(api_config: Dict[str, Any], min_pool_size: int = 0) -> Dict[str, Any]:
+    """构建 DefaultHttpxClient / DefaultAsyncHttpxClient 的连接池、超时与HTTP/2参数。"""
+    pool_size, request_timeout, use_http2 = _connection_settings(api_config)
+    pool_size = max(pool_size, min_pool_size)
+    return {
+        'limits': httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        'timeout': httpx.Timeout(request_timeout, connect=min(DEFAULT_CONNECT_TIMEOUT, request_timeout)),
+        'http2': use_http2,
+    }
+
+
+def get_shared_client(api_config: Dict[str, Any]) -> OpenAI:
+    """
+    获取按 (api_key, base_url) 共享的 OpenAI 客户端。
+    同一进程内的所有工作线程复用同一个 httpx 连接池，避免每行数据都重新建立连接和TLS握手。
+    连接设置 (连接池大小/超时/HTTP2) 变化时会创建新的客户端。
+    """
+    key = (api_config.get('api_key') or '', api_config.get('base_url') or '')
+    settings = _connection_settings(api_config)
+    with _clients_lock:
+        cached = _shared_clients.get(key)
+        if cached is not None and cached[0] == settings:
+            return cached[1]
+        client = OpenAI(
+            api_key=api_config.get('api_key'),
+            base_url=api_config.get('base_url'),
+            max_retries=0, # 重试统一由 core.retry_policy 控制
+            # openai 的默认 httpx 客户端 (与SDK相同的重定向等默认设置)，只覆盖连接池、超时与HTTP/2
+            http_client=DefaultHttpxClient(**build_httpx_client_kwargs(api_config))
+        )
+        if cached is not None: # 旧客户端可能仍被进行中的请求使用，此时不关闭
+            _retired_clients.append(cached[1])
+        _shared_clients[key] = (settings, client)
+        return client
+
+
+def create_async_client(api_config: Dict[str, Any], min_pool_size: int = 0) -> AsyncOpenAI:
+    """
+    创建一个 AsyncOpenAI 客户端。
+    异步连接池绑定在创建它的事件循环上，因此不做进程级共享：每次异步运行创建一个，运行结束后关闭。
+    """
+    return AsyncOpenAI(
+        api_key=api_config.get('api_key'),
+        base_url=api_config.get('base_url'),
+        max_retries=0, # 重试统一由 core.retry_policy 控制
+        http_client=DefaultAsyncHttpxClient(**build_httpx_client_kwargs(api_config, min_pool_size))
+    )
+
+
+def close_shared_clients() -> None:
+    """关闭并清空所有共享客户端及已被替换的旧客户端 (进程退出时自动调用)。"""
+    with _clients_lock:
+        for client in [client for _, client in _shared_clients.values()] + _retired_clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        _shared_clients.clear()
+        _retired_clients.clear()
+
+
+atexit.register(close_shared_clients)
@@ -2,8 +2,8 @@
 import json
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional
-import streamlit as st # 用于 st.session_state 和 st.error
+from typing import Dict, Any, Mapping, Optional
+from core.notifier import notify_error
 
 # Configuration directory and file paths
 CONFIG_DIR = Path(".streamlit_labeling_configs")
@@ -20,10 +20,10 @@ def load_api_configs() -> Dict[str, Any]:
             with open(API_CONFIG_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except json.JSONDecodeError:
-            st.error(f"解析API配置文件失败: {API_CONFIG_FILE}。将返回空配置。")
+            notify_error(f"解析API配置文件失败: {API_CONFIG_FILE}。将返回空配置。")
             return {}
         except Exception as e:
-            st.error(f"加载API配置时发生未知错误: {e}。将返回空配置。")
+            notify_error(f"加载API配置时发生未知错误: {e}。将返回空配置。")
             return {}
     return {}
 
@@ -33,7 +33,7 @@ def save_api_configs(configs: Dict[str, Any]):
         with open(API_CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(configs, f, indent=2, ensure_ascii=False)
     except Exception as e:
-        st.error(f"保存API配置失败: {e}")
+        notify_error(f"保存API配置失败: {e}")
 
 def load_task_configs() -> Dict[str, Any]:
     """加载任务配置"""
@@ -42,10 +42,10 @@ def load_task_configs() -> Dict[str, Any]:
             with open(TASK_CONFIG_FILE, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except json.JSONDecodeError:
-            st.error(f"解析任务配置文件失败: {TASK_CONFIG_FILE}。将返回空配置。")
+            notify_error(f"解析任务配置文件失败: {TASK_CONFIG_FILE}。将返回空配置。")
             return {}
         except Exception as e:
-            st.error(f"加载任务配置时发生未知错误: {e}。将返回空配置。")
+            notify_error(f"加载任务配置时发生未知错误: {e}。将返回空配置。")
             return {}
     return {}
 
@@ -55,22 +55,31 @@ def save_task_configs(configs: Dict[str, Any]):
         with open(TASK_CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(configs, f, indent=2, ensure_ascii=False)
     except Exception as e:
-        st.error(f"保存任务配置失败: {e}")
+        notify_error(f"保存任务配置失败: {e}")
 
-def save_current_task_config(name: str, data_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+def save_current_task_config(
+    name: str,
+    state: Mapping[str, Any],
+    data_path: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
     """
-    保存当前任务配置 (从 st.session_state 获取数据)。
+    保存当前任务配置。state 为提供配置的映射 (界面中传入 st.session_state)。
     """
     task_configs = load_task_configs()
 
-    api_config = st.session_state.get('api_config', {})
-    labeling_tasks = st.session_state.get('labeling_tasks', [])
-    generated_prompt_template = st.session_state.get('generated_prompt_template', "")
-    final_user_prompt = st.session_state.get('final_user_prompt', "")
-    concurrent_workers = st.session_state.get('concurrent_workers', 4)
-    retry_attempts = st.session_state.get('retry_attempts', 3)
-    request_delay = st.session_state.get('request_delay', 0.2)
-    ordered_input_cols = st.session_state.get('ordered_input_cols_for_prompt', [])
+    api_config = state.get('api_config', {})
+    labeling_tasks = state.get('labeling_tasks', [])
+    generated_prompt_template = state.get('generated_prompt_template', "")
+    final_user_prompt = state.get('final_user_prompt', "")
+    concurrent_workers = state.get('concurrent_workers', 4)
+    retry_attempts = state.get('retry_attempts', 3)
+    request_delay = state.get('request_delay', 0.2)
+    labeling_engine = state.get('labeling_engine', 'thread')
+    max_in_flight = state.get('max_in_flight', 100)
+    batch_size = state.get('batch_size', 1)
+    dedup_rows = state.get('dedup_rows', True)
+    response_cache_enabled = state.get('response_cache_enabled', True)
+    ordered_input_cols = state.get('ordered_input_cols_for_prompt', [])
 
     config = {
         'name': name,
@@ -83,6 +92,11 @@ def save_current_task_config(name: str, data_path: Optional[str] = None) -> Opti
         'concurrent_workers': concurrent_workers,
         'retry_attempts': retry_attempts,
         'request_delay': request_delay,
+        'labeling_engine': labeling_engine,
+        'max_in_flight': max_in_flight,
+        'batch_size': batch_size,
+        'dedup_rows': dedup_rows,
+        'response_cache_enabled': response_cache_enabled,
         'ordered_input_cols_for_prompt': ordered_input_cols 
     }
 
@@ -1,10 +1,10 @@
 # table_labeling_tool/core/data_handler.py
+import codecs
 import pandas as pd
-import json
 import io
 from pathlib import Path
-from typing import Optional
-import streamlit as st
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional, Union
+from core.notifier import notify_error, notify_info, notify_warning
 import uuid # For generating unique filenames
 
 # --- 新增：定义上传数据持久化的目录 ---
@@ -12,97 +12,231 @@ import uuid # For generating unique filenames
 PERSISTED_DATA_DIR = Path(".streamlit_labeling_configs") / "persisted_user_data"
 PERSISTED_DATA_DIR.mkdir(parents=True, exist_ok=True) # 启动时确保目录存在
 
-@st.cache_data
+CSV_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'latin1'] # 按顺序尝试，latin1 可解码任意字节
+ENCODING_SNIFF_BYTES = 1024 * 1024 # 只用文件开头这么多字节判断编码
+JSONL_CHUNK_ROWS = 100000
+
+def detect_text_encoding(sample: bytes, is_complete: bool = False) -> str:
+    """
+    返回 CSV_ENCODINGS 中第一个能解码样本的编码。
+    is_complete 为 False 时样本是文件开头的一段，末尾被截断的多字节字符不算解码失败。
+    """
+    for encoding in CSV_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=is_complete)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return CSV_ENCODINGS[-1]
+
+def _read_csv_arrow(open_source: Callable[[], Any], encoding: str) -> pd.DataFrame:
+    """
+    用 pyarrow 多线程解析整个CSV (只解析一次)。
+    日期/时间列保持为文本，空字符串视为缺失值，与 pandas 默认引擎的结果一致。
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    read_options = pacsv.ReadOptions(encoding=encoding)
+    parse_options = pacsv.ParseOptions(newlines_in_values=True)
+    # 列类型按第一个数据块推断，先取出推断结果，把日期/时间列改为按文本读取
+    with pacsv.open_csv(open_source(), read_options=read_options, parse_options=parse_options) as reader:
+        first_block_schema = reader.schema
+    column_names = first_block_schema.names
+    if '' in column_names or len(set(column_names)) != len(column_names):
+        # 空列名 / 重复列名交给 pandas 按其规则命名 (Unnamed: 0、a.1 等)
+        raise ValueError("CSV 表头中有空列名或重复列名")
+    convert_options = pacsv.ConvertOptions(
+        column_types={field.name: pa.string() for field in first_block_schema if pa.types.is_temporal(field.type)},
+        strings_can_be_null=True
+    )
+    table = pacsv.read_csv(
+        open_source(), read_options=read_options, parse_options=parse_options, convert_options=convert_options
+    )
+    if any(pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type) for field in table.schema):
+        # 样本之后出现了该编码无法解码的字节，pyarrow 会把这列读成二进制而不报错
+        raise ValueError(f"CSV 中有无法按 {encoding} 解码的内容")
+    return table.to_pandas(split_blocks=True, self_destruct=True) # 边转换边释放 Arrow 内存
+
+def _read_csv(open_source: Callable[[], Any], sample: bytes, is_complete: bool) -> pd.DataFrame:
+    """
+    按样本判断编码后只解析一次。pyarrow 无法处理时 (后续数据块类型与推断不符、行字段数不一致、
+    编码判断有误等) 退回 pandas 默认引擎，并依次尝试其余编码。
+    open_source 每次调用返回一个新的数据源 (路径或从头读取的文件对象)。
+    """
+    encoding = detect_text_encoding(sample, is_complete)
+    try:
+        return _read_csv_arrow(open_source, encoding)
+    except Exception:
+        pass
+    for fallback_encoding in [encoding] + [enc for enc in CSV_ENCODINGS if enc != encoding]:
+        try:
+            return pd.read_csv(open_source(), encoding=fallback_encoding)
+        except UnicodeDecodeError:
+            continue
+    return pd.read_csv(open_source())
+
+def _read_jsonl(source: Any) -> pd.DataFrame:
+    """按块读取JSONL (每块 JSONL_CHUNK_ROWS 行)，不把整个文件的行列表和字典列表同时留在内存中。"""
+    with pd.read_json(
+        source, lines=True, chunksize=JSONL_CHUNK_ROWS, dtype=False, convert_dates=False, encoding='utf-8'
+    ) as reader:
+        frames = list(reader)
+    if not frames:
+        return pd.DataFrame()
+    # 与逐行 json.loads 后构建 DataFrame 一致：只做 JSON 本身的类型，不把字符串猜成数字或日期
+    return pd.concat(frames, ignore_index=True).infer_objects()
+
 def load_data_from_uploaded_file(file_content: bytes, file_name: str) -> Optional[pd.DataFrame]:
-    # ... (此函数不变) ...
     try:
         file_ext = file_name.split('.')[-1].lower()
         df = None
         if file_ext == 'csv':
-            for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']: 
-                try:
-                    df = pd.read_csv(io.StringIO(file_content.decode(encoding)))
-                    break
-                except UnicodeDecodeError:
-                    continue
-            if df is None: 
-                df = pd.read_csv(io.BytesIO(file_content))
+            df = _read_csv(
+                lambda: io.BytesIO(file_content), file_content[:ENCODING_SNIFF_BYTES],
+                len(file_content) <= ENCODING_SNIFF_BYTES
+            )
         elif file_ext in ['xlsx', 'xls']:
             df = pd.read_excel(io.BytesIO(file_content))
         elif file_ext == 'parquet':
             df = pd.read_parquet(io.BytesIO(file_content))
         elif file_ext == 'jsonl':
-            lines = file_content.decode('utf-8').strip().split('\n')
-            data = [json.loads(line) for line in lines if line.strip()]
-            df = pd.DataFrame(data)
+            df = _read_jsonl(io.BytesIO(file_content))
         else:
-            st.error(f"不支持的文件格式: {file_ext}")
+            notify_error(f"不支持的文件格式: {file_ext}")
             return None
         return df
     except Exception as e:
-        st.error(f"加载数据文件 '{file_name}' 失败: {str(e)}")
+        notify_error(f"加载数据文件 '{file_name}' 失败: {str(e)}")
         return None
 
-@st.cache_data
 def load_data_from_path(file_path: str) -> Optional[pd.DataFrame]:
-    # ... (此函数不变) ...
     try:
         path = Path(file_path)
         if not path.exists():
-            st.error(f"文件路径不存在: {file_path}")
+            notify_error(f"文件路径不存在: {file_path}")
             return None
 
         file_ext = path.suffix.lower().lstrip('.')
         df = None
         if file_ext == 'csv':
-            for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                try:
-                    df = pd.read_csv(path, encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            if df is None: 
-                 df = pd.read_csv(path)
+            with open(path, 'rb') as f:
+                sample = f.read(ENCODING_SNIFF_BYTES)
+            df = _read_csv(lambda: str(path), sample, len(sample) < ENCODING_SNIFF_BYTES)
         elif file_ext in ['xlsx', 'xls']:
             df = pd.read_excel(path)
         elif file_ext == 'parquet':
             df = pd.read_parquet(path)
         elif file_ext == 'jsonl':
-            with open(path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            data = [json.loads(line.strip()) for line in lines if line.strip()]
-            df = pd.DataFrame(data)
+            df = _read_jsonl(path)
         else:
-            st.error(f"不支持的文件格式: {file_ext} (路径: {file_path})")
+            notify_error(f"不支持的文件格式: {file_ext} (路径: {file_path})")
             return None
         return df
     except Exception as e:
-        st.error(f"从路径 '{file_path}' 加载数据失败: {str(e)}")
+        notify_error(f"从路径 '{file_path}' 加载数据失败: {str(e)}")
         return None
 
+EXPORT_CHUNK_ROWS = 50000  # 导出时每次序列化的行数 (Parquet 中即每个 row group 的行数)
+
+def _iter_export_chunks(df: pd.DataFrame, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """按行切块；空表也产生一次，以便写出表头 / schema。"""
+    chunk_rows = max(1, int(chunk_rows))
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def write_dataframe_chunks(
+    chunks: Iterable[pd.DataFrame], target: BinaryIO, format_type: str, arrow_schema: Optional[Any] = None
+) -> None:
+    """
+    把依次产生的数据块写入二进制文件对象 (磁盘文件或 BytesIO)，峰值内存约为一个块的序列化结果。
+    csv 带 BOM (utf-8-sig，便于 Excel 打开)，jsonl 每行一条记录，parquet 每块一个 row group。
+    parquet 的 schema 取 arrow_schema，未提供时按第一块推断。格式不支持时抛出 ValueError。
+    """
+    if format_type in ('csv', 'jsonl'):
+        text_target = io.TextIOWrapper(target, encoding='utf-8-sig' if format_type == 'csv' else 'utf-8', newline='')
+        try:
+            for chunk_i, chunk in enumerate(chunks):
+                if format_type == 'csv':
+                    chunk.to_csv(text_target, index=False, header=(chunk_i == 0))
+                elif not chunk.empty:
+                    text_target.write(chunk.to_json(orient='records', lines=True, force_ascii=False).rstrip('\n') + '\n')
+            text_target.flush()
+        finally:
+            text_target.detach() # 不关闭调用方的文件对象
+    elif format_type == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    arrow_schema = arrow_schema or pa.Schema.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(target, arrow_schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=arrow_schema, preserve_index=False))
+        finally:
+            if writer is not None:
+                writer.close()
+    elif format_type == 'xlsx':
+        # openpyxl 在内存中保存整个工作簿，分块只避免一次性生成整表的单元格对象
+        with pd.ExcelWriter(target, engine='openpyxl') as writer: # type: ignore
+            start_row = 0
+            for chunk in chunks:
+                chunk.to_excel(writer, index=False, header=(start_row == 0), startrow=start_row + (1 if start_row else 0))
+                start_row += len(chunk)
+    else:
+        raise ValueError(f"不支持的保存格式: {format_type}")
+
+def write_dataframe(df: pd.DataFrame, target: BinaryIO, format_type: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> None:
+    """按块写出 DataFrame (见 write_dataframe_chunks)。parquet 的 schema 按整表推断，避免某一块中全为空值的列被推断成其他类型。"""
+    arrow_schema = None
+    if format_type == 'parquet':
+        import pyarrow as pa
+        arrow_schema = pa.Schema.from_pandas(df, preserve_index=False)
+    write_dataframe_chunks(_iter_export_chunks(df, chunk_rows), target, format_type, arrow_schema)
+
 def save_dataframe_to_bytes(df: pd.DataFrame, format_type: str) -> bytes:
-    # ... (此函数不变) ...
+    """序列化为内存中的字节串 (用于下载按钮)。大文件请用 save_dataframe_to_path 直接写入磁盘。"""
     output = io.BytesIO()
     try:
-        if format_type == 'csv':
-            csv_string = df.to_csv(index=False, encoding='utf-8-sig')
-            output.write(csv_string.encode('utf-8-sig'))
-        elif format_type == 'xlsx':
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False)
-        elif format_type == 'parquet':
-            df.to_parquet(output, index=False)
-        elif format_type == 'jsonl':
-            jsonl_string = '\n'.join([row.to_json(force_ascii=False) for _, row in df.iterrows()])
-            output.write(jsonl_string.encode('utf-8'))
-        else:
-            st.error(f"不支持的保存格式: {format_type}")
-            return b""
+        write_dataframe(df, output, format_type)
         return output.getvalue()
     except Exception as e:
-        st.error(f"保存DataFrame到 {format_type} 格式时出错: {str(e)}")
+        notify_error(f"保存DataFrame到 {format_type} 格式时出错: {str(e)}")
         return b""
 
+def _write_to_path(file_path: Union[str, Path], format_type: str, write: Callable[[BinaryIO], None]) -> bool:
+    """先写入同目录下的临时文件再替换，失败时不会留下不完整的结果文件。返回是否成功。"""
+    path = Path(file_path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        tmp_path.replace(path)
+        return True
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        notify_error(f"保存DataFrame到 '{path}' ({format_type}) 时出错: {str(e)}")
+        return False
+
+def save_dataframe_to_path(df: pd.DataFrame, file_path: Union[str, Path], format_type: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> bool:
+    """按块把 DataFrame 直接写入服务器上的文件，不在内存中生成完整文件内容。返回是否成功。"""
+    return _write_to_path(file_path, format_type, lambda f: write_dataframe(df, f, format_type, chunk_rows))
+
+def save_chunks_to_path(
+    chunks: Iterable[pd.DataFrame], file_path: Union[str, Path], format_type: str, arrow_schema: Optional[Any] = None
+) -> bool:
+    """把依次产生的数据块写入服务器上的文件 (如逐页读取的大数据集)。返回是否成功。"""
+    return _write_to_path(file_path, format_type, lambda f: write_dataframe_chunks(chunks, f, format_type, arrow_schema))
+
+def _parquet_compatible(df: pd.DataFrame) -> bool:
+    import pyarrow as pa
+    try:
+        pa.Schema.from_pandas(df, preserve_index=False)
+        return True
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+
 # --- 新增函数：持久化DataFrame到服务器 ---
 def persist_dataframe_on_server(df: pd.DataFrame, original_filename: str) -> Optional[str]:
     """
@@ -110,11 +244,11 @@ def persist_dataframe_on_server(df: pd.DataFrame, original_filename: str) -> Opt
     返回保存文件的绝对路径，如果失败则返回None。
     """
     if df is None:
-        st.error("无法持久化空的DataFrame。")
+        notify_error("无法持久化空的DataFrame。")
         return None
     if not original_filename: # 需要原始文件名来确定扩展名和基本名
         original_filename = f"persisted_data_{uuid.uuid4().hex[:8]}.parquet" # 默认文件名
-        st.warning(f"未提供原始文件名，将使用默认名称: {original_filename}")
+        notify_warning(f"未提供原始文件名，将使用默认名称: {original_filename}")
 
 
     try:
@@ -123,12 +257,11 @@ def persist_dataframe_on_server(df: pd.DataFrame, original_filename: str) -> Opt
         base_name = p_original_filename.stem
         original_ext = p_original_filename.suffix.lower()
 
-        # 确定保存格式，优先使用Parquet以保证数据类型和效率
-        # 如果原始扩展名是已知的表格格式，可以考虑保留，否则用Parquet
-        if original_ext in ['.csv', '.xlsx', '.parquet']:
-            save_ext = original_ext
-        else:
-            save_ext = '.parquet' # 默认保存为Parquet
+        # 确定保存格式：优先使用Parquet (保留数据类型，且大文件可按内存映射方式打开，见 core.arrow_dataset)
+        # 数据无法转换为Parquet时 (如同一列混有数字和文本) 保留原始格式
+        save_ext = '.parquet'
+        if not _parquet_compatible(df):
+            save_ext = original_ext if original_ext in ['.csv', '.xlsx'] else '.csv'
 
         # 创建一个唯一的文件名以避免冲突
         unique_id = uuid.uuid4().hex[:8]
@@ -136,17 +269,12 @@ def persist_dataframe_on_server(df: pd.DataFrame, original_filename: str) -> Opt
         save_path = PERSISTED_DATA_DIR / new_filename
 
         # 根据确定的扩展名保存文件
-        if save_ext == '.parquet':
-            df.to_parquet(save_path, index=False)
-        elif save_ext == '.csv':
-            df.to_csv(save_path, index=False, encoding='utf-8-sig')
-        elif save_ext == '.xlsx':
-            with pd.ExcelWriter(save_path, engine='openpyxl') as writer: # type: ignore
-                df.to_excel(writer, index=False)
-        
-        st.info(f"数据副本已保存到服务器路径: {save_path.resolve()}")
+        if not save_dataframe_to_path(df, save_path, save_ext.lstrip('.')):
+            return None
+
+        notify_info(f"数据副本已保存到服务器路径: {save_path.resolve()}")
         return str(save_path.resolve()) # 返回新保存文件的绝对路径
 
     except Exception as e:
-        st.error(f"持久化数据 '{original_filename}' 到服务器时失败: {e}")
+        notify_error(f"持久化数据 '{original_filename}' 到服务器时失败: {e}")
         return None
\ No newline at end of file
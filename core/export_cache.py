@@ -0,0 +1,90 @@
+# table_labeling_tool/core/export_cache.py
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Optional, Union
+
+import pandas as pd
+
+from core.config_manager import CONFIG_DIR
+from core.data_handler import save_dataframe_to_path
+
+# 导出文件先按块写入此目录；不超过 EXPORT_SPILL_BYTES 的再读入内存，更大的只保留在磁盘上
+EXPORT_DIR = CONFIG_DIR / "exports"
+EXPORT_SPILL_BYTES = 64 * 1024 * 1024
+STALE_EXPORT_SECONDS = 24 * 3600  # 超过此时长的导出文件 (例如已结束的会话留下的) 在新建缓存时清理
+
+
+class ExportCache:
+    """
+    按需生成的导出文件缓存 (每个浏览器会话一个)。
+    每个导出名称 (如 "edited_data"、"labeled_output") 按格式保留最近一次生成的文件，
+    并记录生成时的版本键；版本键变化 (数据或结果被修改) 后旧文件作废并删除。
+    """
+
+    def __init__(self, export_dir: Path = EXPORT_DIR, spill_bytes: int = EXPORT_SPILL_BYTES):
+        self.export_dir = Path(export_dir)
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        self.spill_bytes = spill_bytes
+        self._entries: Dict[str, Dict[str, Dict[str, Any]]] = {}  # 名称 -> 格式 -> 导出信息
+        self._remove_stale_files()
+
+    def get(self, name: str, version_key: Hashable, format_type: str) -> Optional[Dict[str, Any]]:
+        """
+        已生成且仍有效的导出：{'path', 'size', 'data'}，data 为文件内容 (超过 spill_bytes 时为 None，
+        需从 path 读取)。未生成或版本键已变化时返回 None。
+        """
+        self._drop_stale(name, version_key)
+        return self._entries.get(name, {}).get(format_type)
+
+    def build(
+        self,
+        name: str,
+        version_key: Hashable,
+        data: Union[pd.DataFrame, Callable[[Path, str], bool]],
+        format_type: str
+    ) -> Optional[Dict[str, Any]]:
+        """
+        生成导出文件并缓存，失败时返回 None (错误已通过 notifier 提示)。
+        data 为 DataFrame，或 write(路径, 格式) -> bool 的写出函数 (如 ArrowDataset.export)。
+        """
+        self._drop_stale(name, version_key)
+        path = self.export_dir / f"{name}_{uuid.uuid4().hex[:12]}.{format_type}"
+        written = save_dataframe_to_path(data, path, format_type) if isinstance(data, pd.DataFrame) else data(path, format_type)
+        if not written:
+            return None
+        size = path.stat().st_size
+        export = {
+            'key': version_key,
+            'path': path,
+            'size': size,
+            'data': path.read_bytes() if size <= self.spill_bytes else None,
+        }
+        self._remove(self._entries.setdefault(name, {}).get(format_type))
+        self._entries[name][format_type] = export
+        return export
+
+    def clear(self) -> None:
+        for exports in self._entries.values():
+            for export in exports.values():
+                self._remove(export)
+        self._entries.clear()
+
+    def _drop_stale(self, name: str, version_key: Hashable) -> None:
+        exports = self._entries.get(name, {})
+        for format_type in [fmt for fmt, export in exports.items() if export['key'] != version_key]:
+            self._remove(exports.pop(format_type))
+
+    @staticmethod
+    def _remove(export: Optional[Dict[str, Any]]) -> None:
+        if export is not None:
+            Path(export['path']).unlink(missing_ok=True)
+
+    def _remove_stale_files(self) -> None:
+        cutoff = time.time() - STALE_EXPORT_SECONDS
+        for path in self.export_dir.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
@@ -0,0 +1,267 @@
+# table_labeling_tool/core/job_manager.py
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.labeling_runner import run_labeling
+from core.prompt_template import CompiledPromptTemplate
+from core.response_cache import ResponseCache
+from core.result_merge import merge_task_results
+from core.results import RowResult
+from core.retry_policy import RetryPolicy
+from core.run_control import RunCancelled, RunControl
+from core.run_journal import RunJournal
+
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CANCELLING = "cancelling"
+JOB_COMPLETED = "completed"
+JOB_CANCELLED = "cancelled"
+JOB_FAILED = "failed"
+JOB_STATUS_LABELS = {
+    JOB_RUNNING: "运行中",
+    JOB_PAUSED: "已暂停",
+    JOB_CANCELLING: "正在取消",
+    JOB_COMPLETED: "已完成",
+    JOB_CANCELLED: "已取消",
+    JOB_FAILED: "出错",
+}
+MAX_FINISHED_JOBS = 20  # 注册表中保留的已结束任务数
+
+
+def compact_result(result_data: RowResult) -> RowResult:
+    """
+    内存中保留的结果：完整Prompt与成功行的原始响应已写入断点记录，不再随结果常驻内存
+    (百万行时二者占结果内存的绝大部分)。
+    """
+    return {
+        'success': result_data.get('success', False),
+        'result': result_data.get('result'),
+        'error': result_data.get('error'),
+        'prompt_sent': None,
+        'raw_response': None if result_data.get('success') else result_data.get('raw_response'),
+    }
+
+
+class LabelingJob:
+    """
+    在后台线程中执行的一次全量标注。结果与进度保存在对象内，
+    界面脚本重跑、切换标签页或刷新浏览器都不影响运行，界面只需定时读取 snapshot()。
+    """
+
+    def __init__(
+        self,
+        flow_name: Optional[str],
+        total_rows: int,
+        previous_results: Optional[Dict[Any, RowResult]] = None,
+        already_done: Optional[int] = None,
+        merge_columns: Optional[Sequence[str]] = None,
+        all_output_columns: Optional[Sequence[str]] = None
+    ):
+        self.job_id = f"job_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.flow_name = flow_name
+        self.total_rows = total_rows
+        self.control = RunControl()
+        self.retry_policy: Optional[RetryPolicy] = None
+        self.error: Optional[str] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self._lock = threading.Lock()
+        self._results: Dict[Any, RowResult] = {idx: compact_result(res_d) for idx, res_d in (previous_results or {}).items()}
+        if already_done is None:
+            already_done = sum(1 for res_d in self._results.values() if res_d.get('success'))
+        self._already_done = already_done
+        # 只重新标注部分输出列时，新结果合并进已有结果 (见 merge_task_results)，合并后的结果写入断点记录
+        self.merge_columns = list(merge_columns) if merge_columns else None
+        self.all_output_columns = list(all_output_columns) if all_output_columns else None
+        self._journal: Optional[RunJournal] = None
+        self._processed = 0
+        self._succeeded = 0
+        self._failed = 0
+        self._final_status: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def record_result(self, row_idx: Any, result_data: RowResult) -> None:
+        with self._lock:
+            if self.merge_columns is not None:
+                result_data = merge_task_results(
+                    self._results.get(row_idx), result_data, self.merge_columns, self.all_output_columns
+                )
+                if self._journal is not None:
+                    self._journal.record(row_idx, result_data)
+            self._results[row_idx] = compact_result(result_data)
+            self._processed += 1
+            if result_data.get('success'):
+                self._succeeded += 1
+            else:
+                self._failed += 1
+
+    @property
+    def status(self) -> str:
+        if self._final_status is not None:
+            return self._final_status
+        if self.control.cancelled:
+            return JOB_CANCELLING
+        return JOB_PAUSED if self.control.paused else JOB_RUNNING
+
+    @property
+    def is_active(self) -> bool:
+        return self._final_status is None
+
+    def pause(self) -> None:
+        self.control.pause()
+
+    def resume(self) -> None:
+        self.control.resume()
+
+    def cancel(self) -> None:
+        self.control.cancel()
+
+    def results(self) -> Dict[Any, RowResult]:
+        """所有结果 (含断点续跑前已有的结果) 的副本。"""
+        with self._lock:
+            return dict(self._results)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前进度：完成行数、本次成功/失败数、有效速度 (不含暂停时间) 与预计剩余时间。"""
+        with self._lock:
+            processed, succeeded, failed = self._processed, self._succeeded, self._failed
+        completed = self._already_done + processed
+        elapsed = (self.end_time or time.time()) - self.start_time
+        active_seconds = max(0.0, elapsed - self.control.paused_seconds())
+        rate = processed / active_seconds if active_seconds > 0 else 0.0
+        remaining = max(0, self.total_rows - completed)
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'completed': completed,
+            'total': self.total_rows,
+            'succeeded': succeeded,
+            'failed': failed,
+            'elapsed': elapsed,
+            'rows_per_second': rate,
+            'eta_seconds': remaining / rate if rate > 0 else None,
+        }
+
+    def _run(
+        self,
+        row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+        compiled_template: CompiledPromptTemplate,
+        api_config: Dict[str, Any],
+        exec_config: Dict[str, Any],
+        journal: Optional[RunJournal],
+        response_cache: Optional[ResponseCache],
+        duplicate_groups: Optional[Dict[Any, List[Any]]]
+    ) -> None:
+        if response_cache is not None: # 命中数只统计本任务的查询
+            response_cache = response_cache.scoped()
+        final_status = JOB_COMPLETED
+        if self.merge_columns is not None: # 断点记录保存合并后的整行结果，由 record_result 写入
+            self._journal, journal_for_rows = journal, None
+        else:
+            journal_for_rows = journal
+        # 先创建重试策略再启动引擎：任务被取消或出错时调用指标与重试统计仍可读取
+        self.retry_policy = RetryPolicy.for_run(exec_config, self.control)
+        try:
+            run_labeling(
+                row_items, compiled_template, api_config, exec_config,
+                on_result=self.record_result, journal=journal_for_rows,
+                response_cache=response_cache, duplicate_groups=duplicate_groups,
+                control=self.control, retry_policy=self.retry_policy
+            )
+            if self.control.cancelled:
+                final_status = JOB_CANCELLED
+        except RunCancelled:
+            final_status = JOB_CANCELLED
+        except Exception as e:
+            self.error = str(e)
+            final_status = JOB_FAILED
+        finally:
+            if journal is not None:
+                journal.close()
+            if response_cache is not None:
+                self.cache_hits, self.cache_misses = response_cache.counters()
+            self.end_time = time.time()
+            self._final_status = final_status
+
+
+class JobManager:
+    """进程内的标注任务注册表 (不放在 session_state 中，浏览器会话结束后任务仍继续运行)。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, LabelingJob] = {}
+
+    def start_job(
+        self,
+        row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+        compiled_template: CompiledPromptTemplate,
+        api_config: Dict[str, Any],
+        exec_config: Dict[str, Any],
+        total_rows: int,
+        flow_name: Optional[str] = None,
+        previous_results: Optional[Dict[Any, RowResult]] = None,
+        journal: Optional[RunJournal] = None,
+        response_cache: Optional[ResponseCache] = None,
+        duplicate_groups: Optional[Dict[Any, List[Any]]] = None,
+        already_done: Optional[int] = None,
+        merge_columns: Optional[Sequence[str]] = None,
+        all_output_columns: Optional[Sequence[str]] = None
+    ) -> LabelingJob:
+        """
+        创建任务并在后台线程中执行 run_labeling (参数含义相同)。journal 由任务在结束时关闭。
+        定向重新标注时 already_done 为不重新标注的已完成行数 (默认按 previous_results 中成功的行计算)；
+        merge_columns 为只重新标注的输出列，新结果按列合并进 previous_results；all_output_columns 为所有打标任务的输出列
+        (此前未成功的行只重新标注了部分列时仍记为失败，见 merge_task_results)。
+        """
+        job = LabelingJob(flow_name, total_rows, previous_results, already_done, merge_columns, all_output_columns)
+        job._thread = threading.Thread(
+            target=job._run,
+            args=(row_items, compiled_template, api_config, exec_config, journal, response_cache, duplicate_groups),
+            name=f"labeling-{job.job_id}", daemon=True
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune_finished()
+        job._thread.start()
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[LabelingJob]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def jobs(self) -> List[LabelingJob]:
+        """所有任务，最新的在前。"""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.start_time, reverse=True)
+
+    def active_job(self, flow_name: Optional[str]) -> Optional[LabelingJob]:
+        """该任务流程正在运行 (或暂停) 的任务。"""
+        for job in self.jobs():
+            if job.is_active and job.flow_name == flow_name:
+                return job
+        return None
+
+    def _prune_finished(self) -> None:
+        finished = sorted(
+            (job for job in self._jobs.values() if not job.is_active),
+            key=lambda job: job.start_time, reverse=True
+        )
+        for job in finished[MAX_FINISHED_JOBS:]:
+            del self._jobs[job.job_id]
+
+
+_job_manager: Optional[JobManager] = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """进程内共享的任务注册表。"""
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager()
+        return _job_manager
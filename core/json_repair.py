@@ -0,0 +1,230 @@
+# table_labeling_tool/core/json_repair.py
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 模型响应的容错解析：常见的格式问题 (夹在说明文字中、多余的逗号、达到 max_tokens 被截断) 在本地修复，
+# 只有确实无法解析的响应才重新请求API
+PARSE_CLEAN = "clean"        # 直接解析成功 (含去除 markdown 代码块标记)
+PARSE_REPAIRED = "repaired"  # 提取 / 修复后解析成功，内容完整
+PARSE_PARTIAL = "partial"    # 响应被截断，只保留了已完整输出的部分
+PARSE_RETRIED = "retried"    # 无法解析，重新请求
+
+_CLOSERS = {'{': '}', '[': ']'}
+MAX_START_CANDIDATES = 32  # 最多尝试的起始括号数，避免在大段说明文字上反复扫描
+
+
+def _strip_code_fence(text: str) -> str:
+    if text.startswith("```json"):
+        text = text[7:]
+    elif text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    """去掉输出末尾 (忽略空白) 的逗号，用于 `,}` / `,]` 以及截断点前的逗号。"""
+    pos = len(out) - 1
+    while pos >= 0 and out[pos].isspace():
+        pos -= 1
+    if pos >= 0 and out[pos] == ',':
+        del out[pos:]
+
+
+def _close(out: List[str], stack: List[Tuple[str, int]]) -> str:
+    """补全 stack 中所有未闭合的括号。"""
+    out = list(out)
+    _strip_trailing_comma(out)
+    return ''.join(out) + ''.join(_CLOSERS[opener] for opener, _ in reversed(stack))
+
+
+def _record_depth(stack: List[Tuple[str, int]]) -> int:
+    """
+    截断时按"记录"为单位保留：顶层是数组时为数组的元素 (多行批量结果)，
+    顶层对象中直接包含数组时为该数组的元素 (如 {"results": [...]})，否则为顶层对象的字段 (各打标任务)。
+    """
+    if stack[0][0] == '[':
+        return 1
+    if len(stack) > 1 and stack[1][0] == '[':
+        return 2
+    return 1
+
+
+def _scan_json_block(text: str, start: int) -> Tuple[str, Optional[List[Tuple[str, int]]], List[Tuple[int, Tuple[Tuple[str, int], ...]]]]:
+    """
+    从 text[start] (一个 { 或 [) 开始按括号配对扫描 (跳过字符串内部)，同时去掉 `}` / `]` 前多余的逗号。
+    返回 (扫描得到的文本, 截断时仍未闭合的括号栈 (完整时为 None), 可截断的位置列表)。
+    可截断的位置为记录之间的逗号或记录结束处，附带当时的括号栈。
+    """
+    out: List[str] = []
+    stack: List[Tuple[str, int]] = []  # (开括号, 编号)，编号用于区分同一深度的不同容器
+    cut_points: List[Tuple[int, Tuple[Tuple[str, int], ...]]] = []
+    in_string = escaped = False
+    container_no = 0
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            container_no += 1
+            stack.append((ch, container_no))
+        elif ch in '}]':
+            if not stack or _CLOSERS[stack[-1][0]] != ch:  # 括号不匹配：到此为止，按截断处理
+                break
+            _strip_trailing_comma(out)
+            stack.pop()
+            out.append(ch)
+            if not stack:
+                return ''.join(out), None, cut_points
+            cut_points.append((len(out), tuple(stack)))
+            continue
+        elif ch == ',':
+            cut_points.append((len(out), tuple(stack)))
+        out.append(ch)
+    return ''.join(out), stack, cut_points
+
+
+def _loads(text: str) -> Any:
+    # strict=False：允许字符串中出现未转义的换行等控制字符 (模型写理由时常见)
+    return json.loads(text, strict=False)
+
+
+def _salvage_truncated(out: str, stack: List[Tuple[str, int]], cut_points) -> Tuple[Optional[Any], str]:
+    """修复被截断的JSON：末尾是完整的值时直接补全括号；否则退回到最后一条完整的记录。"""
+    if not stack:
+        return None, PARSE_PARTIAL
+    tail = out.rstrip()
+    if tail.endswith(('"', '}', ']')):  # 只缺闭合括号 (数字、true 等可能被截断在中间，不直接补全)
+        try:
+            return _loads(_close(list(tail), stack)), PARSE_REPAIRED
+        except json.JSONDecodeError:
+            pass
+    record_depth = _record_depth(stack)
+    record_container = tuple(stack[:record_depth])
+    for pos, cut_stack in reversed(cut_points):
+        if cut_stack != record_container:
+            continue
+        try:
+            partial = _loads(_close(list(out[:pos]), list(cut_stack)))
+        except json.JSONDecodeError:
+            continue
+        return partial, PARSE_PARTIAL
+    return None, PARSE_PARTIAL
+
+
+def _candidate_starts(text: str) -> Iterator[int]:
+    """依次产出每个 { 或 [ 的位置 (最多 MAX_START_CANDIDATES 个)，说明文字中也可能出现括号，如 "Note [see below] {...}"。"""
+    pos = -1
+    for _ in range(MAX_START_CANDIDATES):
+        starts = [found for found in (text.find('{', pos + 1), text.find('[', pos + 1)) if found != -1]
+        if not starts:
+            return
+        pos = min(starts)
+        yield pos
+
+
+def _is_expected_shape(value: Any) -> bool:
+    """标注结果的形状：非空对象 (单行结果或 {"results": [...]})，或元素都是对象的非空数组 (多行结果)。"""
+    if isinstance(value, dict):
+        return bool(value)
+    if isinstance(value, list):
+        return bool(value) and all(isinstance(item, dict) for item in value)
+    return False
+
+
+def _missing_required(value: Any, schema: Optional[Dict[str, Any]]) -> bool:
+    """value 是否缺少 schema 要求的字段 (只检查对象的 required，并递归检查 properties 与数组的 items)。"""
+    if not schema:
+        return False
+    if isinstance(value, dict):
+        if any(key not in value for key in schema.get('required', ())):
+            return True
+        properties = schema.get('properties') or {}
+        return any(_missing_required(item, properties.get(key)) for key, item in value.items())
+    if isinstance(value, list):
+        return any(_missing_required(item, schema.get('items')) for item in value)
+    return False
+
+
+def _records(value: Any) -> Optional[List[Any]]:
+    """批量结果中的记录数组 (与 _record_depth 一致：顶层数组，或顶层对象中的数组字段)。"""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        for item in value.values():
+            if isinstance(item, list):
+                return item
+    return None
+
+
+def _is_complete(value: Any, schema: Optional[Dict[str, Any]], expected_items: Optional[int]) -> bool:
+    """补全括号后的结果是否完整：包含 schema 要求的所有字段，批量结果包含全部 expected_items 条记录。"""
+    if _missing_required(value, schema):
+        return False
+    if expected_items is not None:
+        records = _records(value)
+        return records is not None and len(records) >= expected_items
+    return True
+
+
+def salvage_json(
+    response_text: str,
+    schema: Optional[Dict[str, Any]] = None,
+    expected_items: Optional[int] = None
+) -> Tuple[Any, str]:
+    """
+    容错解析模型响应，返回 (解析结果, 解析方式 PARSE_CLEAN / PARSE_REPAIRED / PARSE_PARTIAL)：
+    1. 去除 markdown 代码块标记后直接解析；
+    2. 从 { 或 [ 开始按括号配对提取JSON (忽略前后的说明文字)，并去掉多余的逗号；
+    3. 响应被截断时补全括号；末尾的值不完整时丢弃它，只保留已完整输出的任务字段 (或批量结果中的完整元素)。
+    第2、3步依次尝试每个起始位置，直到得到标注结果形状的值 (非空对象或对象数组)。
+    截断在两个任务字段 (或两条记录) 之间时补全括号也能解析，此时按 schema (输出的 JSON Schema) 与
+    expected_items (多行批量请求的行数) 检查：缺少字段或记录时为 PARSE_PARTIAL，不按完整结果缓存。
+    无法解析 (或没有恢复出任何内容) 时抛出第1步的 json.JSONDecodeError。
+    """
+    cleaned = _strip_code_fence(response_text)
+    try:
+        return json.loads(cleaned), PARSE_CLEAN
+    except json.JSONDecodeError as e:
+        original_error = e
+
+    for start in _candidate_starts(cleaned):
+        block, open_stack, cut_points = _scan_json_block(cleaned, start)
+        if open_stack is None:
+            try:
+                recovered, outcome = _loads(block), PARSE_REPAIRED
+            except json.JSONDecodeError:
+                continue
+        else:
+            recovered, outcome = _salvage_truncated(block, open_stack, cut_points)
+            if outcome == PARSE_REPAIRED and not _is_complete(recovered, schema, expected_items):
+                outcome = PARSE_PARTIAL
+        if _is_expected_shape(recovered):
+            return recovered, outcome
+    raise original_error
+
+
+class ParseStats:
+    """一次运行中各种解析结果的次数 (所有工作线程 / 协程共享)：直接解析、本地修复、部分恢复、重新请求。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {PARSE_CLEAN: 0, PARSE_REPAIRED: 0, PARSE_PARTIAL: 0, PARSE_RETRIED: 0}
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
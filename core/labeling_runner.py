@@ -0,0 +1,148 @@
+# table_labeling_tool/core/labeling_runner.py
+import concurrent.futures
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.async_engine import DEFAULT_MAX_IN_FLIGHT, run_rows_async
+from core.batch_labeling import DEFAULT_BATCH_SIZE, chunk_rows, process_row_batch
+from core.prompt_template import CompiledPromptTemplate
+from core.response_cache import ResponseCache
+from core.results import ResultCallback, RowResult
+from core.retry_policy import RetryPolicy
+from core.run_control import RunControl
+from core.run_journal import RunJournal
+
+# 全量标注可选的执行引擎
+ENGINE_THREAD = "thread"  # 线程池，每个线程同一时间处理一行
+ENGINE_ASYNC = "async"    # 单事件循环 + AsyncOpenAI，可同时有数百个请求在途
+LABELING_ENGINES = {
+    ENGINE_THREAD: "多线程",
+    ENGINE_ASYNC: "异步 (asyncio)",
+}
+SUBMIT_WINDOW_PER_WORKER = 2  # 每个工作线程最多预先提交的任务数
+
+
+def run_rows_threaded(
+    row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    workers: int = 4,
+    retry_policy: Optional[RetryPolicy] = None,
+    request_delay: float = 0.2,
+    on_result: Optional[ResultCallback] = None,
+    response_cache: Optional[ResponseCache] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> None:
+    """
+    使用线程池处理所有行，每完成一行即在调用线程中调用 on_result(行索引, 结果字典)。
+    batch_size > 1 时每个任务用一个请求标注 batch_size 行 (见 core.batch_labeling)。
+    行从 row_items 中按需读取，同一时间最多只有 workers × SUBMIT_WINDOW_PER_WORKER 个任务已提交未完成，
+    结果交给 on_result 后即释放，内存占用与总行数无关。
+    """
+    retry_policy = retry_policy or RetryPolicy()
+    batches = chunk_rows(row_items, batch_size)
+    max_pending = max(1, workers) * SUBMIT_WINDOW_PER_WORKER
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending_batches: Dict[concurrent.futures.Future, List[Tuple[Any, Dict[str, Any]]]] = {}
+
+        def submit_next_batch() -> None:
+            batch_rows = next(batches, None)
+            if batch_rows is not None:
+                future = executor.submit(
+                    process_row_batch, batch_rows, compiled_template, api_config,
+                    retry_policy, request_delay, response_cache
+                )
+                pending_batches[future] = batch_rows
+
+        try:
+            for _ in range(max_pending):
+                submit_next_batch()
+            while pending_batches:
+                done_futures, _ = concurrent.futures.wait(pending_batches, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done_futures:
+                    batch_rows = pending_batches.pop(future)
+                    try:
+                        batch_results = future.result()
+                    except Exception as exc:
+                        batch_results = [
+                            (item[0], {
+                                'success': False, 'result': None, 'error': f"任务执行失败 (Future): {exc}",
+                                'prompt_sent': "获取失败，因任务在发送前出错或Future本身出错", 'raw_response': None
+                            })
+                            for item in batch_rows
+                        ]
+                    if on_result is not None:
+                        for returned_idx, result_data in batch_results:
+                            on_result(returned_idx, result_data)
+                    submit_next_batch()
+        except BaseException:
+            # 被取消或中断 (如命令行 Ctrl+C) 时取消尚未开始的请求，避免退出前还要等排队任务执行完
+            for pending_future in pending_batches:
+                pending_future.cancel()
+            raise
+
+
+def run_labeling(
+    row_items: Iterable[Tuple[Any, Dict[str, Any]]],
+    compiled_template: CompiledPromptTemplate,
+    api_config: Dict[str, Any],
+    exec_config: Dict[str, Any],
+    on_result: Optional[ResultCallback] = None,
+    journal: Optional[RunJournal] = None,
+    response_cache: Optional[ResponseCache] = None,
+    duplicate_groups: Optional[Dict[Any, List[Any]]] = None,
+    control: Optional[RunControl] = None,
+    retry_policy: Optional[RetryPolicy] = None
+) -> RetryPolicy:
+    """
+    按执行参数选择引擎处理所有行。
+    exec_config 使用与任务流程配置相同的键: labeling_engine, concurrent_workers,
+    max_in_flight, retry_attempts, request_delay, batch_size。
+    提供 journal 时，每行结果在回调 on_result 之前先写入断点续跑记录；
+    提供 response_cache 时，命中缓存的行不调用API。
+    duplicate_groups ({代表行索引: [组内所有行索引]}，见 deduplicate_rows) 中的代表行
+    完成后，其结果会分发给组内每一行 (每行各触发一次记录与回调)。
+    提供 control 时可在运行中暂停 / 继续 / 取消；取消时抛出 RunCancelled (已记录的结果保留在断点记录中)。
+    retry_policy 默认按 exec_config 新建 (RetryPolicy.for_run)；调用方需要在运行被取消或出错后
+    仍能读取调用指标与重试统计时，可预先创建并传入。
+    返回本次运行使用的重试策略 (可读取重试预算与熔断统计)。
+    """
+    engine = exec_config.get('labeling_engine', ENGINE_THREAD)
+    if journal is not None:
+        user_on_result = on_result
+
+        def on_result(row_idx: Any, result_data: RowResult) -> None:
+            journal.record(row_idx, result_data)
+            if user_on_result is not None:
+                user_on_result(row_idx, result_data)
+
+    if duplicate_groups:
+        member_on_result = on_result
+
+        def on_result(row_idx: Any, result_data: RowResult) -> None:
+            for member_idx in duplicate_groups.get(row_idx, (row_idx,)):
+                if member_on_result is not None:
+                    member_on_result(member_idx, dict(result_data))
+
+    # 同一次运行的所有工作线程 / 协程共享重试预算与熔断器
+    if retry_policy is None:
+        retry_policy = RetryPolicy.for_run(exec_config, control)
+    request_delay = exec_config.get('request_delay', 0.2)
+    batch_size = exec_config.get('batch_size', DEFAULT_BATCH_SIZE)
+
+    if engine == ENGINE_ASYNC:
+        run_rows_async(
+            row_items, compiled_template, api_config,
+            max_in_flight=exec_config.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT),
+            retry_policy=retry_policy, request_delay=request_delay,
+            on_result=on_result, response_cache=response_cache, batch_size=batch_size
+        )
+    elif engine == ENGINE_THREAD:
+        run_rows_threaded(
+            row_items, compiled_template, api_config,
+            workers=exec_config.get('concurrent_workers', 4),
+            retry_policy=retry_policy, request_delay=request_delay,
+            on_result=on_result, response_cache=response_cache, batch_size=batch_size
+        )
+    else:
+        raise ValueError(f"未知的标注执行引擎: {engine}")
+    return retry_policy
@@ -0,0 +1,37 @@
+# table_labeling_tool/core/notifier.py
+import logging
+from typing import Callable, Dict, Optional
+
+# core 模块向用户报告错误/警告/提示的统一出口。
+# 默认写入日志 (命令行与后台任务)；Streamlit界面启动时通过 set_notifier 改为在脚本线程中用 st.error 等显示在页面上。
+# 工作线程中调用的函数 (API调用等) 不使用这里的提示，错误随结果字典 (core.results.RowResult) 返回。
+logger = logging.getLogger("table_labeling_tool")
+
+_handlers: Dict[str, Callable[[str], None]] = {
+    'error': logger.error,
+    'warning': logger.warning,
+    'info': logger.info,
+}
+
+
+def set_notifier(
+    error: Optional[Callable[[str], None]] = None,
+    warning: Optional[Callable[[str], None]] = None,
+    info: Optional[Callable[[str], None]] = None
+) -> None:
+    """替换提示的输出方式，未提供的级别保持不变。"""
+    for level, handler in (('error', error), ('warning', warning), ('info', info)):
+        if handler is not None:
+            _handlers[level] = handler
+
+
+def notify_error(message: str) -> None:
+    _handlers['error'](message)
+
+
+def notify_warning(message: str) -> None:
+    _handlers['warning'](message)
+
+
+def notify_info(message: str) -> None:
+    _handlers['info'](message)
@@ -1,48 +1,117 @@
 # table_labeling_tool/core/openai_caller.py
+import logging
 import time
 import json
-from typing import Dict, List, Any, Tuple, Optional
-import pandas as pd # 用于 pd.isna
-from openai import OpenAI, APIConnectionError, RateLimitError, AuthenticationError, NotFoundError, BadRequestError, APIError
-import streamlit as st # 用于 st.error
-import re # For re.escape and re.sub
+from typing import Dict, List, Any, Tuple, Optional, Union
+from openai import (
+    OpenAI, APIConnectionError, RateLimitError, AuthenticationError, PermissionDeniedError, NotFoundError,
+    BadRequestError, APIError, APIStatusError
+)
+from core.client_pool import get_shared_client
+from core.notifier import notify_error
+from core.rate_limiter import estimate_request_tokens, get_rate_limiter
+from core.retry_policy import RetryPolicy
+from core.json_repair import PARSE_PARTIAL, PARSE_RETRIED, salvage_json
+from core.prompt_template import CompiledPromptTemplate, compile_prompt_template
+from core.response_cache import ResponseCache, make_cache_key
+from core.results import RowResult
+from core.run_metrics import RunMetrics
+from core.structured_output import build_response_format, get_endpoint_capabilities, is_response_format_rejected
 
-def call_openai_api(client: OpenAI, messages: List[Dict[str, str]], config: Dict[str, Any]) -> str:
+logger = logging.getLogger("table_labeling_tool.openai_caller")
+
+
+def _create_chat_completion(
+    client: OpenAI,
+    messages: List[Dict[str, str]],
+    config: Dict[str, Any],
+    metrics: Optional[RunMetrics] = None,
+    attempt: int = 0
+) -> Any:
+    """
+    发送一次 Chat Completion 请求并返回解析后的响应对象。
+    调用前从共享限流器获取RPM/TPM配额，并用响应头 (包括错误响应) 修正限流器的配额。
+    config 中带有输出 Schema 时按端点支持的级别发送 response_format (见 core.structured_output)；
+    服务商拒绝时立即降一级重发并记录，不计入重试次数。
+    提供 metrics 时记录每个HTTP请求的耗时、状态码与Token用量 (attempt 为重试序号)。
+    """
+    rate_limiter = get_rate_limiter(config)
+    capabilities = get_endpoint_capabilities()
+    mode = capabilities.resolve_mode(config)
+    estimated_tokens = estimate_request_tokens(messages, config.get('max_tokens', 1500))
+    model_name = config.get('model_name', 'gpt-3.5-turbo')
+    while True:
+        rate_limiter.acquire(estimated_tokens)
+        response_format = build_response_format(config, mode)
+        request_start = time.perf_counter()
+        try:
+            raw_response = client.chat.completions.with_raw_response.create(
+                model=model_name,
+                messages=messages,
+                temperature=config.get('temperature', 0.05),
+                max_tokens=config.get('max_tokens', 1500),
+                stream=False,
+                **({'response_format': response_format} if response_format is not None else {}),
+            )
+        except APIStatusError as e:
+            rate_limiter.update_from_headers(e.response.headers)
+            if metrics is not None:
+                metrics.record_call(model_name, time.perf_counter() - request_start, attempt, e.status_code)
+            if response_format is not None and is_response_format_rejected(e):
+                mode = capabilities.record_rejected(config, mode)
+                continue
+            raise
+        except Exception:
+            if metrics is not None:
+                metrics.record_call(model_name, time.perf_counter() - request_start, attempt, None)
+            raise
+        break
+    rate_limiter.update_from_headers(raw_response.headers)
+    response = raw_response.parse()
+    rate_limiter.record_usage(estimated_tokens, getattr(response.usage, 'total_tokens', None))
+    if metrics is not None:
+        metrics.record_call(model_name, time.perf_counter() - request_start, attempt, raw_response.status_code, response.usage)
+    if response_format is not None:
+        capabilities.record_accepted(config, mode)
+    return response
+
+
+def describe_api_error(error: Exception) -> str:
+    """把API调用的异常转换为面向用户的说明，用于结果字典的 error 字段与日志。"""
+    if isinstance(error, AuthenticationError):
+        return f"OpenAI API认证失败: {error}。请检查您的API密钥和组织设置。"
+    if isinstance(error, PermissionDeniedError):
+        return f"OpenAI API权限错误: {error}。您可能没有权限访问此模型或资源。"
+    if isinstance(error, RateLimitError):
+        return f"OpenAI API速率限制已超出: {error}。请稍后重试或检查您的用量限制。"
+    if isinstance(error, APIConnectionError):
+        return f"OpenAI API连接错误: {error}。无法连接到OpenAI，请检查网络和API状态。"
+    if isinstance(error, NotFoundError):
+        return f"OpenAI API未找到错误: {error}。通常表示指定的模型不正确或不可用。"
+    if isinstance(error, BadRequestError):
+        return f"OpenAI API错误请求: {error}。可能是请求格式无效、Prompt问题（如过长）或其他参数错误。"
+    if isinstance(error, APIError):
+        return f"OpenAI API发生错误: {error}。OpenAI API发生意外错误。"
+    return f"OpenAI API调用期间发生意外错误: {error}"
+
+
+def call_openai_api(
+    client: OpenAI,
+    messages: List[Dict[str, str]],
+    config: Dict[str, Any],
+    metrics: Optional[RunMetrics] = None,
+    attempt: int = 0
+) -> str:
     """
-    调用OpenAI Chat Completion API，并处理常见API错误。
+    调用OpenAI Chat Completion API，出错时记录日志后重新抛出。
+    会在工作线程中调用，因此不向界面提示：错误说明 (describe_api_error) 随结果字典返回，由调用方显示。
+    提供 metrics 时记录本次调用的用量与耗时 (见 core.run_metrics)。
     """
     try:
-        response = client.chat.completions.create(
-            model=config.get('model_name', 'gpt-3.5-turbo'),
-            messages=messages,
-            temperature=config.get('temperature', 0.05),
-            max_tokens=config.get('max_tokens', 1500),
-            stream=False,
-        )
+        response = _create_chat_completion(client, messages, config, metrics, attempt)
         return response.choices[0].message.content
-    except AuthenticationError as e:
-        st.error(f"OpenAI API认证失败: {e}。请检查您的API密钥和组织设置。")
-        raise
-    except PermissionError as e: 
-        st.error(f"OpenAI API权限错误: {e}。您可能没有权限访问此模型或资源。")
-        raise
-    except RateLimitError as e:
-        st.error(f"OpenAI API速率限制已超出: {e}。请稍后重试或检查您的用量限制。")
-        raise
-    except APIConnectionError as e:
-        st.error(f"OpenAI API连接错误: {e}。无法连接到OpenAI，请检查网络和API状态。")
-        raise
-    except NotFoundError as e: 
-        st.error(f"OpenAI API未找到错误: {e}。通常表示指定的模型不正确或不可用。")
-        raise
-    except BadRequestError as e: 
-        st.error(f"OpenAI API错误请求: {e}。可能是请求格式无效、Prompt问题（如过长）或其他参数错误。")
-        raise
-    except APIError as e: 
-        st.error(f"OpenAI API发生错误: {e}。OpenAI API发生意外错误。")
-        raise
-    except Exception as e: 
-        st.error(f"OpenAI API调用期间发生意外错误: {e}")
+    except Exception as e:
+        logger.warning(describe_api_error(e))
         raise
 
 
@@ -104,30 +173,126 @@ def generate_labeling_prompt_template(tasks: List[Dict[str, Any]], api_config: D
 }}
 """
     try:
-        client = OpenAI(
-            api_key=api_config.get('api_key'),
-            base_url=api_config.get('base_url')
-        )
+        client = get_shared_client(api_config)
         messages = [
             {"role": "system", "content": "你是一个专业的prompt工程师，擅长生成高质量的数据标注prompt的JSON模板。"},
             {"role": "user", "content": prompt_generation_request}
         ]
         generated_template = call_openai_api(client, messages, api_config)
         return generated_template.strip()
-    except Exception:
+    except Exception as e:
+        notify_error(describe_api_error(e))
         return ""
 
 
+LABELING_SYSTEM_MESSAGE = "你是一个专业的数据标注助手。请严格按照JSON格式返回结果。不要添加任何解释性文字或markdown代码块标记。"
+
+
+def build_labeling_messages(filled_prompt: str) -> List[Dict[str, str]]:
+    """构建单行数据标注请求的消息列表。"""
+    return [
+        {"role": "system", "content": LABELING_SYSTEM_MESSAGE},
+        {"role": "user", "content": filled_prompt}
+    ]
+
+
+def parse_labeling_response(cleaned_response: str) -> Any:
+    """
+    解析模型响应中的JSON (容错解析，见 core.json_repair.salvage_json)。
+    无法解析时抛出 json.JSONDecodeError。
+    """
+    return salvage_json(cleaned_response)[0]
+
+
+def request_labeling_result(
+    filled_prompt: str,
+    api_config: Dict[str, Any],
+    retry_policy: RetryPolicy,
+    request_delay: float = 0.2,
+    response_cache: Optional[ResponseCache] = None,
+    expected_rows: Optional[int] = None
+) -> RowResult:
+    """
+    发送一个已填充的标注Prompt并解析JSON响应 (含缓存查询、重试与退避)。
+    返回与 process_single_row 相同结构的结果字典。单行与多行批量标注共用此函数，
+    多行批量请求时 expected_rows 为本批的行数 (截断的响应缺少行时不缓存，见 salvage_json)。
+    """
+    cleaned_response: Optional[str] = None
+    messages = build_labeling_messages(filled_prompt)
+    cache_key = None
+    if response_cache is not None:
+        cache_key = make_cache_key(api_config, messages)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return {
+                "success": True, "result": cached['result'], "error": None,
+                "prompt_sent": filled_prompt, "raw_response": cached['raw_response']
+            }
+
+    # 所有工作线程共享同一个客户端及其连接池
+    client = get_shared_client(api_config)
+    retry_delay = 0.0
+
+    for attempt in range(retry_policy.max_retries + 1): # +1 to make max_retries actually be the number of retries
+        retry_policy.before_attempt(attempt)
+        try:
+            api_response_content = call_openai_api(client, messages, api_config, retry_policy.metrics, attempt)
+            cleaned_response = api_response_content.strip() 
+            parsed_result, parse_outcome = salvage_json(cleaned_response, api_config.get('output_schema'), expected_rows)
+            retry_policy.record_success()
+            retry_policy.parse_stats.record(parse_outcome)
+            if cache_key is not None and parse_outcome != PARSE_PARTIAL: # 部分恢复的结果不缓存，重新标注时会再次请求
+                response_cache.put(cache_key, parsed_result, cleaned_response)
+            if request_delay > 0: time.sleep(request_delay) # Apply delay only on success before next call
+            return {
+                "success": True, "result": parsed_result, "error": None,
+                "prompt_sent": filled_prompt, "raw_response": cleaned_response 
+            }
+
+        except json.JSONDecodeError as je: # 本地修复后仍无法解析，才重新请求
+            stop_reason = retry_policy.stop_reason(je, attempt)
+            if stop_reason is not None:
+                error_msg = f"JSON解析失败 ({stop_reason}): {je}。"
+                return {
+                    "success": False, "result": None, "error": error_msg,
+                    "prompt_sent": filled_prompt, "raw_response": cleaned_response
+                }
+            retry_policy.parse_stats.record(PARSE_RETRIED)
+
+        except Exception as e: 
+            stop_reason = retry_policy.stop_reason(e, attempt)
+            if stop_reason is not None:
+                error_msg = f"API调用或处理失败 ({stop_reason}): {describe_api_error(e)}"
+                return {
+                    "success": False, "result": None, "error": error_msg,
+                    "prompt_sent": filled_prompt, "raw_response": cleaned_response 
+                }
+
+        retry_delay = retry_policy.next_delay(retry_delay)
+        time.sleep(retry_delay) # Wait before retrying
+    
+    # Fallback if loop finishes without returning (should not happen with max_retries + 1 logic)
+    return {
+        "success": False, "result": None, "error": f"已耗尽 {retry_policy.max_retries + 1} 次重试但未成功。",
+        "prompt_sent": filled_prompt, "raw_response": cleaned_response
+    }
+
+
 def process_single_row(
     row_data_tuple: Tuple[int, Dict[str, Any]],
-    final_prompt_template: str, # This is the prompt with {col_name} style placeholders
+    final_prompt_template: Union[str, CompiledPromptTemplate], # {col_name} 占位符模板，或其预编译对象
     api_config: Dict[str, Any],
     ordered_keys_for_prompt: List[str], # New argument for ordered column names
     retry_attempts: int = 3,
-    request_delay: float = 0.2
-) -> Tuple[int, Dict[str, Any]]:
+    request_delay: float = 0.2,
+    retry_policy: Optional[RetryPolicy] = None,
+    response_cache: Optional[ResponseCache] = None
+) -> Tuple[int, RowResult]:
     """
     使用OpenAI API处理单行数据。
+    retry_policy 为同一次运行共享的重试策略 (含重试预算与熔断器)；
+    未提供时按 retry_attempts 使用仅做错误分类和抖动退避的默认策略。
+    提供 response_cache 时先查询缓存，命中则不调用API；成功解析的结果会写入缓存。
     返回:
         包含 (行索引, 结果字典) 的元组。
         结果字典包含键 "success" (bool), "result" (解析后的JSON或None),
@@ -136,10 +301,8 @@ def process_single_row(
     """
     row_idx, row_dict = row_data_tuple
     filled_prompt: Optional[str] = None 
-    cleaned_response: Optional[str] = None 
 
     try:
-        # ---- MODIFIED: Prepare for indexed formatting ----
         if not ordered_keys_for_prompt:
             # This case should ideally be prevented by checks in run_labeling_tab.py
             error_msg = "处理失败: Prompt格式化所需的有序输入列列表 (ordered_keys_for_prompt) 为空。"
@@ -148,78 +311,13 @@ def process_single_row(
                 "prompt_sent": None, "raw_response": None
             }
 
-        # Prepare ordered values from row_dict, ensuring they are strings
-        ordered_string_values = []
-        for col_key in ordered_keys_for_prompt:
-            value = row_dict.get(col_key) # Get raw value from original row_dict
-            if pd.isna(value) or value is None:
-                ordered_string_values.append("")
-            else:
-                ordered_string_values.append(str(value))
-
-        # Transform the final_prompt_template to use indexed placeholders {0}, {1}, etc.
-        indexed_template_str = final_prompt_template
-        for i, col_name_key in enumerate(ordered_keys_for_prompt):
-            # Escape the column name in case it contains regex special characters
-            escaped_col_name = re.escape(col_name_key)
-            # Replace "{col_name}" with "{i}"
-            indexed_template_str = re.sub(r'\{' + escaped_col_name + r'\}', f'{{{i}}}', indexed_template_str)
-        
-        filled_prompt = indexed_template_str.format(*ordered_string_values)
-        # ---- END MODIFIED ----
-
-        client = OpenAI(
-            api_key=api_config.get('api_key'),
-            base_url=api_config.get('base_url')
-        )
-        messages = [
-            {"role": "system", "content": "你是一个专业的数据标注助手。请严格按照JSON格式返回结果。不要添加任何解释性文字或markdown代码块标记。"},
-            {"role": "user", "content": filled_prompt} # Use the new filled_prompt
-        ]
+        # 模板应在每次运行前编译一次；传入字符串时才在此处编译 (兼容旧调用方式)
+        compiled_template = compile_prompt_template(final_prompt_template, ordered_keys_for_prompt)
+        filled_prompt = compiled_template.render(row_dict)
 
-        for attempt in range(retry_attempts + 1): # +1 to make retry_attempts actually be the number of retries
-            try:
-                api_response_content = call_openai_api(client, messages, api_config)
-                cleaned_response = api_response_content.strip() 
-
-                temp_cleaned_response = cleaned_response 
-                if temp_cleaned_response.startswith("```json"):
-                    temp_cleaned_response = temp_cleaned_response[7:]
-                elif temp_cleaned_response.startswith("```"):
-                     temp_cleaned_response = temp_cleaned_response[3:]
-                if temp_cleaned_response.endswith("```"):
-                    temp_cleaned_response = temp_cleaned_response[:-3]
-                
-                parsed_result = json.loads(temp_cleaned_response.strip())
-                if request_delay > 0: time.sleep(request_delay) # Apply delay only on success before next call
-                return row_idx, {
-                    "success": True, "result": parsed_result, "error": None,
-                    "prompt_sent": filled_prompt, "raw_response": cleaned_response 
-                }
-
-            except json.JSONDecodeError as je:
-                if attempt == retry_attempts: # Last attempt failed
-                    error_msg = f"JSON解析失败 ({retry_attempts + 1}次尝试后): {je}。"
-                    return row_idx, {
-                        "success": False, "result": None, "error": error_msg,
-                        "prompt_sent": filled_prompt, "raw_response": cleaned_response
-                    }
-                time.sleep(1 + attempt * 0.5) # Wait before retrying
-
-            except Exception as e: 
-                if attempt == retry_attempts: # Last attempt failed
-                    error_msg = f"API调用或处理失败 ({retry_attempts + 1}次尝试后): {e}"
-                    return row_idx, {
-                        "success": False, "result": None, "error": error_msg,
-                        "prompt_sent": filled_prompt, "raw_response": cleaned_response 
-                    }
-                time.sleep(1 + attempt * 0.5) # Wait before retrying
-        
-        # Fallback if loop finishes without returning (should not happen with retry_attempts + 1 logic)
-        return row_idx, {
-            "success": False, "result": None, "error": f"已耗尽 {retry_attempts + 1} 次重试但未成功。",
-            "prompt_sent": filled_prompt, "raw_response": cleaned_response
-        }
+        if retry_policy is None:
+            retry_policy = RetryPolicy(max_retries=retry_attempts)
+        return row_idx, request_labeling_result(filled_prompt, api_config, retry_policy, request_delay, response_cache)
 
     except IndexError as ie: # New potential error with .format(*args)
         error_msg = f"处理失败: Prompt格式化索引错误 - {ie}。可能是Prompt中的索引超出了提供的数据值范围。"
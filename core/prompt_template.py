@@ -0,0 +1,100 @@
+# table_labeling_tool/core/prompt_template.py
+import re
+import string
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+import pandas as pd # 用于 pd.isna
+
+# 片段计划中的字段: (值索引, 转换符, 格式说明)。纯文本片段直接存为 str。
+_Field = Tuple[int, Optional[str], str]
+
+
+def _cell_to_prompt_str(value: Any) -> str:
+    """将单元格的值转换为填入Prompt的字符串 (缺失值转为空字符串)。"""
+    if value is None or pd.isna(value):
+        return ""
+    return str(value)
+
+
+class CompiledPromptTemplate:
+    """
+    预编译的最终用户Prompt模板。
+
+    每次运行只根据 `final_user_prompt` 和 `ordered_input_cols_for_prompt` 编译一次，
+    之后每行数据只需一次 join 即可得到完整Prompt，无需再做正则替换和 str.format。
+    渲染结果与原先 "re.sub 为 {i} 后再 .format(*values)" 的做法一致
+    (包括 `{{`/`}}` 的反转义)。
+    """
+
+    def __init__(self, template: str, ordered_keys: Sequence[str]):
+        self.template = template
+        self.ordered_keys: List[str] = list(ordered_keys)
+        self._segments: List[Union[str, _Field]] = self._compile()
+        # 所有字段均无转换符/格式说明时走快速路径
+        self._simple = all(
+            isinstance(seg, str) or (seg[1] is None and not seg[2]) for seg in self._segments
+        )
+
+    def _compile(self) -> List[Union[str, _Field]]:
+        # 与旧逻辑相同：先把 {列名} 替换为 {i}，再交给 string.Formatter 解析
+        indexed_template_str = self.template
+        for i, col_name_key in enumerate(self.ordered_keys):
+            indexed_template_str = re.sub(
+                r'\{' + re.escape(col_name_key) + r'\}', f'{{{i}}}', indexed_template_str
+            )
+
+        segments: List[Union[str, _Field]] = []
+        auto_index = 0
+        for literal_text, field_name, format_spec, conversion in string.Formatter().parse(indexed_template_str):
+            if literal_text:
+                if segments and isinstance(segments[-1], str):
+                    segments[-1] += literal_text
+                else:
+                    segments.append(literal_text)
+            if field_name is None:
+                continue
+            if field_name == "":
+                value_index = auto_index
+                auto_index += 1
+            elif field_name.isdigit():
+                value_index = int(field_name)
+            else:
+                # 与 str.format(*values) 的行为保持一致：非数字占位符视为缺失的键
+                raise KeyError(field_name)
+            if value_index >= len(self.ordered_keys):
+                raise IndexError(f"Replacement index {value_index} out of range for positional args tuple")
+            segments.append((value_index, conversion, format_spec or ""))
+        return segments
+
+    def render_values(self, ordered_string_values: Sequence[str]) -> str:
+        """用已按 ordered_keys 排好序的字符串值渲染Prompt。"""
+        if self._simple:
+            return "".join(
+                seg if isinstance(seg, str) else ordered_string_values[seg[0]]
+                for seg in self._segments
+            )
+        formatter = string.Formatter()
+        parts = []
+        for seg in self._segments:
+            if isinstance(seg, str):
+                parts.append(seg)
+            else:
+                value = formatter.convert_field(ordered_string_values[seg[0]], seg[1])
+                parts.append(formatter.format_field(value, seg[2]))
+        return "".join(parts)
+
+    def render(self, row_dict: Dict[str, Any]) -> str:
+        """用一行数据 (列名 -> 值) 渲染完整Prompt。"""
+        return self.render_values([_cell_to_prompt_str(row_dict.get(key)) for key in self.ordered_keys])
+
+
+def compile_prompt_template(
+    final_prompt_template: Union[str, CompiledPromptTemplate],
+    ordered_keys_for_prompt: Sequence[str]
+) -> CompiledPromptTemplate:
+    """
+    编译最终用户Prompt模板。如果传入的已经是编译后的模板则直接返回。
+    模板中存在无法匹配的占位符时抛出 KeyError / IndexError (与 str.format 一致)。
+    """
+    if isinstance(final_prompt_template, CompiledPromptTemplate):
+        return final_prompt_template
+    return CompiledPromptTemplate(final_prompt_template, ordered_keys_for_prompt)
@@ -0,0 +1,233 @@
+# table_labeling_tool/core/rate_limiter.py
+import asyncio
+import email.utils
+import re
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+# 粗略的Token估算：CJK字符约1个token/字，其他字符约4个字符/token
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_MESSAGE_OVERHEAD_TOKENS = 4
+_DURATION_PART_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+
+
+def estimate_text_tokens(text: str) -> int:
+    """不依赖分词器的Token数粗略估算。"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def estimate_request_tokens(messages, max_tokens: int) -> int:
+    """估算一次请求消耗的Token数：填充后的Prompt (所有消息) 加上 max_tokens。"""
+    prompt_tokens = sum(
+        estimate_text_tokens(str(m.get('content') or '')) + _MESSAGE_OVERHEAD_TOKENS for m in messages
+    )
+    return prompt_tokens + int(max_tokens or 0)
+
+
+def parse_duration_seconds(value: Optional[str]) -> Optional[float]:
+    """解析 x-ratelimit-reset-* 头中的时长，如 '1s'、'6m0s'、'20ms' 或纯数字秒数。"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART_PATTERN.findall(value)
+    if not parts:
+        return None
+    unit_seconds = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+    return sum(float(num) * unit_seconds[unit] for num, unit in parts)
+
+
+def parse_retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """解析 retry-after-ms / retry-after 头 (秒数或HTTP日期)。"""
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+    retry_after = headers.get('retry-after')
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_dt = email.utils.parsedate_to_datetime(retry_after)
+        return max(0.0, retry_dt.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _TokenBucket:
+    """按分钟配额匀速补充的令牌桶。容量为0表示不限制。允许透支，透支量决定等待时间。"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(0.0, float(per_minute or 0))
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """扣除 amount 并返回需要等待的秒数。"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level * 60.0 / self.capacity)
+
+    def refund(self, amount: float, now: float) -> None:
+        if self.capacity > 0:
+            self._refill(now)
+            self.level = min(self.capacity, self.level + amount)
+
+    def set_capacity(self, per_minute: float, now: float) -> None:
+        self._refill(now)
+        per_minute = max(0.0, float(per_minute or 0))
+        if self.capacity <= 0:
+            self.level = per_minute
+        self.capacity = per_minute
+        self.level = min(self.level, per_minute)
+
+    def clamp_level(self, remaining: float, now: float) -> None:
+        if self.capacity > 0:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """
+    所有工作线程 / 协程共享的RPM与TPM限流器。
+    每次调用前按估算的Token数获取配额；响应头中的 Retry-After 与 x-ratelimit-* 会实时修正配额，
+    配置为0时表示不预设上限，完全按服务商返回的限额运行。
+    """
+
+    def __init__(self, rpm_limit: int = 0, tpm_limit: int = 0):
+        self._lock = threading.Lock()
+        self._configured: Tuple[int, int] = (0, 0)
+        self._requests = _TokenBucket(0)
+        self._tokens = _TokenBucket(0)
+        self._blocked_until = 0.0
+        self.configure(rpm_limit, tpm_limit)
+
+    def configure(self, rpm_limit: int, tpm_limit: int) -> None:
+        """设置用户配置的上限 (0 表示不限制，由响应头决定)。"""
+        configured = (max(0, int(rpm_limit or 0)), max(0, int(tpm_limit or 0)))
+        with self._lock:
+            if configured == self._configured:
+                return
+            now = time.monotonic()
+            self._configured = configured
+            self._requests.set_capacity(configured[0], now)
+            self._tokens.set_capacity(configured[1], now)
+
+    def reserve(self, tokens: int) -> float:
+        """预订一次请求的配额，返回调用方需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            wait = max(wait, self._requests.reserve(1, now), self._tokens.reserve(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int) -> float:
+        """阻塞直到获得一次请求及 tokens 个Token的配额，返回实际等待的秒数。"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: int) -> float:
+        """acquire 的异步版本，不阻塞事件循环。"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """用响应中的实际Token用量修正预订时的估算值。"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delta = estimated_tokens - actual_tokens
+            if delta >= 0:
+                self._tokens.refund(delta, now)
+            else:
+                self._tokens.reserve(-delta, now)
+
+    def pause_for(self, seconds: float) -> None:
+        """暂停所有请求 seconds 秒 (例如服务端返回了 Retry-After)。"""
+        if seconds and seconds > 0:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """根据 Retry-After 与 x-ratelimit-* 响应头调整限额和剩余配额。"""
+        if not headers:
+            return
+        retry_after = parse_retry_after_seconds(headers)
+        if retry_after:
+            self.pause_for(retry_after)
+
+        with self._lock:
+            now = time.monotonic()
+            for bucket, configured, kind in (
+                (self._requests, self._configured[0], 'requests'),
+                (self._tokens, self._configured[1], 'tokens'),
+            ):
+                limit = _to_int(headers.get(f'x-ratelimit-limit-{kind}'))
+                # 未配置上限或服务商限额更低时，采用服务商的限额
+                if limit and limit > 0 and (configured <= 0 or limit < configured) and bucket.capacity != limit:
+                    bucket.set_capacity(limit, now)
+                remaining = _to_int(headers.get(f'x-ratelimit-remaining-{kind}'))
+                if remaining is None:
+                    continue
+                bucket.clamp_level(remaining, now)
+                if remaining <= 0:
+                    reset_seconds = parse_duration_seconds(headers.get(f'x-ratelimit-reset-{kind}'))
+                    if reset_seconds:
+                        self._blocked_until = max(self._blocked_until, now + reset_seconds)
+
+    def limits(self) -> Tuple[int, int]:
+        """当前生效的 (RPM, TPM) 上限，0 表示不限制。"""
+        with self._lock:
+            return int(self._requests.capacity), int(self._tokens.capacity)
+
+
+_limiters_lock = threading.Lock()
+_shared_limiters: Dict[Tuple[str, str, str], RateLimiter] = {}
+
+
+def get_rate_limiter(api_config: Dict[str, Any]) -> RateLimiter:
+    """
+    获取按 (api_key, base_url, model_name) 共享的限流器，
+    同一服务商/模型的试标注、全量标注和所有工作线程共用一份配额。
+    """
+    key = (api_config.get('api_key') or '', api_config.get('base_url') or '', api_config.get('model_name') or '')
+    with _limiters_lock:
+        limiter = _shared_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter()
+            _shared_limiters[key] = limiter
+    limiter.configure(api_config.get('rpm_limit', 0), api_config.get('tpm_limit', 0))
+    return limiter
@@ -0,0 +1,175 @@
+# table_labeling_tool/core/response_cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config_manager import CONFIG_DIR
+
+# 按内容寻址的响应缓存：相同 (模型, 参数, 系统消息, 填充后的Prompt) 的请求直接复用已解析的结果
+RESPONSE_CACHE_PATH = CONFIG_DIR / "response_cache.sqlite"
+DEFAULT_CACHE_TTL_DAYS = 30
+DEFAULT_CACHE_MAX_ENTRIES = 200000
+_EVICT_EVERY_N_PUTS = 500
+
+
+def make_cache_key(api_config: Dict[str, Any], messages: List[Dict[str, str]]) -> str:
+    """缓存键：模型名称、temperature、max_tokens 与完整消息 (系统消息 + 填充后的Prompt) 的 SHA-256。"""
+    key_material = json.dumps(
+        [
+            api_config.get('model_name', 'gpt-3.5-turbo'),
+            api_config.get('temperature', 0.05),
+            api_config.get('max_tokens', 1500),
+            messages,
+        ],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    基于SQLite的持久化响应缓存，所有工作线程 / 协程共享。
+    只缓存成功解析的结果；按TTL过期，超过 max_entries 时淘汰最久未使用的条目。
+    """
+
+    def __init__(
+        self,
+        path: Path = RESPONSE_CACHE_PATH,
+        ttl_days: float = DEFAULT_CACHE_TTL_DAYS,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, raw_response TEXT, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._puts_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.configure(ttl_days, max_entries)
+
+    def configure(self, ttl_days: float, max_entries: int) -> None:
+        """ttl_days 或 max_entries 为0表示不限制。"""
+        self.ttl_seconds = max(0.0, float(ttl_days or 0)) * 86400.0
+        self.max_entries = max(0, int(max_entries or 0))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """返回 {'result': 解析后的结果, 'raw_response': 原始响应文本}，未命中或已过期时返回 None。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, raw_response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return {'result': json.loads(row[0]), 'raw_response': row[1]}
+
+    def put(self, key: str, result: Any, raw_response: Optional[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, result, raw_response, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), raw_response, now, now)
+            )
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= _EVICT_EVERY_N_PUTS:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._puts_since_evict = 0
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def evict(self) -> None:
+        """立即执行一次过期与容量淘汰。"""
+        with self._lock:
+            self._evict(time.time())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def entry_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def counters(self) -> Tuple[int, int]:
+        """进程内累计的 (命中数, 未命中数)。"""
+        with self._lock:
+            return self.hits, self.misses
+
+    def scoped(self) -> "ScopedResponseCache":
+        """只统计本次运行自己的查询的视图 (同时进行的多次运行共用同一个缓存)。"""
+        return ScopedResponseCache(self)
+
+
+class ScopedResponseCache:
+    """
+    共享响应缓存的视图：读写都转发给共享缓存，命中 / 未命中只统计经由本视图的查询。
+    每次运行 (试标注、后台任务、命令行运行) 使用一个，其他同时进行的运行不会计入本次的命中数。
+    """
+
+    def __init__(self, cache: ResponseCache):
+        self._cache = cache
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return cached
+
+    def put(self, key: str, result: Any, raw_response: Optional[str]) -> None:
+        self._cache.put(key, result, raw_response)
+
+    def counters(self) -> Tuple[int, int]:
+        """本视图的 (命中数, 未命中数)。"""
+        with self._lock:
+            return self.hits, self.misses
+
+
+_cache_lock = threading.Lock()
+_shared_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache(
+    ttl_days: float = DEFAULT_CACHE_TTL_DAYS,
+    max_entries: int = DEFAULT_CACHE_MAX_ENTRIES
+) -> ResponseCache:
+    """获取进程内共享的响应缓存 (同一个SQLite文件只打开一次)。"""
+    global _shared_cache
+    with _cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache(ttl_days=ttl_days, max_entries=max_entries)
+        else:
+            _shared_cache.configure(ttl_days, max_entries)
+        return _shared_cache
@@ -0,0 +1,187 @@
+# table_labeling_tool/core/result_merge.py
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+import pandas as pd
+
+
+def labeling_output_columns(labeling_tasks: List[Dict[str, Any]]) -> Set[str]:
+    """打标任务定义的所有输出列 (需要理由的任务额外有 “<列名>_理由” 列)。"""
+    defined_output_cols_set = set()
+    for task_def in labeling_tasks:
+        out_col = task_def.get('output_column')
+        if out_col:
+            defined_output_cols_set.add(out_col)
+            if task_def.get('need_reason', False):
+                defined_output_cols_set.add(f"{out_col}_理由")
+    return defined_output_cols_set
+
+
+def _error_cell(proc_output: Dict[str, Any]) -> str:
+    return f"错误: {(proc_output.get('error') or '未知错误')[:60]}"
+
+
+def _object_array(values: List[Any]) -> np.ndarray:
+    """逐元素放入 object 数组 (值本身可能是列表或字典，不能让 numpy 展开)。"""
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def merge_labeling_results(
+    original_df: pd.DataFrame,
+    labeling_results_map: Dict[Any, Dict[str, Any]],
+    labeling_tasks: List[Dict[str, Any]]
+) -> Tuple[pd.DataFrame, List[Any]]:
+    """
+    把标注结果合并回原始数据的副本。
+    返回 (合并后的DataFrame, 在原始数据中找不到的结果行索引列表)。
+    结果只遍历一次，按列收集 (行位置, 值) 后整列写入，不逐个单元格 .loc 赋值。
+    """
+    result_df = original_df.copy()
+    defined_output_cols_set = labeling_output_columns(labeling_tasks)
+    for col_n in defined_output_cols_set:
+        if col_n not in result_df.columns:
+            result_df[col_n] = pd.NA
+    if not labeling_results_map:
+        return result_df, []
+    if not result_df.index.is_unique:
+        return _merge_labeling_results_by_label(result_df, labeling_results_map, defined_output_cols_set)
+
+    result_columns = set(result_df.columns)
+    result_keys = list(labeling_results_map.keys())
+    row_positions = result_df.index.get_indexer(result_keys)
+
+    skipped_indices: List[Any] = []
+    column_positions: Dict[str, List[int]] = {}
+    column_values: Dict[str, List[Any]] = {}
+    error_positions: List[int] = []
+    error_messages: List[str] = []
+
+    def collect(col_name: str, position: int, value: Any) -> None:
+        column_positions.setdefault(col_name, []).append(position)
+        column_values.setdefault(col_name, []).append(value)
+
+    for original_row_idx, position in zip(result_keys, row_positions):
+        if position < 0:
+            skipped_indices.append(original_row_idx)
+            continue
+        proc_output = labeling_results_map[original_row_idx]
+        if proc_output.get('success') and isinstance(proc_output.get('result'), dict):
+            for task_key, labeled_val in proc_output['result'].items():
+                if task_key not in result_columns:
+                    continue
+                if isinstance(labeled_val, dict): # {value, reason} 结构
+                    collect(task_key, position, labeled_val.get('value', pd.NA))
+                    reason_col = f"{task_key}_理由"
+                    if reason_col in result_columns:
+                        collect(reason_col, position, labeled_val.get('reason', pd.NA))
+                else: #直接值
+                    collect(task_key, position, labeled_val)
+        else: # 标注失败或结果格式错误
+            error_positions.append(position)
+            error_messages.append(_error_cell(proc_output))
+
+    error_pos_arr = np.asarray(error_positions, dtype=np.intp)
+    error_msg_arr = _object_array(error_messages)
+    for col_n in set(column_positions) | (defined_output_cols_set if error_positions else set()):
+        col_arr = result_df[col_n].to_numpy(dtype=object, copy=True)
+        if col_n in column_positions:
+            col_arr[np.asarray(column_positions[col_n], dtype=np.intp)] = _object_array(column_values[col_n])
+        if col_n in defined_output_cols_set and error_positions:
+            # 仅填充尚未有值的单元格 (例如数据中已有同名列时保留原值)
+            empty_mask = pd.isna(col_arr[error_pos_arr])
+            col_arr[error_pos_arr[empty_mask]] = error_msg_arr[empty_mask]
+        result_df[col_n] = pd.Series(col_arr, index=result_df.index, name=col_n).infer_objects()
+    return result_df, skipped_indices
+
+
+def _merge_labeling_results_by_label(
+    result_df: pd.DataFrame,
+    labeling_results_map: Dict[Any, Dict[str, Any]],
+    defined_output_cols_set: Set[str]
+) -> Tuple[pd.DataFrame, List[Any]]:
+    """行索引有重复时按标签逐行写入 (同一标签的所有行都会写入)。"""
+    skipped_indices: List[Any] = []
+    for original_row_idx, proc_output in labeling_results_map.items():
+        if original_row_idx not in result_df.index:
+            skipped_indices.append(original_row_idx)
+            continue
+
+        if proc_output.get('success') and isinstance(proc_output.get('result'), dict):
+            llm_json_output = proc_output['result']
+            for task_key, labeled_val in llm_json_output.items():
+                if task_key in result_df.columns:
+                    if isinstance(labeled_val, dict): # {value, reason} 结构
+                        result_df.loc[original_row_idx, task_key] = labeled_val.get('value', pd.NA)
+                        reason_col = f"{task_key}_理由"
+                        if reason_col in result_df.columns:
+                            result_df.loc[original_row_idx, reason_col] = labeled_val.get('reason', pd.NA)
+                    else: #直接值
+                        result_df.loc[original_row_idx, task_key] = labeled_val
+        else: # 标注失败或结果格式错误
+            err_msg_short = _error_cell(proc_output)
+            for col_n_fill_err in defined_output_cols_set:
+                if np.all(pd.isna(result_df.loc[original_row_idx, col_n_fill_err])): # 仅填充尚未被成功任务填充的列
+                    result_df.loc[original_row_idx, col_n_fill_err] = err_msg_short
+    return result_df, skipped_indices
+
+
+def _is_empty_label(labeled_val: Any) -> bool:
+    if isinstance(labeled_val, dict): # {value, reason} 结构
+        labeled_val = labeled_val.get('value')
+    if labeled_val is None:
+        return True
+    if isinstance(labeled_val, str):
+        return not labeled_val.strip()
+    return bool(np.isscalar(labeled_val) and pd.isna(labeled_val))
+
+
+def failed_result_indices(labeling_results_map: Dict[Any, Dict[str, Any]]) -> List[Any]:
+    """标注失败的行索引。"""
+    return [idx for idx, proc_output in labeling_results_map.items() if not proc_output.get('success')]
+
+
+def empty_output_indices(
+    labeling_results_map: Dict[Any, Dict[str, Any]],
+    row_index: Iterable[Any],
+    output_columns: Iterable[str]
+) -> List[Any]:
+    """output_columns 中任一列没有标注值的行索引：尚未标注、标注失败，或结果中该列缺失 / 为空。"""
+    output_columns = list(output_columns)
+    empty_indices = []
+    for idx in row_index:
+        proc_output = labeling_results_map.get(idx)
+        result = proc_output.get('result') if proc_output is not None and proc_output.get('success') else None
+        if not isinstance(result, dict) or any(_is_empty_label(result.get(col)) for col in output_columns):
+            empty_indices.append(idx)
+    return empty_indices
+
+
+def merge_task_results(
+    previous: Optional[Dict[str, Any]],
+    new: Dict[str, Any],
+    output_columns: Iterable[str],
+    all_output_columns: Optional[Iterable[str]] = None
+) -> Dict[str, Any]:
+    """
+    只重新标注部分输出列时，把新结果中这些列的值合并进该行已有的结果，其他列保持不变。
+    新结果失败时保留已有的成功结果 (失败只影响本次重新标注的统计)。
+    该行此前没有成功的结果时，合并结果缺少 all_output_columns (所有打标任务的输出列，默认为 output_columns)
+    中的任一列则仍记为失败，error 中列出缺少的列；已标注的列保留在结果中，之后重新标注其余列时继续合并。
+    """
+    previous_result = previous.get('result') if previous is not None and isinstance(previous.get('result'), dict) else None
+    previous_ok = previous_result is not None and bool(previous.get('success'))
+    if not new.get('success') or not isinstance(new.get('result'), dict):
+        return previous if previous_result is not None else new
+    merged = dict(previous_result) if previous_result is not None else {}
+    for col in output_columns:
+        if col in new['result']:
+            merged[col] = new['result'][col]
+    if not previous_ok and all_output_columns is not None:
+        missing_columns = [col for col in all_output_columns if col not in merged]
+        if missing_columns:
+            return {
+                **new, 'success': False, 'result': merged,
+                'error': f"该行此前未成功标注，本次只重新标注了部分输出列，仍缺少: {'、'.join(missing_columns)}"
+            }
+    return {**new, 'result': merged}
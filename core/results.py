@@ -0,0 +1,22 @@
+# table_labeling_tool/core/results.py
+from typing import Any, Callable, Optional, TypedDict
+
+
+class RowResult(TypedDict):
+    """
+    一行数据的标注结果。仍是普通字典，可直接存入 session_state / 断点记录 (JSON)。
+    success: 是否成功解析出JSON结果
+    result: 解析后的JSON (失败时为None)
+    error: 错误信息 (成功时为None)
+    prompt_sent: 发送给API的完整Prompt
+    raw_response: API原始响应文本 (主要用于JSON解析失败时排查)
+    """
+    success: bool
+    result: Any
+    error: Optional[str]
+    prompt_sent: Optional[str]
+    raw_response: Optional[str]
+
+
+# 每得到一行结果时的回调: (行索引, 结果)。界面、命令行与断点记录都通过它接收结果，core 不直接操作界面。
+ResultCallback = Callable[[Any, RowResult], None]
@@ -0,0 +1,204 @@
+# table_labeling_tool/core/retry_policy.py
+import asyncio
+import collections
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+from openai import (
+    APIConnectionError, APIStatusError, AuthenticationError, BadRequestError,
+    InternalServerError, NotFoundError, PermissionDeniedError, RateLimitError,
+    UnprocessableEntityError
+)
+from core.json_repair import ParseStats
+from core.run_control import RunControl
+from core.run_metrics import RunMetrics
+
+# 重试不可能成功的错误：认证、权限、模型不存在、请求格式错误
+NON_RETRYABLE_ERRORS = (
+    AuthenticationError, PermissionDeniedError, NotFoundError,
+    BadRequestError, UnprocessableEntityError
+)
+# 瞬时错误：限流、服务端错误、连接/超时错误 (APITimeoutError 是 APIConnectionError 的子类)
+TRANSIENT_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+DEFAULT_BASE_DELAY = 1.0      # 首次重试的最小等待 (秒)
+DEFAULT_MAX_DELAY = 30.0      # 单次重试等待的上限 (秒)
+DEFAULT_BUDGET_RATIO = 0.2    # 每个首次请求为重试预算贡献的额度
+DEFAULT_BUDGET_MIN = 10       # 运行开始时即可使用的重试次数
+DEFAULT_BREAKER_WINDOW = 50   # 熔断器统计的最近调用数
+DEFAULT_BREAKER_MIN_CALLS = 20
+DEFAULT_BREAKER_ERROR_RATE = 0.5
+DEFAULT_BREAKER_COOLDOWN = 15.0  # 熔断后暂停整个工作池的时间 (秒)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """429、5xx、连接和超时等瞬时错误。"""
+    if isinstance(exc, TRANSIENT_ERRORS):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """判断错误是否值得重试。JSON解析失败 (模型输出问题) 与未知错误按可重试处理。"""
+    if isinstance(exc, NON_RETRYABLE_ERRORS):
+        return False
+    if isinstance(exc, json.JSONDecodeError) or is_transient_error(exc):
+        return True
+    if isinstance(exc, APIStatusError):
+        return False
+    return True
+
+
+class RetryBudget:
+    """
+    每次运行的重试预算：每个首次请求存入 ratio 个额度，每次重试消耗 1 个。
+    大面积故障时重试总量被限制在请求数的一定比例内，不会成倍放大流量。
+    """
+
+    def __init__(self, ratio: float = DEFAULT_BUDGET_RATIO, min_retries: int = DEFAULT_BUDGET_MIN):
+        self._lock = threading.Lock()
+        self._ratio = max(0.0, float(ratio))
+        self._balance = float(max(0, min_retries))
+        self.retries_spent = 0
+        self.retries_denied = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._balance += self._ratio
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._balance >= 1.0:
+                self._balance -= 1.0
+                self.retries_spent += 1
+                return True
+            self.retries_denied += 1
+            return False
+
+
+class CircuitBreaker:
+    """
+    最近 window 次调用中瞬时错误比例超过 error_rate 时熔断，整个工作池暂停 cooldown 秒，
+    之后恢复调用并重新统计。
+    """
+
+    def __init__(
+        self,
+        window: int = DEFAULT_BREAKER_WINDOW,
+        min_calls: int = DEFAULT_BREAKER_MIN_CALLS,
+        error_rate: float = DEFAULT_BREAKER_ERROR_RATE,
+        cooldown: float = DEFAULT_BREAKER_COOLDOWN
+    ):
+        self._lock = threading.Lock()
+        self._outcomes = collections.deque(maxlen=max(1, window))
+        self._min_calls = max(1, min_calls)
+        self._error_rate = error_rate
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self.times_opened = 0
+
+    def record(self, failed: bool) -> None:
+        with self._lock:
+            self._outcomes.append(failed)
+            if len(self._outcomes) < self._min_calls:
+                return
+            if sum(self._outcomes) / len(self._outcomes) >= self._error_rate:
+                self._open_until = time.monotonic() + self._cooldown
+                self._outcomes.clear()
+                self.times_opened += 1
+
+    def remaining_pause(self) -> float:
+        with self._lock:
+            return max(0.0, self._open_until - time.monotonic())
+
+
+class RetryPolicy:
+    """
+    可插拔的重试策略：
+    - 不可重试的错误 (认证、权限、请求错误等) 立即失败；
+    - 429 / 5xx / 连接错误使用 decorrelated jitter 指数退避，避免所有线程同步重试；
+    - 可选的每次运行重试预算与熔断器，由同一次运行的所有工作线程 / 协程共享；
+    - 可选的运行控制 (暂停 / 继续 / 取消)，每次调用前检查。
+    parse_stats 统计同一次运行中响应的解析结果 (直接解析 / 本地修复 / 重新请求)，
+    metrics 记录每次API调用的Token用量、耗时与状态码 (见 core.run_metrics)。
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        control: Optional[RunControl] = None
+    ):
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker
+        self.control = control
+        self.parse_stats = ParseStats()
+        self.metrics = RunMetrics()
+
+    @classmethod
+    def for_run(cls, exec_config: Dict[str, Any], control: Optional[RunControl] = None) -> "RetryPolicy":
+        """为一次完整运行创建带重试预算和熔断器的策略。"""
+        return cls(
+            max_retries=exec_config.get('retry_attempts', 3),
+            budget=RetryBudget(ratio=exec_config.get('retry_budget_ratio', DEFAULT_BUDGET_RATIO)),
+            breaker=CircuitBreaker(cooldown=exec_config.get('breaker_cooldown', DEFAULT_BREAKER_COOLDOWN)),
+            control=control
+        )
+
+    def before_attempt(self, attempt: int) -> None:
+        """每次调用前：暂停或熔断期间阻塞等待 (已取消时抛出 RunCancelled)；首次请求为重试预算存入额度。"""
+        if self.control is not None:
+            self.control.checkpoint()
+        if attempt == 0 and self.budget is not None:
+            self.budget.record_request()
+        if self.breaker is not None:
+            pause = self.breaker.remaining_pause()
+            while pause > 0:
+                time.sleep(pause)
+                pause = self.breaker.remaining_pause()
+
+    async def before_attempt_async(self, attempt: int) -> None:
+        """before_attempt 的异步版本。"""
+        if self.control is not None:
+            await self.control.checkpoint_async()
+        if attempt == 0 and self.budget is not None:
+            self.budget.record_request()
+        if self.breaker is not None:
+            pause = self.breaker.remaining_pause()
+            while pause > 0:
+                await asyncio.sleep(pause)
+                pause = self.breaker.remaining_pause()
+
+    def record_success(self) -> None:
+        if self.breaker is not None:
+            self.breaker.record(False)
+
+    def stop_reason(self, exc: BaseException, attempt: int) -> Optional[str]:
+        """
+        记录一次失败并决定是否重试。返回 None 表示应当重试 (会消耗重试预算)，
+        否则返回停止重试的原因。attempt 为刚失败的尝试序号 (从0开始)。
+        """
+        if self.breaker is not None and not isinstance(exc, json.JSONDecodeError):
+            self.breaker.record(is_transient_error(exc))
+        if not is_retryable_error(exc):
+            return "不可重试的错误"
+        if attempt >= self.max_retries:
+            return f"{attempt + 1}次尝试后"
+        if self.budget is not None and not self.budget.try_spend():
+            return f"{attempt + 1}次尝试后，本次运行的重试预算已用尽"
+        return None
+
+    def next_delay(self, previous_delay: float) -> float:
+        """Decorrelated jitter: sleep = min(cap, uniform(base, previous * 3))。"""
+        upper = max(self.base_delay, previous_delay * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
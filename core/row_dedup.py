@@ -0,0 +1,27 @@
+# table_labeling_tool/core/row_dedup.py
+from typing import Any, Dict, List, Sequence, Tuple
+import pandas as pd
+
+
+def deduplicate_rows(df: pd.DataFrame, input_columns: Sequence[str]) -> Tuple[pd.DataFrame, Dict[Any, List[Any]]]:
+    """
+    按Prompt输入列的取值对行分组 (使用 hash_pandas_object 向量化计算)。
+    返回:
+        (每组第一行组成的DataFrame, {代表行索引: [组内所有行索引]})。
+        第二项只包含有重复的组，代表行本身排在组内第一位。
+    """
+    cols = [c for c in input_columns if c in df.columns]
+    if df.empty or not cols:
+        return df, {}
+    row_hashes = pd.util.hash_pandas_object(df[cols], index=False)
+    dup_mask = row_hashes.duplicated(keep=False).to_numpy()
+    if not dup_mask.any():
+        return df, {}
+
+    dup_hashes = row_hashes[dup_mask]
+    duplicate_groups: Dict[Any, List[Any]] = {}
+    for member_indices in dup_hashes.groupby(dup_hashes.to_numpy(), sort=False).groups.values():
+        members = list(member_indices)
+        duplicate_groups[members[0]] = members
+    unique_df = df[~row_hashes.duplicated(keep='first').to_numpy()]
+    return unique_df, duplicate_groups
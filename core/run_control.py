@@ -0,0 +1,75 @@
+# table_labeling_tool/core/run_control.py
+import asyncio
+import threading
+import time
+from typing import Optional
+
+CHECK_INTERVAL = 0.2  # 暂停期间检查是否恢复/取消的间隔 (秒)
+
+
+class RunCancelled(BaseException):
+    """
+    运行被取消。继承 BaseException (与 KeyboardInterrupt 相同)，
+    不会被逐行处理中的 except Exception 当作该行失败写入结果或断点记录。
+    """
+
+
+class RunControl:
+    """
+    一次运行的暂停 / 继续 / 取消开关，由所有工作线程 / 协程共享。
+    每次发送请求前调用 checkpoint()：暂停时阻塞等待，已取消时抛出 RunCancelled。
+    已在途的请求不受影响，会正常完成。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._cancelled = threading.Event()
+        self._paused_since: Optional[float] = None
+        self._paused_total = 0.0
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set() and not self._cancelled.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def pause(self) -> None:
+        with self._lock:
+            if self._cancelled.is_set() or not self._resumed.is_set():
+                return
+            self._paused_since = time.monotonic()
+            self._resumed.clear()
+
+    def resume(self) -> None:
+        with self._lock:
+            if self._paused_since is not None:
+                self._paused_total += time.monotonic() - self._paused_since
+                self._paused_since = None
+            self._resumed.set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self.resume()  # 唤醒暂停中的工作线程，让它们看到取消
+
+    def paused_seconds(self) -> float:
+        """累计暂停时长 (含当前这次暂停)，用于计算有效速度与预计剩余时间。"""
+        with self._lock:
+            current = time.monotonic() - self._paused_since if self._paused_since is not None else 0.0
+            return self._paused_total + current
+
+    def checkpoint(self) -> None:
+        while not self._resumed.wait(CHECK_INTERVAL):
+            pass
+        if self._cancelled.is_set():
+            raise RunCancelled()
+
+    async def checkpoint_async(self) -> None:
+        """checkpoint 的异步版本，暂停期间不阻塞事件循环。"""
+        while not self._resumed.is_set():
+            await asyncio.sleep(CHECK_INTERVAL)
+        if self._cancelled.is_set():
+            raise RunCancelled()
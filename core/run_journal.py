@@ -0,0 +1,181 @@
+# table_labeling_tool/core/run_journal.py
+import hashlib
+import json
+import re
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import pandas as pd
+
+from core.config_manager import CONFIG_DIR
+
+# 全量标注的断点续跑记录：每个 (任务流程, 数据指纹) 一个追加写入的JSONL文件
+JOURNAL_DIR = CONFIG_DIR / "run_journals"
+UNNAMED_FLOW_NAME = "未命名流程"
+
+
+def _jsonable(value: Any) -> Any:
+    """将 numpy / pandas 标量转换为可JSON序列化的Python对象。"""
+    if hasattr(value, 'item'):
+        try:
+            return value.item()
+        except (ValueError, TypeError):
+            pass
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def index_key(row_idx: Any) -> str:
+    """行索引在记录文件中的键 (与索引的具体类型无关)。"""
+    return json.dumps(_jsonable(row_idx), ensure_ascii=False)
+
+
+def compute_data_fingerprint(
+    df: pd.DataFrame,
+    input_columns: Sequence[str],
+    final_prompt: str,
+    model_name: str = ""
+) -> str:
+    """
+    计算数据指纹：行索引 + 参与Prompt的输入列的值 + 最终Prompt + 模型名称。
+    其他列的修改不影响标注结果，因此不计入指纹。
+    """
+    hasher = hashlib.sha256()
+    cols = [c for c in input_columns if c in df.columns]
+    hasher.update(json.dumps([str(c) for c in cols], ensure_ascii=False).encode('utf-8'))
+    hasher.update(str(len(df)).encode('utf-8'))
+    if cols:
+        row_hashes = pd.util.hash_pandas_object(df[cols], index=True).values
+    else:
+        row_hashes = pd.util.hash_pandas_object(df.index.to_series(), index=False).values
+    hasher.update(row_hashes.tobytes())
+    hasher.update((final_prompt or "").encode('utf-8'))
+    hasher.update((model_name or "").encode('utf-8'))
+    return hasher.hexdigest()
+
+
+def _safe_flow_name(flow_name: Optional[str]) -> str:
+    return re.sub(r'[^\w\-]+', '_', flow_name or UNNAMED_FLOW_NAME).strip('_') or "flow"
+
+
+def journal_path(flow_name: Optional[str], fingerprint: str) -> Path:
+    return JOURNAL_DIR / f"{_safe_flow_name(flow_name)}_{fingerprint[:16]}.jsonl"
+
+
+class RunJournal:
+    """
+    追加写入的行结果记录。每完成一行即写入一行JSON并 flush，
+    浏览器刷新、Streamlit重跑或进程崩溃后已付费的结果都不会丢失。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    @classmethod
+    def start(cls, flow_name: Optional[str], fingerprint: str, total_rows: int, resume: bool = False) -> "RunJournal":
+        """
+        打开 (流程, 指纹) 对应的记录文件。resume=False 时清空已有记录并重新开始。
+        """
+        path = journal_path(flow_name, fingerprint)
+        resume = resume and path.exists()
+        journal = cls.open(path, append=resume)
+        if not resume:
+            journal._write({
+                'type': 'meta',
+                'flow_name': flow_name or UNNAMED_FLOW_NAME,
+                'fingerprint': fingerprint,
+                'total': int(total_rows),
+                'created_time': datetime.now().isoformat(),
+            })
+        return journal
+
+    @classmethod
+    def open(cls, path: Path, append: bool = False) -> "RunJournal":
+        """打开 (append=False 时清空) 指定路径的记录文件。"""
+        journal = cls(path)
+        journal.path.parent.mkdir(parents=True, exist_ok=True)
+        journal._file = open(journal.path, 'a' if append else 'w', encoding='utf-8')
+        return journal
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self._file.flush()
+
+    def record(self, row_idx: Any, result_data: Dict[str, Any]) -> None:
+        """记录一行的处理结果 (同一行的后续记录会覆盖之前的记录)。"""
+        self._write({'type': 'row', 'idx': _jsonable(row_idx), 'result': result_data})
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_journal_meta(path: Path) -> Optional[Dict[str, Any]]:
+    """读取记录文件的元信息 (第一行)。"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            meta = json.loads(f.readline())
+        return meta if meta.get('type') == 'meta' else None
+    except (OSError, ValueError):
+        return None
+
+
+def count_journal_rows(path: Path) -> int:
+    """统计记录文件中的行结果条数 (不解析JSON，同一行的重复记录会重复计数)。"""
+    try:
+        with open(path, 'rb') as f:
+            return max(0, sum(1 for _ in f) - 1)
+    except OSError:
+        return 0
+
+
+def load_journal_results(path: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    读取记录文件中的所有行结果，返回 {index_key: 结果字典}。
+    崩溃时可能写了一半的最后一行会被跳过。
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('type') == 'row':
+                    results[index_key(record.get('idx'))] = record.get('result')
+    except OSError:
+        pass
+    return results
+
+
+def find_flow_journals(flow_name: Optional[str]) -> List[Path]:
+    """列出某个任务流程的所有记录文件，最近修改的在前。"""
+    if not JOURNAL_DIR.exists():
+        return []
+    prefix = _safe_flow_name(flow_name) + "_"
+    paths = [
+        p for p in JOURNAL_DIR.glob("*.jsonl")
+        if p.name.startswith(prefix) and re.fullmatch(r'[0-9a-f]{16}', p.stem[len(prefix):])
+    ]
+    return sorted(paths, key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+def map_journal_results_to_index(
+    journal_results: Dict[str, Dict[str, Any]],
+    df_index: pd.Index
+) -> Dict[Any, Dict[str, Any]]:
+    """把记录文件中的结果映射回 DataFrame 的原始行索引 (不在当前数据中的行会被忽略)。"""
+    mapped: Dict[Any, Dict[str, Any]] = {}
+    for row_idx in df_index:
+        result_data = journal_results.get(index_key(row_idx))
+        if result_data is not None:
+            mapped[row_idx] = result_data
+    return mapped
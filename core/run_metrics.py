@@ -0,0 +1,120 @@
+# table_labeling_tool/core/run_metrics.py
+import threading
+import time
+from array import array
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# 每次API调用的用量与耗时统计：Token数 (含缓存命中的输入Token)、单次请求耗时、第几次尝试、HTTP状态码。
+# 同一次运行的所有工作线程 / 协程共享一个 RunMetrics (挂在 RetryPolicy 上)，结束后汇总为可存入 session_state 的字典。
+LATENCY_PERCENTILES = (50, 95, 99)
+STATUS_CONNECTION_ERROR = "连接错误"  # 没有收到HTTP响应 (连接失败、超时)
+
+
+def usage_tokens(usage: Any) -> Dict[str, int]:
+    """从响应的 usage 中取出输入 / 输出 / 缓存命中的输入Token数 (兼容 OpenAI 与 DeepSeek 的字段)。"""
+    if usage is None:
+        return {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', None) if details is not None else None
+    if cached_tokens is None:
+        cached_tokens = getattr(usage, 'prompt_cache_hit_tokens', None)  # DeepSeek
+    return {
+        'prompt_tokens': int(getattr(usage, 'prompt_tokens', 0) or 0),
+        'completion_tokens': int(getattr(usage, 'completion_tokens', 0) or 0),
+        'cached_tokens': int(cached_tokens or 0),
+    }
+
+
+def estimate_cost(tokens: Dict[str, int], price: Optional[Dict[str, float]]) -> Optional[float]:
+    """
+    按价格表 (每百万Token的价格: input / cached_input / output) 估算费用，未配置价格时返回 None。
+    缓存命中的输入Token按 cached_input 计价，未配置时按 input 计价。
+    """
+    if not price:
+        return None
+    input_price = float(price.get('input') or 0)
+    cached_price = float(price['cached_input']) if price.get('cached_input') is not None else input_price
+    cached_tokens = min(tokens['cached_tokens'], tokens['prompt_tokens'])
+    return (
+        (tokens['prompt_tokens'] - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + tokens['completion_tokens'] * float(price.get('output') or 0)
+    ) / 1_000_000
+
+
+class RunMetrics:
+    """一次运行中所有API调用的统计。耗时按调用逐条保存 (用于分位数)，其余按模型累加。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies = array('d')
+        self._models: Dict[str, Dict[str, int]] = {}
+        self._status_counts: Dict[str, int] = {}
+        self._retried_calls = 0
+        self._first_start: Optional[float] = None
+        self._last_end: Optional[float] = None
+
+    def record_call(
+        self,
+        model: str,
+        latency: float,
+        attempt: int,
+        status: Optional[int],
+        usage: Any = None
+    ) -> None:
+        """记录一次HTTP请求 (成功或失败)。status 为 None 表示没有收到响应；usage 为响应中的用量。"""
+        tokens = usage_tokens(usage)
+        end = time.time()
+        status_key = str(status) if status is not None else STATUS_CONNECTION_ERROR
+        with self._lock:
+            self._latencies.append(latency)
+            model_totals = self._models.setdefault(model, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0})
+            model_totals['calls'] += 1
+            for key, value in tokens.items():
+                model_totals[key] += value
+            self._status_counts[status_key] = self._status_counts.get(status_key, 0) + 1
+            if attempt > 0:
+                self._retried_calls += 1
+            start = end - latency
+            if self._first_start is None or start < self._first_start:
+                self._first_start = start
+            self._last_end = end if self._last_end is None else max(self._last_end, end)
+
+    def summary(self, model_prices: Optional[Dict[str, Dict[str, float]]] = None) -> Dict[str, Any]:
+        """
+        汇总为普通字典：调用数、各状态码次数、Token合计、耗时分位数 (秒)、吞吐量 (Token/秒，
+        按第一次请求开始到最后一次请求结束的时间计算) 与各模型的估算费用 (model_prices: {模型: 价格})。
+        """
+        with self._lock:
+            latencies = np.frombuffer(self._latencies, dtype=np.float64).copy()
+            models = {model: dict(totals) for model, totals in self._models.items()}
+            status_counts = dict(self._status_counts)
+            retried_calls = self._retried_calls
+            span = (self._last_end - self._first_start) if self._first_start is not None else 0.0
+
+        totals = {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+        total_cost: Optional[float] = None
+        for model, model_totals in models.items():
+            for key in totals:
+                totals[key] += model_totals[key]
+            model_totals['cost'] = estimate_cost(model_totals, (model_prices or {}).get(model))
+            if model_totals['cost'] is not None:
+                total_cost = (total_cost or 0.0) + model_totals['cost']
+        total_tokens = totals['prompt_tokens'] + totals['completion_tokens']
+        percentiles = np.percentile(latencies, LATENCY_PERCENTILES) if len(latencies) else [None] * len(LATENCY_PERCENTILES)
+        return {
+            'calls': len(latencies),
+            'retried_calls': retried_calls,
+            'status_counts': status_counts,
+            **totals,
+            'total_tokens': total_tokens,
+            'latency_mean': float(latencies.mean()) if len(latencies) else None,
+            **{f'latency_p{p}': (float(value) if value is not None else None) for p, value in zip(LATENCY_PERCENTILES, percentiles)},
+            'elapsed': span,
+            'tokens_per_second': total_tokens / span if span > 0 else None,
+            'completion_tokens_per_second': totals['completion_tokens'] / span if span > 0 else None,
+            'models': models,
+            'cost': total_cost,
+        }
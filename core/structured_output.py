@@ -0,0 +1,176 @@
+# table_labeling_tool/core/structured_output.py
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from core.config_manager import CONFIG_DIR
+
+# 结构化输出：按打标任务生成输出的 JSON Schema，作为 response_format 发送，模型只能返回符合结构的JSON
+STRUCTURED_OUTPUT_MODES = {
+    "auto": "自动 (按服务商支持情况降级)",
+    "json_schema": "JSON Schema",
+    "json_object": "JSON 模式",
+    "off": "关闭 (仅靠Prompt约束)",
+}
+MODE_LEVELS = ["json_schema", "json_object", "off"]  # 服务商不支持时依次降级
+ENDPOINT_CAPABILITIES_PATH = CONFIG_DIR / "endpoint_capabilities.json"
+CAPABILITY_TTL_SECONDS = 7 * 24 * 3600  # 记录的降级过期后重新尝试更高的级别 (服务商可能已支持)
+
+# 标注值可以是文本、数字或布尔值
+LABEL_VALUE_SCHEMA = {"anyOf": [{"type": "string"}, {"type": "number"}, {"type": "boolean"}]}
+_REJECTION_HINTS = ("response_format", "json_schema", "json_object", "structured output", "guided")
+# 多行批量请求的结果外层字段。Prompt、Schema 与解析都使用 {"results": [...]}：
+# response_format 的顶层必须是对象，降级为 json_object 或不使用 Schema 时模型也按同一格式返回
+BATCH_RESULTS_KEY = "results"
+
+
+def build_output_schema(labeling_tasks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    按打标任务生成单行结果的 JSON Schema，与最终用户Prompt中的输出格式一致：
+    每个输出列为 {"value": ...}，需要理由时为 {"value": ..., "reason": ...}。没有输出列时返回 None。
+    """
+    properties: Dict[str, Any] = {}
+    for task_def in labeling_tasks:
+        output_col = task_def.get('output_column')
+        if not output_col:
+            continue
+        field_properties: Dict[str, Any] = {"value": LABEL_VALUE_SCHEMA}
+        if task_def.get('need_reason', False):
+            field_properties["reason"] = {"type": "string"}
+        properties[output_col] = {
+            "type": "object", "properties": field_properties,
+            "required": list(field_properties), "additionalProperties": False,
+        }
+    if not properties:
+        return None
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+def batch_output_schema(row_schema: Dict[str, Any], id_key: str) -> Dict[str, Any]:
+    """多行批量请求的 Schema：{"results": [每行结果 + 数据编号]} (见 BATCH_RESULTS_KEY)。"""
+    item_schema = {
+        **row_schema,
+        "properties": {id_key: {"type": "integer"}, **row_schema["properties"]},
+        "required": [id_key, *row_schema["required"]],
+    }
+    return {
+        "type": "object", "properties": {BATCH_RESULTS_KEY: {"type": "array", "items": item_schema}},
+        "required": [BATCH_RESULTS_KEY], "additionalProperties": False,
+    }
+
+
+def with_output_schema(api_config: Dict[str, Any], labeling_tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """返回附带输出 Schema ('output_schema') 的 api_config 副本，用于本次标注运行。"""
+    run_config = dict(api_config)
+    run_config['output_schema'] = build_output_schema(labeling_tasks)
+    return run_config
+
+
+def with_batch_output_schema(api_config: Dict[str, Any], id_key: str) -> Dict[str, Any]:
+    """多行批量请求使用的 api_config：把单行 Schema 换成批量 Schema。未设置 Schema 时原样返回。"""
+    row_schema = api_config.get('output_schema')
+    if not row_schema:
+        return api_config
+    return {**api_config, 'output_schema': batch_output_schema(row_schema, id_key)}
+
+
+def _endpoint_key(api_config: Dict[str, Any]) -> str:
+    return f"{api_config.get('base_url') or ''}|{api_config.get('model_name') or ''}"
+
+
+class EndpointCapabilities:
+    """
+    记录每个服务端点 (Base URL + 模型) 可用的结构化输出级别，保存在配置目录中，所有线程共享。
+    请求因 response_format 被拒绝时降一级并记录，之后的请求直接使用可用的级别。
+    """
+
+    def __init__(self, path: Path = ENDPOINT_CAPABILITIES_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}  # 端点 -> {'mode': 级别, 'updated': 时间}
+        try:
+            self._entries = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def resolve_mode(self, api_config: Dict[str, Any]) -> str:
+        """本次请求使用的级别：配置的级别与该端点已记录的可用级别中较低的一个。未设置 Schema 时为 off。"""
+        if not api_config.get('output_schema'):
+            return "off"
+        configured = api_config.get('structured_output') or "auto"
+        mode = "json_schema" if configured == "auto" else configured
+        if mode not in MODE_LEVELS:
+            return "off"
+        with self._lock:
+            entry = self._entries.get(_endpoint_key(api_config))
+        if entry is not None and time.time() - entry.get('updated', 0) < CAPABILITY_TTL_SECONDS:
+            mode = max(mode, entry['mode'], key=MODE_LEVELS.index)
+        return mode
+
+    def record_accepted(self, api_config: Dict[str, Any], mode: str) -> None:
+        """请求以 mode 成功返回 (只在首次确认时写入文件)。"""
+        key = _endpoint_key(api_config)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['mode'] == mode:
+                return
+            self._entries[key] = {'mode': mode, 'updated': time.time()}
+            self._save()
+
+    def record_rejected(self, api_config: Dict[str, Any], mode: str) -> str:
+        """服务商拒绝了 mode 对应的 response_format：记录降一级后的级别并返回。"""
+        lower_mode = MODE_LEVELS[min(MODE_LEVELS.index(mode) + 1, len(MODE_LEVELS) - 1)]
+        with self._lock:
+            self._entries[_endpoint_key(api_config)] = {'mode': lower_mode, 'updated': time.time()}
+            self._save()
+        return lower_mode
+
+    def known_mode(self, api_config: Dict[str, Any]) -> str:
+        """已确认可用的级别 (用于无法中途降级的离线批处理)，没有记录时为 off。"""
+        if not api_config.get('output_schema'):
+            return "off"
+        with self._lock:
+            entry = self._entries.get(_endpoint_key(api_config))
+        return self.resolve_mode(api_config) if entry is not None else "off"
+
+    def _save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self._entries, ensure_ascii=False, indent=2), encoding='utf-8')
+        except OSError:
+            pass
+
+
+_capabilities_lock = threading.Lock()
+_shared_capabilities: Optional[EndpointCapabilities] = None
+
+
+def get_endpoint_capabilities() -> EndpointCapabilities:
+    """获取进程内共享的端点能力记录。"""
+    global _shared_capabilities
+    with _capabilities_lock:
+        if _shared_capabilities is None:
+            _shared_capabilities = EndpointCapabilities()
+        return _shared_capabilities
+
+
+def build_response_format(api_config: Dict[str, Any], mode: str) -> Optional[Dict[str, Any]]:
+    """mode 对应的 response_format 参数，off 时为 None。"""
+    if mode == "json_schema":
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "labeling_result", "schema": api_config['output_schema'], "strict": True},
+        }
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def is_response_format_rejected(error: Exception) -> bool:
+    """错误响应 (400/422) 是否表示服务商不支持所发送的 response_format。"""
+    if getattr(error, 'status_code', None) not in (400, 422):
+        return False
+    message = str(error).lower()
+    return any(hint in message for hint in _REJECTION_HINTS)
@@ -0,0 +1,60 @@
+# table_labeling_tool/core/table_search.py
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class TableSearchIndex:
+    """
+    DataFrame 的子串搜索索引 (不区分大小写，按字面匹配)，数据每个版本建一次。
+    每列按不同取值分解 (值 -> 行的倒排索引)：只对不同取值做一次小写字符串转换并缓存，
+    查询时先在不同取值中匹配子串，再按取值编号映射回行。重复值多的列 (类别、标签等)
+    只需扫描很少的字符串；各列在第一次被搜索时才建立索引。缺失值不参与匹配。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._columns: Dict[str, Tuple[np.ndarray, pd.Series]] = {}  # 列名 -> (每行的取值编号, 小写后的不同取值)
+        self._last_query: Optional[Tuple[str, Optional[str]]] = None
+        self._last_mask: Optional[np.ndarray] = None
+
+    def _column_index(self, column: str) -> Tuple[np.ndarray, pd.Series]:
+        entry = self._columns.get(column)
+        if entry is None:
+            values = self._df[column]
+            try:
+                codes, uniques = pd.factorize(values)
+            except TypeError:  # 不可哈希的值 (如JSONL中的列表/字典) 先转为字符串
+                codes, uniques = pd.factorize(values.map(str, na_action='ignore'))
+            if len(uniques) < np.iinfo(np.int32).max:
+                codes = codes.astype(np.int32)
+            entry = (codes, pd.Series(uniques).astype(str).str.lower())
+            self._columns[column] = entry
+        return entry
+
+    def _match_column(self, column: str, term: str) -> np.ndarray:
+        codes, lowered = self._column_index(column)
+        unique_hits = lowered.str.contains(term, regex=False, na=False).to_numpy(dtype=bool)
+        # 缺失值的编号为 -1，对应末尾追加的 False
+        return np.append(unique_hits, False)[codes]
+
+    def invalidate(self, columns: Sequence[str]) -> None:
+        """只修改了部分列的单元格后调用 (数据表为同一对象、行未增删)：丢弃这些列的索引，下次搜索时重建。"""
+        for column in columns:
+            self._columns.pop(column, None)
+        self._last_query, self._last_mask = None, None
+
+    def search(self, term: str, column: Optional[str] = None) -> np.ndarray:
+        """返回按行位置的布尔掩码：column 为 None 时在所有列中搜索 (任一列匹配即可)。"""
+        query = (term.lower(), column)
+        if query == self._last_query:
+            return self._last_mask
+        if column is not None:
+            mask = self._match_column(column, query[0])
+        else:
+            mask = np.zeros(len(self._df), dtype=bool)
+            for col in self._df.columns:
+                mask |= self._match_column(col, query[0])
+        self._last_query, self._last_mask = query, mask
+        return mask
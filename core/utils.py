@@ -2,7 +2,8 @@
 import re
 import json
 from typing import List, Dict, Any, Set, Optional
-import streamlit as st # 用于 st.error, st.session_state
+from core.json_repair import salvage_json
+from core.notifier import notify_error, notify_warning
 
 # def extract_placeholder_columns_from_final_prompt(prompt_text: str) -> List[str]:
 #     """
@@ -35,6 +36,44 @@ def extract_placeholder_columns_from_final_prompt(prompt_text: str) -> List[str]
             cleaned_matches.append(cleaned)
     return cleaned_matches
 
+def prompt_input_columns(defined_labeling_tasks: List[Dict[str, Any]]) -> List[str]:
+    """
+    最终用户Prompt中 “提供的参考信息” 部分列出的输入列 (按列名排序)。
+    即填充Prompt时使用的有序输入列 ordered_input_cols_for_prompt。
+    """
+    all_input_columns: Set[str] = set()
+    for task_def in defined_labeling_tasks:
+        if not task_def.get('output_column'):
+            continue
+        task_input_cols = task_def.get('input_columns', [])
+        if isinstance(task_input_cols, (list, set, tuple)):
+            for col in task_input_cols:
+                all_input_columns.add(str(col))
+    return sorted(all_input_columns)
+
+def build_task_subset_prompt(
+    ai_generated_json_template_str: str,
+    defined_labeling_tasks: List[Dict[str, Any]],
+    output_columns: List[str]
+) -> Optional[str]:
+    """
+    只包含部分打标任务 (按输出列选择) 的最终用户Prompt，用于只重新标注这些列：
+    从JSON模板中取出这些任务的指令，参考信息部分也只列出它们的输入列 (填充时使用 prompt_input_columns(所选任务))。
+    模板无法解析或其中没有所选任务的指令时返回 None。
+    """
+    try:
+        parsed_json_data = salvage_json(ai_generated_json_template_str.strip())[0]
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed_json_data, dict) or not isinstance(parsed_json_data.get("prompts"), list):
+        return None
+    selected = set(output_columns)
+    subset_tasks = [task_def for task_def in defined_labeling_tasks if task_def.get('output_column') in selected]
+    subset_prompts = [item for item in parsed_json_data["prompts"] if isinstance(item, dict) and item.get("task") in selected]
+    if not subset_tasks or not subset_prompts:
+        return None
+    return _build_final_user_prompt_from_template({"prompts": subset_prompts}, subset_tasks)
+
 def _build_final_user_prompt_from_template(
     parsed_template_json: Dict[str, Any],
     defined_labeling_tasks: List[Dict[str, Any]]
@@ -80,13 +119,9 @@ def _build_final_user_prompt_from_template(
             output_structure_from_tasks[task_output_col] = f"针对'{task_output_col}'的标注结果"
 
 
-    # ---- NEW: Define and store the order of input columns for the prompt ----
     # Sort for consistency, matching how they are listed in the info_section
+    # (与 prompt_input_columns 一致，调用方据此保存 ordered_input_cols_for_prompt)
     ordered_input_cols_for_prompt = sorted(list(all_input_columns))
-    # Ensure st.session_state is available and initialized before trying to set an attribute
-    if 'st' in globals() and hasattr(st, 'session_state'):
-        st.session_state.ordered_input_cols_for_prompt = ordered_input_cols_for_prompt
-    # ---- END NEW ----
 
     # 构建“提供的信息”部分
     info_section = "提供的参考信息：\n"
@@ -107,8 +142,7 @@ def _build_final_user_prompt_from_template(
             else:
                 task_descriptions_from_template.append(f"  任务 {i}: (模板格式错误，无法解析)")
     else:
-        if 'st' in globals() and hasattr(st, 'warning'):
-            st.warning("Prompt模板JSON中缺少 'prompts' 列表或格式不正确。请检查AI生成的Prompt模板。")
+        notify_warning("Prompt模板JSON中缺少 'prompts' 列表或格式不正确。请检查AI生成的Prompt模板。")
         task_descriptions_from_template.append("  (无法从模板加载任务指令，请检查Prompt模板)")
 
     # 构建“输出格式”部分，使用从 defined_labeling_tasks 推断的结构
@@ -173,8 +207,7 @@ def parse_ai_generated_prompt_template(
         except json.JSONDecodeError:
             pass 
         except Exception as e:
-            if 'st' in globals() and hasattr(st, 'error'):
-                st.error(f"直接解析AI生成的JSON模板时发生意外错误: {str(e)}")
+            notify_error(f"直接解析AI生成的JSON模板时发生意外错误: {str(e)}")
             return ai_generated_json_template_str
 
     # 尝试2: 如果直接解析失败，尝试从markdown代码块中提取JSON
@@ -188,12 +221,10 @@ def parse_ai_generated_prompt_template(
             try:
                 parsed_json_data = json.loads(json_substring)
             except json.JSONDecodeError as e_re:
-                if 'st' in globals() and hasattr(st, 'error'):
-                    st.error(f"从提取的JSON块解析失败: {e_re}。\n提取的块 (前500字符): {json_substring[:500]}...\n原始输出 (前500字符):\n{ai_generated_json_template_str[:500]}...")
+                notify_error(f"从提取的JSON块解析失败: {e_re}。\n提取的块 (前500字符): {json_substring[:500]}...\n原始输出 (前500字符):\n{ai_generated_json_template_str[:500]}...")
                 return ai_generated_json_template_str
             except Exception as e_fatal_re:
-                if 'st' in globals() and hasattr(st, 'error'):
-                    st.error(f"解析提取的JSON块时发生意外错误: {e_fatal_re}")
+                notify_error(f"解析提取的JSON块时发生意外错误: {e_fatal_re}")
                 return ai_generated_json_template_str
         else: 
             start_index = stripped_template_str.find('{')
@@ -203,45 +234,35 @@ def parse_ai_generated_prompt_template(
                 try:
                     parsed_json_data = json.loads(json_substring)
                 except json.JSONDecodeError as e_sub:
-                    if 'st' in globals() and hasattr(st, 'error'):
-                        st.error(f"无法从AI生成的文本中解析JSON模板。尝试提取的子字符串解析失败: {e_sub}。\n请检查AI的输出是否为合法的JSON。原始输出 (前500字符):\n{ai_generated_json_template_str[:500]}...")
+                    notify_error(f"无法从AI生成的文本中解析JSON模板。尝试提取的子字符串解析失败: {e_sub}。\n请检查AI的输出是否为合法的JSON。原始输出 (前500字符):\n{ai_generated_json_template_str[:500]}...")
                     return ai_generated_json_template_str
                 except Exception as e_fatal_sub:
-                    if 'st' in globals() and hasattr(st, 'error'):
-                        st.error(f"提取并解析JSON子字符串时发生意外错误: {e_fatal_sub}")
+                    notify_error(f"提取并解析JSON子字符串时发生意外错误: {e_fatal_sub}")
                     return ai_generated_json_template_str
             else: 
-                if 'st' in globals() and hasattr(st, 'error'):
-                    st.error(f"AI生成的文本不包含有效的JSON结构。请检查AI的输出。原始输出 (前500字符):\n{ai_generated_json_template_str[:500]}...")
+                notify_error(f"AI生成的文本不包含有效的JSON结构。请检查AI的输出。原始输出 (前500字符):\n{ai_generated_json_template_str[:500]}...")
                 return ai_generated_json_template_str
 
     if parsed_json_data is not None:
         try:
             if not isinstance(parsed_json_data, dict):
-                if 'st' in globals() and hasattr(st, 'error'):
-                    st.error(f"解析得到的JSON模板不是一个对象 (字典): 类型为 {type(parsed_json_data)}。\n内容 (前200字符): {str(parsed_json_data)[:200]}...")
+                notify_error(f"解析得到的JSON模板不是一个对象 (字典): 类型为 {type(parsed_json_data)}。\n内容 (前200字符): {str(parsed_json_data)[:200]}...")
                 return ai_generated_json_template_str
 
             if "prompts" not in parsed_json_data or not isinstance(parsed_json_data["prompts"], list):
-                if 'st' in globals() and hasattr(st, 'error'):
-                    st.error("AI生成的JSON模板缺少 'prompts' 键，或其值不是一个列表。请确保AI遵循指定的输出格式。")
-                    if hasattr(st, 'json'): st.json(parsed_json_data) 
+                notify_error(f"AI生成的JSON模板缺少 'prompts' 键，或其值不是一个列表。请确保AI遵循指定的输出格式。\n解析到的JSON模板 (前500字符): {str(parsed_json_data)[:500]}")
                 return ai_generated_json_template_str
 
             for item in parsed_json_data["prompts"]:
                 if not isinstance(item, dict) or "task" not in item or "prompt" not in item:
-                    if 'st' in globals() and hasattr(st, 'error'):
-                        st.error("AI生成的JSON模板中 'prompts' 列表内的元素格式不正确。每个元素应为包含 'task' 和 'prompt'键的字典。")
-                        if hasattr(st, 'json'): st.json(parsed_json_data)
+                    notify_error(f"AI生成的JSON模板中 'prompts' 列表内的元素格式不正确。每个元素应为包含 'task' 和 'prompt'键的字典。\n解析到的JSON模板 (前500字符): {str(parsed_json_data)[:500]}")
                     return ai_generated_json_template_str
             
             return _build_final_user_prompt_from_template(parsed_json_data, defined_labeling_tasks)
 
         except Exception as e:
-            if 'st' in globals() and hasattr(st, 'error'):
-                st.error(f"构建最终用户prompt时出错: {str(e)}。\n解析到的JSON模板 (前500字符): {str(parsed_json_data)[:500]}")
+            notify_error(f"构建最终用户prompt时出错: {str(e)}。\n解析到的JSON模板 (前500字符): {str(parsed_json_data)[:500]}")
             return ai_generated_json_template_str
 
-    if 'st' in globals() and hasattr(st, 'error'):
-        st.error("未能从AI的输出中成功解析JSON模板。")
+    notify_error("未能从AI的输出中成功解析JSON模板。")
     return ai_generated_json_template_str
\ No newline at end of file
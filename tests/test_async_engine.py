@@ -0,0 +1,100 @@
+# table_labeling_tool/tests/test_async_engine.py
+import asyncio
+import json
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+import core.async_engine as async_engine
+from core.prompt_template import compile_prompt_template
+from core.response_cache import ResponseCache
+from core.retry_policy import RetryPolicy
+from core.run_metrics import RunMetrics
+
+LABEL = {"情感": {"value": "正面"}}
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 5, "total_tokens": 17},
+    }
+
+
+def _stub_client(requests):
+    """使用 httpx.MockTransport 的真实 AsyncOpenAI 客户端：经过SDK完整的响应解析流程，不发送网络请求。"""
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=_completion(json.dumps(LABEL, ensure_ascii=False)))
+
+    return AsyncOpenAI(
+        api_key="sk-test", base_url="http://stub.local/v1", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+
+@pytest.fixture
+def api_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # 端点能力记录写在当前目录下
+    return {"api_key": "sk-test", "base_url": "http://stub.local/v1", "model_name": "test-model", "max_tokens": 100}
+
+
+def test_call_openai_api_async_parses_response(api_config):
+    requests = []
+    metrics = RunMetrics()
+
+    async def call():
+        client = _stub_client(requests)
+        try:
+            return await async_engine.call_openai_api_async(
+                client, [{"role": "user", "content": "hi"}], api_config, metrics
+            )
+        finally:
+            await client.close()
+
+    content = asyncio.run(call())
+    assert json.loads(content) == LABEL
+    assert len(requests) == 1
+    summary = metrics.summary()
+    assert summary['calls'] == 1
+    assert summary['status_counts'] == {'200': 1}
+    assert summary['total_tokens'] == 17
+
+
+def test_run_rows_async_labels_every_row_without_retries(api_config, monkeypatch):
+    requests = []
+    monkeypatch.setattr(async_engine, "create_async_client", lambda config, min_pool_size=0: _stub_client(requests))
+    template = compile_prompt_template("评论：{}", ["评论"])
+    retry_policy = RetryPolicy(max_retries=2)
+    rows = [(idx, {"评论": f"第{idx}条"}) for idx in range(5)]
+
+    results = async_engine.run_rows_async(
+        rows, template, api_config, max_in_flight=3, retry_policy=retry_policy, request_delay=0
+    )
+
+    assert sorted(results) == list(range(5))
+    assert all(result["success"] and result["result"] == LABEL for result in results.values())
+    assert len(requests) == 5
+    assert retry_policy.metrics.summary()['retried_calls'] == 0
+
+
+def test_run_rows_async_reuses_cached_responses(api_config, monkeypatch, tmp_path):
+    requests = []
+    monkeypatch.setattr(async_engine, "create_async_client", lambda config, min_pool_size=0: _stub_client(requests))
+    template = compile_prompt_template("评论：{}", ["评论"])
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    rows = [(idx, {"评论": f"第{idx}条"}) for idx in range(4)]
+
+    for _ in range(2):
+        results = async_engine.run_rows_async(rows, template, api_config, request_delay=0, response_cache=cache)
+        assert all(result["success"] for result in results.values())
+
+    assert len(requests) == 4
+    assert cache.entry_count() == 4
+    assert cache.counters() == (4, 4)
+
@@ -0,0 +1,226 @@
+# table_labeling_tool/tests/test_batch_api.py
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from core.batch_api import (
+    BATCH_JOBS_DIR, batch_job_has_results, cancel_batch_job, load_batch_job_results, refresh_batch_job, submit_batch_job
+)
+from core.prompt_template import compile_prompt_template
+from core.row_dedup import deduplicate_rows
+from core.run_journal import map_journal_results_to_index
+
+def _label_for(request_line):
+    prompt = request_line["body"]["messages"][-1]["content"]
+    return {"情感": {"value": "负面" if "坏" in prompt else "正面"}}
+
+
+def _output_line(request_line):
+    content = json.dumps(_label_for(request_line), ensure_ascii=False)
+    return {
+        "id": "batch_req", "custom_id": request_line["custom_id"], "error": None,
+        "response": {"status_code": 200, "body": {
+            "id": "chatcmpl", "object": "chat.completion", "created": 0, "model": "test-model",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        }},
+    }
+
+
+def _error_line(request_line):
+    return {
+        "id": "batch_req", "custom_id": request_line["custom_id"],
+        "response": {"status_code": 500, "body": {"error": {"message": "server error"}}}, "error": None,
+    }
+
+
+class StubBatchServer:
+    """
+    OpenAI兼容的 /v1/files 与 /v1/batches 接口的最小实现。
+    批处理创建后先处于 in_progress，第二次查询时完成；取消后只返回前 cancel_after 个请求的结果，
+    其中最后一个写入错误文件。
+    """
+
+    def __init__(self, cancel_after=2):
+        self.files = {}
+        self.batches = {}
+        self.polls = {}
+        self.downloads = 0
+        self.cancel_after = cancel_after
+        self.lock = threading.Lock()
+
+    def _store_file(self, lines):
+        file_id = f"file-{uuid.uuid4().hex[:8]}"
+        self.files[file_id] = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode()
+        return file_id
+
+    def _requests(self, batch):
+        return [json.loads(line) for line in self.files[batch["input_file_id"]].decode().splitlines() if line.strip()]
+
+    def _finish(self, batch, status):
+        requests = self._requests(batch)
+        if status == "cancelled":
+            answered = requests[:self.cancel_after]
+            batch["output_file_id"] = self._store_file([_output_line(r) for r in answered[:-1]])
+            batch["error_file_id"] = self._store_file([_error_line(answered[-1])])
+            batch["request_counts"] = {"total": len(requests), "completed": len(answered) - 1, "failed": 1}
+        else:
+            batch["output_file_id"] = self._store_file([_output_line(r) for r in requests])
+            batch["request_counts"] = {"total": len(requests), "completed": len(requests), "failed": 0}
+        batch["status"] = status
+
+    def handle_get(self, path):
+        if path.startswith("/v1/batches/"):
+            batch = self.batches[path.rsplit("/", 1)[1]]
+            with self.lock:
+                self.polls[batch["id"]] = self.polls.get(batch["id"], 0) + 1
+                if batch["status"] == "in_progress" and self.polls[batch["id"]] >= 2:
+                    self._finish(batch, "completed")
+                elif batch["status"] == "cancelling":
+                    self._finish(batch, "cancelled")
+            return batch
+        if path.startswith("/v1/files/") and path.endswith("/content"):
+            with self.lock:
+                self.downloads += 1
+            return self.files[path.split("/")[3]]
+        return None
+
+    def handle_post(self, path, headers, raw):
+        if path == "/v1/files":
+            boundary = headers["Content-Type"].split("boundary=")[1].encode()
+            content = b""
+            for part in raw.split(b"--" + boundary):
+                if b'name="file"' in part:
+                    content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+            file_id = f"file-{uuid.uuid4().hex[:8]}"
+            self.files[file_id] = content
+            return {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                    "filename": "input.jsonl", "purpose": "batch", "status": "processed"}
+        if path == "/v1/batches":
+            body = json.loads(raw)
+            batch_id = f"batch_{uuid.uuid4().hex[:8]}"
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"], "status": "in_progress", "created_at": 0,
+                "output_file_id": None, "error_file_id": None, "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            return self.batches[batch_id]
+        if path.startswith("/v1/batches/") and path.endswith("/cancel"):
+            batch = self.batches[path.split("/")[3]]
+            batch["status"] = "cancelling"
+            return batch
+        return None
+
+
+@pytest.fixture
+def stub_server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # 批处理任务记录写在当前目录下
+    stub = StubBatchServer()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload):
+            if payload is None:
+                code, data = 404, b'{"error": {"message": "not found"}}'
+            else:
+                code, data = 200, payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._send(stub.handle_get(self.path.split("?")[0]))
+
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._send(stub.handle_post(self.path.split("?")[0], self.headers, raw))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    stub.api_config = {
+        "api_key": "sk-test", "base_url": f"http://127.0.0.1:{server.server_address[1]}/v1", "model_name": "test-model"
+    }
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+def _submit(stub, df):
+    template = compile_prompt_template("评论：{}", ["评论"])
+    unique_df, duplicate_groups = deduplicate_rows(df, ["评论"])
+    row_items = [(row_idx, {"评论": comment}) for row_idx, comment in unique_df["评论"].items()]
+    return submit_batch_job(
+        row_items, template, stub.api_config,
+        flow_name="测试流程", total_rows=len(df), duplicate_groups=duplicate_groups
+    )
+
+
+def test_batch_flow_upload_create_poll_download_map_back(stub_server):
+    df = pd.DataFrame({"评论": ["很好", "太坏了", "很好", "还行"]}, index=[10, 11, 12, 13])
+    job = _submit(stub_server, df)
+    assert job["total_requests"] == 3  # 重复行只提交一次
+    assert job["total_rows"] == 4
+
+    job = refresh_batch_job(job["job_id"], stub_server.api_config)
+    assert job["status"] == "in_progress"
+    assert not batch_job_has_results(job)
+
+    job = refresh_batch_job(job["job_id"], stub_server.api_config)
+    assert job["status"] == "collected"
+    assert batch_job_has_results(job)
+
+    results = map_journal_results_to_index(load_batch_job_results(job["job_id"]), df.index)
+    assert sorted(results) == [10, 11, 12, 13]
+    assert all(result["success"] for result in results.values())
+    labels = [results[row_idx]["result"]["情感"]["value"] for row_idx in df.index]
+    assert labels == ["正面", "负面", "正面", "正面"]
+
+
+def test_cancelled_batch_keeps_completed_rows(stub_server):
+    df = pd.DataFrame({"评论": ["很好", "太坏了", "还行", "一般"]})
+    job = _submit(stub_server, df)
+
+    cancel_batch_job(job["job_id"], stub_server.api_config)
+    job = refresh_batch_job(job["job_id"], stub_server.api_config)
+    assert job["status"] == "cancelled"
+    assert batch_job_has_results(job)
+
+    results = map_journal_results_to_index(load_batch_job_results(job["job_id"]), df.index)
+    assert results[0]["success"] and results[0]["result"] == {"情感": {"value": "正面"}}
+    assert not results[1]["success"] and "批处理请求失败" in results[1]["error"]
+    assert not results[2]["success"] and not results[3]["success"]
+    assert "未返回" in results[3]["error"]
+
+
+def test_concurrent_refreshes_collect_results_once(stub_server):
+    """后台轮询与界面刷新同时进行时，结果只取回一次，也不会留下临时文件。"""
+    df = pd.DataFrame({"评论": ["很好", "太坏了", "还行"]})
+    job = _submit(stub_server, df)
+    refresh_batch_job(job["job_id"], stub_server.api_config)
+
+    start = threading.Barrier(4)
+
+    def refresh():
+        start.wait()
+        refresh_batch_job(job["job_id"], stub_server.api_config)
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stub_server.downloads == 1
+    assert not list(BATCH_JOBS_DIR.glob("*.tmp"))
+    results = load_batch_job_results(job["job_id"])
+    assert len(results) == 3 and all(result["success"] for result in results.values())
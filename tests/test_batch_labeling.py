@@ -0,0 +1,36 @@
+# table_labeling_tool/tests/test_batch_labeling.py
+from core.batch_labeling import batch_id_key, build_batch_prompt, split_batch_result
+from core.prompt_template import compile_prompt_template
+from core.structured_output import BATCH_RESULTS_KEY, batch_output_schema, build_output_schema
+
+TASKS = [{"input_columns": ["评论"], "output_column": "情感", "requirement": "判断情感", "need_reason": False}]
+ROWS = [(10, {"评论": "很好"}), (11, {"评论": "太坏了"})]
+
+
+def _batch_result(parsed):
+    return {"success": True, "result": parsed, "error": None, "prompt_sent": "p", "raw_response": None}
+
+
+def test_batch_prompt_asks_for_the_schema_wrapper():
+    template = compile_prompt_template("评论：{}", ["评论"])
+    prompt = build_batch_prompt(template, ROWS)
+    schema = batch_output_schema(build_output_schema(TASKS), batch_id_key(template.ordered_keys))
+    assert schema["required"] == [BATCH_RESULTS_KEY]
+    assert f'"{BATCH_RESULTS_KEY}"' in prompt
+    assert "恰好包含 2 个元素" in prompt
+
+
+def test_split_batch_result_reads_the_results_field():
+    items = [{"id": 2, "情感": {"value": "负面"}}, {"id": 1, "情感": {"value": "正面"}}]
+    row_results, missing_rows = split_batch_result(_batch_result({BATCH_RESULTS_KEY: items}), ROWS, "id")
+    assert missing_rows == []
+    assert dict(row_results)[10]["result"] == {"情感": {"value": "正面"}}
+    assert dict(row_results)[11]["result"] == {"情感": {"value": "负面"}}
+
+
+def test_split_batch_result_falls_back_for_other_shapes():
+    items = [{"id": 1, "情感": {"value": "正面"}}]
+    row_results, missing_rows = split_batch_result(_batch_result(items), ROWS, "id")  # 未遵循格式的裸数组
+    assert [idx for idx, _ in row_results] == [10] and missing_rows == [ROWS[1]]
+    row_results, missing_rows = split_batch_result(_batch_result({"data": items}), ROWS, "id")
+    assert row_results == [] and missing_rows == ROWS
@@ -0,0 +1,18 @@
+# table_labeling_tool/tests/test_client_pool.py
+from core.client_pool import close_shared_clients, get_shared_client
+
+API_CONFIG = {"api_key": "sk-test", "base_url": "http://stub.local/v1", "pool_size": 4}
+
+
+def test_shared_client_is_reused_and_replaced_clients_are_closed():
+    close_shared_clients()
+    client = get_shared_client(API_CONFIG)
+    assert get_shared_client(dict(API_CONFIG)) is client
+
+    # 连接设置变化时创建新客户端，旧客户端可能仍有进行中的请求，不立即关闭
+    replacement = get_shared_client({**API_CONFIG, "pool_size": 8})
+    assert replacement is not client
+    assert not client.is_closed()
+
+    close_shared_clients()
+    assert client.is_closed() and replacement.is_closed()
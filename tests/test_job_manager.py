@@ -0,0 +1,62 @@
+# table_labeling_tool/tests/test_job_manager.py
+import json
+import threading
+
+import httpx
+import pytest
+from openai import OpenAI
+
+import core.openai_caller as openai_caller
+from core.job_manager import JOB_CANCELLED, JobManager
+from core.prompt_template import compile_prompt_template
+
+LABEL = {"情感": {"value": "正面"}}
+EXEC_CONFIG = {"labeling_engine": "thread", "concurrent_workers": 1, "request_delay": 0, "batch_size": 1, "retry_attempts": 1}
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 5, "total_tokens": 17},
+    }
+
+
+@pytest.fixture
+def api_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return {"api_key": "sk-test", "base_url": "http://stub.local/v1", "model_name": "test-model", "max_tokens": 100}
+
+
+def _stub_client(monkeypatch, on_request):
+    def handler(request):
+        on_request()
+        return httpx.Response(200, json=_completion(json.dumps(LABEL, ensure_ascii=False)))
+
+    client = OpenAI(api_key="sk-test", base_url="http://stub.local/v1", max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(openai_caller, "get_shared_client", lambda config: client)
+
+
+def test_cancelled_job_keeps_retry_policy_and_metrics(api_config, monkeypatch):
+    """任务在运行中被取消时，重试策略 (调用指标、解析统计) 仍挂在任务上供界面展示。"""
+    holder, job_started = {}, threading.Event()
+
+    def cancel_job():
+        job_started.wait(timeout=10)
+        holder["job"].cancel()
+
+    _stub_client(monkeypatch, cancel_job)
+    template = compile_prompt_template("评论：{}", ["评论"])
+    rows = ((idx, {"评论": f"第{idx}条"}) for idx in range(20))
+
+    holder["job"] = job = JobManager().start_job(rows, template, api_config, EXEC_CONFIG, total_rows=20)
+    job_started.set()
+    job._thread.join(timeout=30)
+
+    assert job.status == JOB_CANCELLED
+    assert job.retry_policy is not None
+    assert job.retry_policy.metrics.summary()["calls"] >= 1
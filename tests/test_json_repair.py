@@ -0,0 +1,50 @@
+# table_labeling_tool/tests/test_json_repair.py
+import json
+
+import pytest
+
+from core.json_repair import PARSE_CLEAN, PARSE_PARTIAL, PARSE_REPAIRED, salvage_json
+from core.structured_output import batch_output_schema, build_output_schema
+
+SCHEMA = build_output_schema([{"output_column": "a"}, {"output_column": "b"}])
+
+
+def test_clean_and_code_fenced():
+    assert salvage_json('```json\n{"a": {"value": 1}}\n```') == ({"a": {"value": 1}}, PARSE_CLEAN)
+
+
+@pytest.mark.parametrize("text", [
+    'Note [see below] {"a": 1}',
+    '结果如下 (见 {说明}) ：{"a": 1}',
+    'Sure! [1] {"a": 1,}',
+])
+def test_skips_brackets_in_prose(text):
+    assert salvage_json(text) == ({"a": 1}, PARSE_REPAIRED)
+
+
+def test_truncated_keeps_complete_fields():
+    parsed, outcome = salvage_json('说明 [注] {"a": {"value": "x"}, "b": {"value": "y')
+    assert (parsed, outcome) == ({"a": {"value": "x"}}, PARSE_PARTIAL)
+
+
+def test_truncated_at_task_boundary_is_partial():
+    """截断恰好落在两个任务字段之间：补全括号能解析，但缺少任务 b，不能当作完整结果。"""
+    text = '{"a": {"value": "x"}'
+    assert salvage_json(text, SCHEMA) == ({"a": {"value": "x"}}, PARSE_PARTIAL)
+    assert salvage_json('{"a": {"value": "x"}, "b": {"value": "y"}', SCHEMA)[1] == PARSE_REPAIRED
+
+
+def test_truncated_batch_missing_rows_is_partial():
+    schema = batch_output_schema(SCHEMA, "_id")
+    text = '{"results": [{"_id": 1, "a": {"value": "x"}, "b": {"value": "y"}}'
+    assert salvage_json(text, schema, expected_items=2)[1] == PARSE_PARTIAL
+    assert salvage_json(text, schema, expected_items=1)[1] == PARSE_REPAIRED
+
+
+def test_batch_wrapper_after_prose():
+    assert salvage_json('ok: {"results": [{"id": 1}]}')[0] == {"results": [{"id": 1}]}
+
+
+def test_unparseable_raises():
+    with pytest.raises(json.JSONDecodeError):
+        salvage_json("抱歉 [无法] 完成 {这个} 请求")
@@ -0,0 +1,35 @@
+# table_labeling_tool/tests/test_openai_caller.py
+import httpx
+import pytest
+from openai import OpenAI
+
+import core.notifier as notifier
+import core.openai_caller as openai_caller
+from core.notifier import set_notifier
+from core.retry_policy import RetryPolicy
+
+
+@pytest.fixture
+def api_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return {"api_key": "sk-bad", "base_url": "http://stub.local/v1", "model_name": "test-model"}
+
+
+def test_api_errors_are_returned_in_the_result_not_notified(api_config, monkeypatch):
+    """工作线程中的API错误只写入日志并随结果字典返回，不经过 notifier (界面的 st.error)。"""
+    def handler(request):
+        return httpx.Response(401, json={"error": {"message": "invalid api key", "type": "invalid_request_error"}})
+
+    client = OpenAI(api_key="sk-bad", base_url=api_config["base_url"], max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(openai_caller, "get_shared_client", lambda config: client)
+    notified = []
+    set_notifier(error=notified.append, warning=notified.append, info=notified.append)
+    try:
+        result = openai_caller.request_labeling_result("评论：很好", api_config, RetryPolicy(max_retries=2), request_delay=0)
+    finally:
+        set_notifier(error=notifier.logger.error, warning=notifier.logger.warning, info=notifier.logger.info)
+
+    assert not result["success"]
+    assert "认证失败" in result["error"]
+    assert notified == []
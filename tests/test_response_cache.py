@@ -0,0 +1,14 @@
+# table_labeling_tool/tests/test_response_cache.py
+from core.response_cache import ResponseCache
+
+
+def test_scoped_cache_counts_only_its_own_lookups(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite")
+    cache.put("a", {"x": 1}, "{}")
+    first, second = cache.scoped(), cache.scoped()
+    assert first.get("a") is not None
+    assert first.get("b") is None
+    assert second.get("a") is not None
+    assert first.counters() == (1, 1)
+    assert second.counters() == (1, 0)
+    assert cache.counters() == (2, 1)
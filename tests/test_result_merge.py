@@ -0,0 +1,37 @@
+# table_labeling_tool/tests/test_result_merge.py
+from core.result_merge import failed_result_indices, merge_task_results
+
+ALL_COLUMNS = ["情感", "主题"]
+
+
+def _ok(result):
+    return {"success": True, "result": result, "error": None, "prompt_sent": None, "raw_response": None}
+
+
+FAILED = {"success": False, "result": None, "error": "API调用失败", "prompt_sent": None, "raw_response": None}
+
+
+def test_subset_rerun_merges_into_successful_row():
+    previous = _ok({"情感": {"value": "正面"}, "主题": {"value": "物流"}})
+    merged = merge_task_results(previous, _ok({"主题": {"value": "价格"}}), ["主题"], ALL_COLUMNS)
+    assert merged["success"]
+    assert merged["result"] == {"情感": {"value": "正面"}, "主题": {"value": "价格"}}
+
+
+def test_subset_rerun_of_failed_row_stays_failed_until_all_columns_labeled():
+    """此前失败的行只重新标注了部分列：仍记为失败 (列出缺少的列)，补齐其余列后才算成功。"""
+    merged = merge_task_results(FAILED, _ok({"主题": {"value": "价格"}}), ["主题"], ALL_COLUMNS)
+    assert not merged["success"]
+    assert "情感" in merged["error"]
+    assert merged["result"] == {"主题": {"value": "价格"}}
+    assert failed_result_indices({0: merged}) == [0]
+
+    completed = merge_task_results(merged, _ok({"情感": {"value": "负面"}}), ["情感"], ALL_COLUMNS)
+    assert completed["success"]
+    assert completed["result"] == {"主题": {"value": "价格"}, "情感": {"value": "负面"}}
+
+
+def test_failed_rerun_keeps_previous_result():
+    previous = _ok({"情感": {"value": "正面"}, "主题": {"value": "物流"}})
+    assert merge_task_results(previous, FAILED, ["主题"], ALL_COLUMNS) is previous
+    assert merge_task_results(None, FAILED, ["主题"], ALL_COLUMNS) is FAILED
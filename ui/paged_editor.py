@@ -0,0 +1,121 @@
+# table_labeling_tool/ui/paged_editor.py
+"""
+服务端分页的数据编辑器：分页、翻页与排序都在服务端完成，每次重跑只把当前页序列化发送到浏览器
+(st.data_editor 会把传入的整个 DataFrame 转为 Arrow 发送)。当前页的编辑按变更记录写回主数据表。
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from ui.ui_utils import mark_data_changed, refresh_data_editor
+
+PAGE_SIZES = [50, 100, 200, 500]
+NO_SORT = "(原始顺序)"
+
+def page_controls(total_rows, key, page_sizes=PAGE_SIZES):
+    """每页行数与页码控件，返回当前页的行位置范围 [start, stop)。"""
+    page_col1, page_col2 = st.columns([1, 1])
+    with page_col1:
+        page_size = st.selectbox("每页行数", page_sizes, index=1, key=f"{key}_page_size")
+    page_count = max(1, -(-total_rows // page_size))
+    page_key = f"{key}_page_no"
+    if st.session_state.get(page_key, 1) > page_count: # 搜索结果变少或每页行数变大后，原页码可能超出范围
+        st.session_state[page_key] = page_count
+    with page_col2:
+        page_no = st.number_input("页码", min_value=1, max_value=page_count, step=1, key=page_key)
+    start = (int(page_no) - 1) * page_size
+    st.caption(f"第 {int(page_no)}/{page_count} 页，共 {total_rows} 行。")
+    return start, min(start + page_size, total_rows)
+
+def _sort_order(df, sort_column, descending, key):
+    """按某列排序后的行位置顺序，按 (data_version, 列, 方向) 缓存，翻页或搜索时不再重新排序。"""
+    cache_key = (st.session_state.get('data_version', 0), sort_column, descending)
+    cache_name = f"_{key}_sort_cache"
+    cached = st.session_state.get(cache_name)
+    if cached is None or cached['key'] != cache_key:
+        values = df[sort_column].reset_index(drop=True)
+        try:
+            sorted_values = values.sort_values(ascending=not descending, kind='stable', na_position='last')
+        except TypeError: # 混合类型的列按字符串排序
+            sorted_values = values.astype(str).sort_values(ascending=not descending, kind='stable')
+        cached = {'key': cache_key, 'order': sorted_values.index.to_numpy()}
+        st.session_state[cache_name] = cached
+    return cached['order']
+
+def _apply_editor_changes(page_df, edited_df, changes):
+    """
+    按 st.data_editor 的变更记录 (edited_rows / added_rows / deleted_rows，行号为页内位置)
+    把当前页的修改写回 st.session_state.df，只处理改动的单元格与行，不比较或复制整表：
+    修改的单元格与删除的行原地更新，新增的行追加到主表末尾 (整数索引时重新编号，避免与其他页的行索引重复)。
+    返回是否有修改。
+    """
+    edited_rows = changes.get('edited_rows') or {}
+    added_rows = changes.get('added_rows') or []
+    deleted_rows = changes.get('deleted_rows') or []
+    if not (edited_rows or added_rows or deleted_rows):
+        return False
+    df = st.session_state.df
+
+    # 单元格的新值取自 edited_df (已由 Streamlit 转换为列的类型)，按列批量写回
+    changed_cells = {}
+    for row_pos, row_changes in edited_rows.items():
+        row_label = page_df.index[int(row_pos)]
+        if row_label not in edited_df.index: # 同一行随后又被删除
+            continue
+        for col in row_changes:
+            if col in df.columns:
+                changed_cells.setdefault(col, []).append(row_label)
+    for col, row_labels in changed_cells.items():
+        new_values = edited_df.loc[row_labels, col].to_numpy()
+        try:
+            df.loc[row_labels, col] = new_values
+        except (TypeError, ValueError): # 新值与列类型不兼容 (如在整数列中填入文本)，改为 object 列
+            df[col] = df[col].astype(object)
+            df.loc[row_labels, col] = new_values
+
+    if deleted_rows:
+        df.drop(index=page_df.index[[int(row_pos) for row_pos in deleted_rows]], inplace=True)
+    if added_rows:
+        added_df = edited_df[~edited_df.index.isin(page_df.index)]
+        if pd.api.types.is_integer_dtype(df.index.dtype):
+            next_label = int(df.index.max()) + 1 if len(df) > 0 else 0
+            added_df = added_df.set_axis(pd.RangeIndex(next_label, next_label + len(added_df)))
+        elif added_df.index.isin(df.index).any():
+            st.warning("新增行的索引与已有行重复，已跳过这些行。")
+            added_df = added_df[~added_df.index.isin(df.index)]
+        if len(added_df) > 0:
+            st.session_state.df = pd.concat([df, added_df.reindex(columns=df.columns)])
+
+    # 只修改了单元格时，搜索索引只需重建改动的列；增删行后行位置变化，需整体重建
+    mark_data_changed(changed_columns=None if (added_rows or deleted_rows) else list(changed_cells))
+    # 变更已写回：换新的编辑器 key，清空其变更记录 (否则当前页数据不变时，同一记录会在每次重跑时重复应用)
+    refresh_data_editor()
+    return True
+
+def paged_data_editor(df, key, row_mask=None):
+    """
+    分页编辑 df (即 st.session_state.df)。row_mask 为搜索结果的行位置布尔掩码，None 表示显示全部行。
+    排序与分页在服务端完成，只有当前页传给 st.data_editor。返回是否有修改写回了主数据表。
+    """
+    sort_col1, sort_col2 = st.columns([3, 1])
+    with sort_col1:
+        sort_column = st.selectbox("排序列", [NO_SORT] + list(df.columns), key=f"{key}_sort_column")
+    with sort_col2:
+        descending = st.checkbox("降序", key=f"{key}_sort_desc")
+
+    if sort_column == NO_SORT or sort_column not in df.columns:
+        positions = np.arange(len(df)) if row_mask is None else np.flatnonzero(row_mask)
+    else:
+        order = _sort_order(df, sort_column, descending, key)
+        positions = order if row_mask is None else order[row_mask[order]]
+
+    start, stop = page_controls(len(positions), key)
+    page_df = df.iloc[positions[start:stop]]
+    editor_key = f"{key}_{st.session_state.get('data_editor_key', 0)}"
+    edited_df = st.data_editor(
+        page_df,
+        num_rows="dynamic",
+        use_container_width=True,
+        key=editor_key,
+        height=400
+    )
+    return _apply_editor_changes(page_df, edited_df, st.session_state.get(editor_key) or {})
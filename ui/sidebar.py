@@ -8,8 +8,14 @@ from core.config_manager import (
     load_task_configs, save_task_configs, save_current_task_config,
     check_data_file_exists
 )
-from core.data_handler import load_data_from_path, persist_dataframe_on_server
-from ui.ui_utils import refresh_task_form, refresh_data_editor
+from core.data_handler import persist_dataframe_on_server
+from core.client_pool import DEFAULT_POOL_SIZE, DEFAULT_REQUEST_TIMEOUT, is_http2_available
+from core.async_engine import DEFAULT_MAX_IN_FLIGHT
+from core.batch_labeling import DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE
+from core.labeling_runner import ENGINE_ASYNC, ENGINE_THREAD, LABELING_ENGINES
+from core.response_cache import DEFAULT_CACHE_MAX_ENTRIES, DEFAULT_CACHE_TTL_DAYS, get_response_cache
+from core.structured_output import STRUCTURED_OUTPUT_MODES
+from ui.ui_utils import refresh_task_form, refresh_data_editor, mark_data_changed, set_current_data_from_path
 
 def display_sidebar():
     """显示侧边栏UI元素，用于API和任务配置。"""
@@ -63,7 +69,8 @@ def display_sidebar():
                             data_path_to_save = None
                     
                     try:
-                        save_current_task_config(current_task_name_input, data_path_to_save)
+                        save_current_task_config(current_task_name_input, st.session_state, data_path_to_save)
+                        st.session_state.current_task_flow_name = current_task_name_input
                         st.success(f"任务流程配置 '{current_task_name_input}' 已保存！")
                         st.rerun() 
                     except Exception as e:
@@ -123,24 +130,31 @@ def display_sidebar():
                                 st.session_state.concurrent_workers = task_to_load.get('concurrent_workers', st.session_state.concurrent_workers)
                                 st.session_state.retry_attempts = task_to_load.get('retry_attempts', st.session_state.retry_attempts)
                                 st.session_state.request_delay = task_to_load.get('request_delay', st.session_state.request_delay)
+                                st.session_state.labeling_engine = task_to_load.get('labeling_engine', st.session_state.labeling_engine)
+                                st.session_state.max_in_flight = task_to_load.get('max_in_flight', st.session_state.max_in_flight)
+                                st.session_state.batch_size = task_to_load.get('batch_size', st.session_state.batch_size)
+                                st.session_state.dedup_rows = task_to_load.get('dedup_rows', st.session_state.dedup_rows)
+                                st.session_state.response_cache_enabled = task_to_load.get('response_cache_enabled', st.session_state.response_cache_enabled)
                                 st.session_state.ordered_input_cols_for_prompt = task_to_load.get('ordered_input_cols_for_prompt', [])
+                                st.session_state.current_task_flow_name = selected_hist_task_name
                                 
                                 st.session_state.df = None 
+                                st.session_state.arrow_dataset = None
                                 st.session_state.current_data_path = None
                                 st.session_state._uploaded_file_name_for_download_ = None
                                 if 'last_uploaded_file_details' in st.session_state: 
                                     del st.session_state.last_uploaded_file_details
 
                                 if can_load_data_from_path and data_path_from_config:
-                                    df_loaded = load_data_from_path(data_path_from_config)
-                                    if df_loaded is not None:
-                                        st.session_state.df = df_loaded
+                                    data_loaded = set_current_data_from_path(data_path_from_config)
+                                    if data_loaded is not None:
                                         st.session_state.current_data_path = data_path_from_config
                                         st.session_state._uploaded_file_name_for_download_ = Path(data_path_from_config).name
                                         st.success(f"数据文件 '{Path(data_path_from_config).name}' 已成功加载。")
                                     else:
                                         st.error(f"尝试从路径 '{Path(data_path_from_config).name}' 加载数据失败。请在“数据加载”页手动操作。")
                                 
+                                mark_data_changed()
                                 st.success(f"任务流程 '{selected_hist_task_name}' 加载成功！")
                                 refresh_task_form()
                                 refresh_data_editor()
@@ -190,9 +204,58 @@ def display_sidebar():
             temperature_val = st.slider("Temperature", 0.0, 2.0, float(current_api_conf.get('temperature', 0.05)), 0.01, key="sidebar_temperature")
             max_tokens_val = st.number_input("最大Token数 (响应)", 50, 32000, int(current_api_conf.get('max_tokens', 1500)), 50, key="sidebar_max_tokens")
 
+            structured_mode_options = list(STRUCTURED_OUTPUT_MODES)
+            current_structured_mode = current_api_conf.get('structured_output', 'auto')
+            structured_output_val = st.selectbox(
+                "结构化输出 (response_format)", structured_mode_options,
+                index=structured_mode_options.index(current_structured_mode) if current_structured_mode in structured_mode_options else 0,
+                format_func=lambda mode: STRUCTURED_OUTPUT_MODES[mode],
+                key="sidebar_structured_output",
+                help="按打标任务生成输出的 JSON Schema 随请求发送，模型只能返回符合结构的JSON。"
+                     "自动：服务商不支持时依次降级为 JSON 模式、关闭，并记住该端点的支持情况。"
+            )
+
+            st.caption("模型价格 (每百万Token，用于估算运行费用；均为0时不估算)")
+            model_prices = dict(current_api_conf.get('model_prices') or {})
+            current_price = model_prices.get(model_name_val) or {}
+            col_price1, col_price2, col_price3 = st.columns(3)
+            with col_price1:
+                input_price_val = st.number_input("输入", 0.0, 10000.0, float(current_price.get('input', 0.0)), 0.1, key="sidebar_price_input")
+            with col_price2:
+                cached_price_val = st.number_input("缓存命中输入", 0.0, 10000.0, float(current_price.get('cached_input') or 0.0), 0.1, key="sidebar_price_cached_input", help="为0时按输入价格计算。")
+            with col_price3:
+                output_price_val = st.number_input("输出", 0.0, 10000.0, float(current_price.get('output', 0.0)), 0.1, key="sidebar_price_output")
+            if input_price_val or cached_price_val or output_price_val:
+                model_prices[model_name_val] = {'input': input_price_val, 'cached_input': cached_price_val or None, 'output': output_price_val}
+            else:
+                model_prices.pop(model_name_val, None)
+
+            st.caption("连接设置 (同一API Key和Base URL的所有请求共享连接池)")
+            col_conn1, col_conn2 = st.columns(2)
+            with col_conn1:
+                pool_size_val = st.number_input("连接池大小", 1, 500, int(current_api_conf.get('pool_size', DEFAULT_POOL_SIZE)), 1, key="sidebar_pool_size", help="保持长连接的最大连接数，建议不小于并发线程数。")
+            with col_conn2:
+                request_timeout_val = st.number_input("请求超时(秒)", 5, 1200, int(current_api_conf.get('request_timeout', DEFAULT_REQUEST_TIMEOUT)), 5, key="sidebar_request_timeout")
+            http2_val = st.checkbox(
+                "启用HTTP/2 (如可用)",
+                value=bool(current_api_conf.get('http2', True)),
+                key="sidebar_http2",
+                help="需要安装 h2 包 (pip install httpx[http2])；未安装时自动使用HTTP/1.1。" + ("" if is_http2_available() else " 当前环境未安装 h2。")
+            )
+
+            st.caption("速率限制 (所有线程/协程共享；0 表示不预设上限，按服务商返回的 x-ratelimit-* 响应头自动调整)")
+            col_rl1, col_rl2 = st.columns(2)
+            with col_rl1:
+                rpm_limit_val = st.number_input("每分钟请求数 (RPM)", 0, 1000000, int(current_api_conf.get('rpm_limit', 0)), 10, key="sidebar_rpm_limit")
+            with col_rl2:
+                tpm_limit_val = st.number_input("每分钟Token数 (TPM)", 0, 100000000, int(current_api_conf.get('tpm_limit', 0)), 1000, key="sidebar_tpm_limit")
+
             st.session_state.api_config.update({
                 'api_key': api_key_val, 'base_url': base_url_val, 'model_name': model_name_val,
-                'temperature': temperature_val, 'max_tokens': max_tokens_val
+                'temperature': temperature_val, 'max_tokens': max_tokens_val, 'structured_output': structured_output_val,
+                'model_prices': model_prices,
+                'pool_size': pool_size_val, 'request_timeout': request_timeout_val, 'http2': http2_val,
+                'rpm_limit': rpm_limit_val, 'tpm_limit': tpm_limit_val
             })
             
             api_config_tag_to_save = st.text_input("为此API配置命名以便永久保存", placeholder="例如：MyGPT4-Config", key="sidebar_api_config_tag").strip()
@@ -224,11 +287,29 @@ def display_sidebar():
                             st.warning(f"再次点击确认删除API配置 '{selected_api_config_name}'。")
         
         with st.expander("⚙️ 执行参数配置", expanded=False):
-            st.session_state.concurrent_workers = st.slider(
-                "并发线程数", 1, 20, 
-                st.session_state.get('concurrent_workers', 4), 
-                key="sidebar_workers"
+            engine_options = list(LABELING_ENGINES.keys())
+            current_engine = st.session_state.get('labeling_engine', ENGINE_THREAD)
+            st.session_state.labeling_engine = st.radio(
+                "全量标注执行引擎",
+                options=engine_options,
+                index=engine_options.index(current_engine) if current_engine in engine_options else 0,
+                format_func=lambda x: LABELING_ENGINES[x],
+                horizontal=True,
+                help="多线程：每个线程同一时间处理一行。异步：在单个事件循环上同时发出大量请求，适合速率限制较高的服务商。",
+                key="sidebar_labeling_engine"
             )
+            if st.session_state.labeling_engine == ENGINE_ASYNC:
+                st.session_state.max_in_flight = st.slider(
+                    "最大在途请求数 (异步引擎)", 1, 1000,
+                    st.session_state.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT),
+                    key="sidebar_max_in_flight"
+                )
+            else:
+                st.session_state.concurrent_workers = st.slider(
+                    "并发线程数", 1, 20, 
+                    st.session_state.get('concurrent_workers', 4), 
+                    key="sidebar_workers"
+                )
             st.session_state.retry_attempts = st.slider(
                 "失败重试次数", 0, 5, 
                 st.session_state.get('retry_attempts', 3), 
@@ -238,4 +319,39 @@ def display_sidebar():
                 "请求间隔(秒)", 0.0, 5.0, 
                 st.session_state.get('request_delay', 0.2), 0.1, 
                 key="sidebar_delay"
-            )
\ No newline at end of file
+            )
+            st.session_state.batch_size = st.slider(
+                "每个请求标注的行数 (批量标注)", 1, MAX_BATCH_SIZE,
+                int(st.session_state.get('batch_size', DEFAULT_BATCH_SIZE)),
+                help="大于1时，全量标注把多行数据打包进一个请求，共用同一份任务指令，可显著减少请求数和输入Token。模型漏掉或编号不符的行会自动逐行重试。试标注始终逐行请求。",
+                key="sidebar_batch_size"
+            )
+            st.session_state.dedup_rows = st.checkbox(
+                "合并输入相同的行",
+                value=st.session_state.get('dedup_rows', True),
+                help="全量标注时，Prompt输入列取值完全相同的行只发送一次请求，结果复制给所有相同的行。",
+                key="sidebar_dedup_rows"
+            )
+
+            st.divider()
+            st.session_state.response_cache_enabled = st.checkbox(
+                "启用响应缓存",
+                value=st.session_state.get('response_cache_enabled', True),
+                help="相同模型、参数和填充后Prompt的请求直接复用之前成功解析的结果，不再调用API。缓存保存在本地SQLite文件中。",
+                key="sidebar_response_cache_enabled"
+            )
+            if st.session_state.response_cache_enabled:
+                col_c1, col_c2 = st.columns(2)
+                st.session_state.response_cache_ttl_days = col_c1.number_input(
+                    "缓存有效期(天)", 0, 3650,
+                    int(st.session_state.get('response_cache_ttl_days', DEFAULT_CACHE_TTL_DAYS)), 1,
+                    help="0 表示永不过期。", key="sidebar_response_cache_ttl"
+                )
+                st.session_state.response_cache_max_entries = col_c2.number_input(
+                    "最大缓存条数", 0, 10000000,
+                    int(st.session_state.get('response_cache_max_entries', DEFAULT_CACHE_MAX_ENTRIES)), 1000,
+                    help="0 表示不限制。超出时淘汰最久未使用的条目。", key="sidebar_response_cache_max_entries"
+                )
+                if st.button("🧹 清空响应缓存", key="sidebar_clear_response_cache_btn"):
+                    get_response_cache().clear()
+                    st.success("响应缓存已清空。")
\ No newline at end of file
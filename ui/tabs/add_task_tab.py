@@ -1,18 +1,19 @@
 # table_labeling_tool/ui/tabs/add_task_tab.py
 import streamlit as st
 import time
-from ui.ui_utils import refresh_task_form
+from ui.ui_utils import current_data, refresh_task_form
 
 def display_add_task_tab():
     """显示添加和管理打标任务定义的UI。"""
     st.header("🎯 2. 定义打标任务")
 
-    if st.session_state.get('df') is None:
+    data = current_data()
+    if data is None:
         st.warning("请先在“1. 数据加载与编辑”页面上传或加载数据，以便选择输入列。")
         return
 
-    df_columns = list(st.session_state.df.columns) if st.session_state.df is not None else []
-    st.info(f"当前数据: {len(st.session_state.df)}行, {len(df_columns)}列。" if st.session_state.df is not None else "无数据加载。")
+    df_columns = list(data.columns)
+    st.info(f"当前数据: {len(data)}行, {len(df_columns)}列。")
 
     form_key = f"add_task_form_{st.session_state.get('task_form_key', 0)}"
     with st.form(key=form_key):
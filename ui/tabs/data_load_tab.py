@@ -2,8 +2,27 @@
 import streamlit as st
 import pandas as pd
 from pathlib import Path
-from core.data_handler import load_data_from_uploaded_file, save_dataframe_to_bytes, load_data_from_path
-from ui.ui_utils import refresh_data_editor
+from ui.ui_utils import (
+    refresh_data_editor, mark_data_changed, mark_results_changed, export_download_button, current_data,
+    set_current_data_from_path, load_data_from_uploaded_file, table_search_index
+)
+from ui.paged_editor import page_controls, paged_data_editor
+
+def _display_dataset_view(dataset):
+    """大数据集 (内存映射的 Parquet) 的只读分页预览：每次只读取当前页。"""
+    st.subheader("数据预览 (只读)")
+    st.caption(f"共 {len(dataset)} 行, {len(dataset.columns)} 列。")
+    st.info("ℹ️ 该文件较大，已以内存映射方式只读打开：只读取当前页的数据，标注时只读取Prompt用到的列。如需编辑，请先处理为较小的文件后上传。")
+    start, stop = page_controls(len(dataset), "dataset")
+    st.dataframe(dataset.read_page(start, stop), use_container_width=True, height=400)
+
+    st.subheader("下载数据")
+    dl_format = st.selectbox("选择下载格式", ['csv', 'parquet', 'jsonl', 'xlsx'], key="dl_dataset_format")
+    fn_stem = Path(st.session_state.get('_uploaded_file_name_for_download_') or dataset.path.name).stem
+    export_download_button(
+        "dataset_copy", dataset.export, (st.session_state.get('data_version', 0),), dl_format,
+        f"{fn_stem}.{dl_format}", f"📥 下载数据 ({dl_format.upper()})", key="dl_dataset_btn"
+    )
 
 def display_data_load_tab():
     """Displays the UI for data loading, preview, and basic editing."""
@@ -17,11 +36,10 @@ def display_data_load_tab():
             if 'last_uploaded_file_details' in st.session_state:
                 del st.session_state.last_uploaded_file_details
             
-            df = load_data_from_path(st.session_state.current_data_path)
-            if df is not None:
-                st.session_state.df = df
+            data = set_current_data_from_path(st.session_state.current_data_path)
+            if data is not None:
                 st.session_state._uploaded_file_name_for_download_ = Path(st.session_state.current_data_path).name
-                st.success(f"从路径 '{Path(st.session_state.current_data_path).name}' 重新加载数据成功！共 {len(df)} 行，{len(df.columns)} 列。")
+                st.success(f"从路径 '{Path(st.session_state.current_data_path).name}' 重新加载数据成功！共 {len(data)} 行，{len(data.columns)} 列。")
                 refresh_data_editor()
                 st.rerun() # Rerun to refresh the entire UI after reload
             else:
@@ -53,11 +71,14 @@ def display_data_load_tab():
             
             if df is not None:
                 st.session_state.df = df
+                st.session_state.arrow_dataset = None
+                mark_data_changed()
                 st.session_state.current_data_path = None # Clear path as it's a new upload
                 st.session_state.labeling_progress = { # Reset labeling progress
                     'is_running': False, 'completed': 0, 'total': 0,
                     'results': {}, 'is_test_run': False
                 }
+                mark_results_changed()
                 st.success(f"成功加载数据: '{uploaded_file.name}' ({len(df)}行, {len(df.columns)}列)")
                 refresh_data_editor() # Refresh data editor
                 
@@ -81,54 +102,35 @@ def display_data_load_tab():
 
     # --- Data Preview and Editing Section (rest of the code remains unchanged) ---
     df_display = st.session_state.get('df')
+    arrow_dataset = st.session_state.get('arrow_dataset')
 
-    if df_display is not None and isinstance(df_display, pd.DataFrame):
+    if df_display is None and arrow_dataset is not None:
+        _display_dataset_view(arrow_dataset)
+    elif df_display is not None and isinstance(df_display, pd.DataFrame):
         st.subheader("数据预览与编辑")
         st.caption(f"共 {len(df_display)} 行, {len(df_display.columns)} 列。")
 
         search_col1, search_col2 = st.columns([3, 1])
         with search_col1:
-            search_term = st.text_input("🔍 搜索内容 (不区分大小写)", key="data_search_term").strip()
+            search_term = st.text_input("🔍 搜索内容 (不区分大小写，按字面匹配)", key="data_search_term").strip()
         with search_col2:
             search_in_column = "全部列" 
             if not df_display.empty:
                 search_in_column = st.selectbox("在指定列中搜索", ["全部列"] + list(df_display.columns), key="data_search_column")
         
-        active_df_view = df_display.copy()
+        row_mask = None
         if search_term:
             try:
-                if search_in_column == "全部列":
-                    mask = active_df_view.astype(str).apply(lambda x: x.str.contains(search_term, case=False, na=False)).any(axis=1)
-                else:
-                    mask = active_df_view[search_in_column].astype(str).str.contains(search_term, case=False, na=False)
-                active_df_view = active_df_view[mask]
-                st.caption(f"搜索结果: {len(active_df_view)} 行匹配。")
+                search_column = None if search_in_column == "全部列" else search_in_column
+                row_mask = table_search_index(df_display).search(search_term, search_column)
+                st.caption(f"搜索结果: {int(row_mask.sum())} 行匹配。")
             except Exception as e:
                 st.error(f"搜索时出错: {e}")
 
-        st.info("ℹ️ 可直接在下方表格中编辑数据。修改会实时反映。使用表格上方的 +/- 按钮添加/删除行。")
-        editor_key = f"data_editor_{st.session_state.get('data_editor_key', 0)}"
-        edited_df_view = st.data_editor(
-            active_df_view,
-            num_rows="dynamic",
-            use_container_width=True,
-            key=editor_key,
-            height=400
-        )
-
-        if not active_df_view.equals(edited_df_view):
-            if search_term: 
-                st.warning("在搜索结果中编辑数据：修改将尝试应用回原始数据框。复杂操作（如在搜索视图中添加/删除行）建议清除搜索后进行。")
-                try:
-                    temp_edited_df = edited_df_view.copy()
-                    temp_edited_df.index = active_df_view.index[:len(temp_edited_df)]
-                    st.session_state.df.update(temp_edited_df)
-                    st.success("更改已尝试应用到主数据表。")
-                except Exception as e:
-                    st.error(f"更新搜索结果中的数据时出错: {e}。建议清除搜索后重试。")
-            else: 
-                st.session_state.df = edited_df_view.copy()
-                st.success("更改已保存到当前会话数据。")
+        st.info("ℹ️ 可直接在下方表格中编辑当前页的数据，修改会按行索引保存到主数据表。使用表格上方的 +/- 按钮添加/删除行。排序与翻页不会改变数据本身。")
+        if paged_data_editor(df_display, "data_editor", row_mask):
+            st.toast("更改已保存到当前会话数据。")
+            st.rerun() # 以修改后的数据重新渲染当前页
 
         st.divider()
         st.subheader("列操作")
@@ -139,6 +141,7 @@ def display_data_load_tab():
                     confirm_key_cols_del = 'confirm_delete_cols_main_tab'
                     if st.session_state.get(confirm_key_cols_del, False):
                         st.session_state.df = st.session_state.df.drop(columns=cols_to_delete)
+                        mark_data_changed()
                         st.success(f"已删除列: {', '.join(cols_to_delete)}")
                         st.session_state[confirm_key_cols_del] = False
                         refresh_data_editor()
@@ -157,22 +160,18 @@ def display_data_load_tab():
             if st.session_state.get('_uploaded_file_name_for_download_'):
                 fn_stem = Path(st.session_state['_uploaded_file_name_for_download_']).stem + "_edited"
             
-            file_bytes = save_dataframe_to_bytes(st.session_state.df, dl_format)
-            if file_bytes:
-                st.download_button(
-                    f"📥 下载编辑后数据 ({dl_format.upper()})",
-                    file_bytes,
-                    f"{fn_stem}.{dl_format}",
-                    key="dl_edited_data_btn"
-                )
+            export_download_button(
+                "edited_data", st.session_state.df, (st.session_state.get('data_version', 0),), dl_format,
+                f"{fn_stem}.{dl_format}", f"📥 下载编辑后数据 ({dl_format.upper()})", key="dl_edited_data_btn"
+            )
         else:
             st.caption("无数据可下载。")
 
-    elif uploaded_file is None and st.session_state.get('df') is None:
+    elif uploaded_file is None and current_data() is None:
         st.info("请上传一个数据文件开始。")
     
     # --- 新增：引导到下一步 ---
-    if st.session_state.get('df') is not None:
+    if current_data() is not None:
         st.success("🎉 数据已成功加载或处于可编辑状态！")
         st.info("下一步：请前往 **🎯 2. 定义打标任务** 标签页，开始定义您的第一个打标任务。")
         st.markdown("---") # 可选的分隔线
\ No newline at end of file
@@ -3,13 +3,44 @@ import streamlit as st
 import pandas as pd
 import time
 from pathlib import Path
-from core.data_handler import save_dataframe_to_bytes
+from core.arrow_dataset import ArrowDataset
+from core.result_merge import labeling_output_columns, merge_labeling_results
+from ui.ui_utils import current_data, display_run_metrics, export_download_button
+
+def _results_version_key(labeling_tasks):
+    """合并结果表的版本：数据、标注结果或输出列任一变化都会改变。"""
+    return (
+        st.session_state.get('data_version', 0),
+        st.session_state.get('results_version', 0),
+        tuple(sorted(labeling_output_columns(labeling_tasks)))
+    )
+
+def _merged_results(original_df, labeling_results_map, labeling_tasks):
+    """
+    合并后的结果表，缓存在会话中：数据、结果与输出列都未变化时 (data_version / results_version 不变)，
+    重跑页面 (如切换下载格式) 不再重新合并。
+    """
+    cache_key = _results_version_key(labeling_tasks)
+    cached = st.session_state.get('_merged_results_cache')
+    if cached is None or cached['key'] != cache_key:
+        result_df, skipped_indices = merge_labeling_results(original_df, labeling_results_map, labeling_tasks)
+        cached = {'key': cache_key, 'result_df': result_df, 'skipped': skipped_indices}
+        st.session_state._merged_results_cache = cached
+    return cached['result_df'], cached['skipped']
+
+def _dataset_results(dataset, labeling_results_map, labeling_tasks):
+    """大数据集模式：只合并最后一页用于预览，下载时逐页合并写出。"""
+    preview_df = dataset.merge_results_page(len(dataset) - 10, len(dataset), labeling_results_map, labeling_tasks)
+    skipped_indices = list(pd.Index(list(labeling_results_map.keys())).difference(dataset.index))
+    def write_export(path, format_type):
+        return dataset.export_merged(path, format_type, labeling_results_map, labeling_tasks)
+    return preview_df, skipped_indices, write_export
 
 def display_download_tab():
     """显示下载已标注数据的UI。"""
     st.header("📥 5. 下载与总结")
 
-    original_df = st.session_state.get('df')
+    original_df = current_data()
     if original_df is None:
         st.warning("原始数据尚未加载。请先在“1. 数据加载与编辑”页面加载数据。")
         return
@@ -20,43 +51,17 @@ def display_download_tab():
         return
 
     try:
-        result_df = original_df.copy()
-        defined_output_cols_set = set()
-        for task_def in st.session_state.get('labeling_tasks', []):
-            out_col = task_def.get('output_column')
-            if out_col:
-                defined_output_cols_set.add(out_col)
-                if task_def.get('need_reason', False):
-                    defined_output_cols_set.add(f"{out_col}_理由")
-        
-        for col_n in defined_output_cols_set:
-            if col_n not in result_df.columns:
-                result_df[col_n] = pd.NA
-
-        for original_row_idx, proc_output in labeling_results_map.items():
-            if original_row_idx not in result_df.index:
-                st.warning(f"结果中的行索引 {original_row_idx} 在原始数据中未找到，跳过。")
-                continue
-
-            if proc_output.get('success') and isinstance(proc_output.get('result'), dict):
-                llm_json_output = proc_output['result']
-                for task_key, labeled_val in llm_json_output.items():
-                    if task_key in result_df.columns:
-                        if isinstance(labeled_val, dict): # {value, reason} 结构
-                            result_df.loc[original_row_idx, task_key] = labeled_val.get('value', pd.NA)
-                            reason_col = f"{task_key}_理由"
-                            if reason_col in result_df.columns:
-                                result_df.loc[original_row_idx, reason_col] = labeled_val.get('reason', pd.NA)
-                        else: #直接值
-                            result_df.loc[original_row_idx, task_key] = labeled_val
-            else: # 标注失败或结果格式错误
-                err_msg_short = f"错误: {proc_output.get('error', '未知错误')[:60]}"
-                for col_n_fill_err in defined_output_cols_set:
-                     if pd.isna(result_df.loc[original_row_idx, col_n_fill_err]): # 仅填充尚未被成功任务填充的列
-                        result_df.loc[original_row_idx, col_n_fill_err] = err_msg_short
+        labeling_tasks = st.session_state.get('labeling_tasks', [])
+        if isinstance(original_df, ArrowDataset):
+            preview_df, skipped_indices, export_data = _dataset_results(original_df, labeling_results_map, labeling_tasks)
+        else:
+            result_df, skipped_indices = _merged_results(original_df, labeling_results_map, labeling_tasks)
+            preview_df, export_data = result_df.tail(10), result_df
+        for skipped_idx in skipped_indices:
+            st.warning(f"结果中的行索引 {skipped_idx} 在原始数据中未找到，跳过。")
         
         st.subheader("标注结果预览 (最后10行)")
-        st.dataframe(result_df.tail(10), use_container_width=True)
+        st.dataframe(preview_df, use_container_width=True)
 
         st.subheader("下载选项")
         dl_fmt = st.selectbox("选择下载格式", ['xlsx', 'csv', 'parquet', 'jsonl'], key="final_dl_fmt")
@@ -68,14 +73,10 @@ def display_download_tab():
         if orig_fn: fn_stem_dl = Path(orig_fn).stem + "_labeled"
         
         final_fn_dl = f"{fn_stem_dl}_{ts}.{dl_fmt}"
-        file_bytes_dl = save_dataframe_to_bytes(result_df, dl_fmt)
-
-        if file_bytes_dl:
-            st.download_button(
-                f"📥 下载标注结果 ({dl_fmt.upper()})", file_bytes_dl, final_fn_dl,
-                type="primary", key="dl_final_btn"
-            )
-        else: st.error(f"无法生成 {dl_fmt.upper()} 文件供下载。")
+        export_download_button(
+            "labeled_output", export_data, _results_version_key(labeling_tasks), dl_fmt,
+            final_fn_dl, f"📥 下载标注结果 ({dl_fmt.upper()})", key="dl_final_btn", type="primary"
+        )
 
         st.subheader("标注统计总结")
         total_df_rows = len(original_df)
@@ -89,6 +90,11 @@ def display_download_tab():
         stat_cols_dl[2].metric("成功标注行数", successful_c)
         stat_cols_dl[3].metric("标注成功率", f"{success_r:.1f}%")
 
+        run_metrics = st.session_state.get('labeling_progress', {}).get('run_metrics')
+        if run_metrics and run_metrics.get('calls'):
+            st.subheader("API用量与费用 (最近一次运行)")
+            display_run_metrics(run_metrics)
+
     except Exception as e:
         st.error(f"准备下载数据或统计时发生错误: {e}")
         st.exception(e)
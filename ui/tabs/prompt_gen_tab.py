@@ -1,7 +1,15 @@
 # table_labeling_tool/ui/tabs/prompt_gen_tab.py
 import streamlit as st
 from core.openai_caller import generate_labeling_prompt_template
-from core.utils import parse_ai_generated_prompt_template, extract_placeholder_columns_from_final_prompt
+from core.utils import parse_ai_generated_prompt_template, extract_placeholder_columns_from_final_prompt, prompt_input_columns
+from ui.ui_utils import current_data
+
+def _update_final_user_prompt(template_str, labeling_tasks):
+    """根据JSON模板构建最终用户Prompt；构建成功时同时记录填充Prompt用的有序输入列。"""
+    final_prompt = parse_ai_generated_prompt_template(template_str, labeling_tasks)
+    st.session_state.final_user_prompt = final_prompt
+    if final_prompt != template_str: # 解析失败时返回原始模板，保留之前的有序输入列
+        st.session_state.ordered_input_cols_for_prompt = prompt_input_columns(labeling_tasks)
 
 def display_prompt_generation_tab():
     """显示生成和编辑AI Prompt模板的UI。"""
@@ -17,7 +25,7 @@ def display_prompt_generation_tab():
         st.warning("请先在侧边栏配置API密钥才能生成Prompt模板。")
         return
     # 数据加载不是生成模板的硬性要求，但对于校验占位符是必要的
-    if st.session_state.get('df') is None:
+    if current_data() is None:
         st.info("提示：数据尚未加载。加载数据后可在此页面校验Prompt中的列名。")
 
     col_act1, col_act2 = st.columns(2)
@@ -30,9 +38,7 @@ def display_prompt_generation_tab():
                         st.session_state.generated_prompt_template = ai_json_template
                         st.success("AI成功生成了Prompt模板！请在下方查看和编辑。")
                         # 立即尝试解析并构建最终用户Prompt
-                        st.session_state.final_user_prompt = parse_ai_generated_prompt_template(
-                            ai_json_template, labeling_tasks
-                        )
+                        _update_final_user_prompt(ai_json_template, labeling_tasks)
                         st.info("已尝试根据新模板构建最终用户Prompt，请检查下方预览。")
                     else:
                         st.error("AI未能生成Prompt模板，或返回为空。请检查API配置和错误信息（若有）。")
@@ -57,9 +63,7 @@ def display_prompt_generation_tab():
     if edited_template != st.session_state.get('generated_prompt_template'):
         st.session_state.generated_prompt_template = edited_template
         if edited_template.strip():
-            st.session_state.final_user_prompt = parse_ai_generated_prompt_template(
-                edited_template, labeling_tasks
-            )
+            _update_final_user_prompt(edited_template, labeling_tasks)
             st.info("JSON模板已修改，最终用户Prompt预览已更新。")
         else:
             st.session_state.final_user_prompt = "" # 清空预览
@@ -75,9 +79,9 @@ def display_prompt_generation_tab():
         with st.expander("👁️ 点击查看/隐藏最终用户Prompt预览", expanded=True):
             st.code(final_prompt_preview, language="markdown")
 
-        if st.session_state.get('df') is not None:
+        if current_data() is not None:
             st.subheader("✔️ Prompt占位符校验 (对照已加载数据)")
-            df_cols = list(st.session_state.df.columns)
+            df_cols = list(current_data().columns)
             placeholders = extract_placeholder_columns_from_final_prompt(final_prompt_preview)
             
             if not placeholders:
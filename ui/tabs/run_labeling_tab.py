@@ -1,25 +1,366 @@
 # table_labeling_tool/ui/tabs/run_labeling_tab.py
 import streamlit as st
 import pandas as pd
-import concurrent.futures
-import time
 import json # 用于显示结果
 from core.openai_caller import process_single_row
-from core.utils import extract_placeholder_columns_from_final_prompt
+from core.async_engine import DEFAULT_MAX_IN_FLIGHT
+from core.batch_labeling import iter_row_items
+from core.batch_api import (
+    BATCH_JOB_STATUS_LABELS, batch_job_has_results, cancel_batch_job, ensure_batch_polling, list_batch_jobs,
+    load_batch_job_results, refresh_batch_job, submit_batch_job
+)
+from core.job_manager import (
+    JOB_CANCELLED, JOB_CANCELLING, JOB_COMPLETED, JOB_FAILED, JOB_PAUSED, JOB_RUNNING, JOB_STATUS_LABELS,
+    get_job_manager
+)
+from core.labeling_runner import ENGINE_THREAD, LABELING_ENGINES
+from core.prompt_template import compile_prompt_template
+from core.result_merge import empty_output_indices, failed_result_indices
+from core.response_cache import get_response_cache
+from core.retry_policy import RetryPolicy
+from core.row_dedup import deduplicate_rows
+from core.structured_output import with_output_schema
+from core.run_journal import (
+    RunJournal, compute_data_fingerprint, count_journal_rows, find_flow_journals,
+    journal_path, load_journal_results, map_journal_results_to_index, read_journal_meta
+)
+from core.utils import build_task_subset_prompt, extract_placeholder_columns_from_final_prompt, prompt_input_columns
+from ui.ui_utils import current_data, display_run_metrics, labeling_input_frame, mark_results_changed
+
+RERUN_FAILED = "failed"
+RERUN_EMPTY = "empty"
+RERUN_ALL = "all"
+RERUN_SCOPES = {
+    RERUN_FAILED: "失败的行",
+    RERUN_EMPTY: "输出为空的行 (含失败与未标注的行)",
+    RERUN_ALL: "全部行",
+}
+
+def _session_response_cache():
+    """按侧边栏设置返回共享的响应缓存，未启用时返回 None。"""
+    if not st.session_state.get('response_cache_enabled', True):
+        return None
+    return get_response_cache(
+        st.session_state.get('response_cache_ttl_days', 30),
+        st.session_state.get('response_cache_max_entries', 200000)
+    )
+
+def _run_api_config():
+    """本次标注使用的API配置副本：附带按打标任务生成的输出 Schema (见 core.structured_output)。"""
+    return with_output_schema(st.session_state.api_config, st.session_state.get('labeling_tasks', []))
+
+def _model_prices():
+    """API配置中的模型价格表 {模型: {input, cached_input, output}} (每百万Token)，用于估算费用。"""
+    return st.session_state.get('api_config', {}).get('model_prices') or {}
+
+def _run_exec_config():
+    """全量标注使用的执行参数 (侧边栏“执行参数配置”)。"""
+    return {
+        'labeling_engine': st.session_state.get('labeling_engine', ENGINE_THREAD),
+        'concurrent_workers': st.session_state.concurrent_workers,
+        'max_in_flight': st.session_state.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT),
+        'retry_attempts': st.session_state.retry_attempts,
+        'request_delay': st.session_state.request_delay,
+        'batch_size': st.session_state.get('batch_size', 1),
+    }
+
+def _data_fingerprint(current_df, ordered_keys, final_prompt, model_name):
+    """断点记录使用的数据指纹，按 data_version 缓存：数据未修改时不再对输入列重新计算哈希。"""
+    cache_key = (st.session_state.get('data_version', 0), tuple(ordered_keys), final_prompt, model_name)
+    cached = st.session_state.get('_data_fingerprint_cache')
+    if cached is None or cached['key'] != cache_key:
+        cached = {'key': cache_key, 'fingerprint': compute_data_fingerprint(current_df, ordered_keys, final_prompt, model_name)}
+        st.session_state._data_fingerprint_cache = cached
+    return cached['fingerprint']
+
+def _record_cache_counters(response_cache):
+    """把本次运行的缓存命中/未命中次数 (response_cache 为本次运行的 scoped 视图) 记录到 labeling_progress 中。"""
+    if response_cache is None:
+        return
+    hits, misses = response_cache.counters()
+    st.session_state.labeling_progress['cache_hits'] = hits
+    st.session_state.labeling_progress['cache_misses'] = misses
+
+def _finish_full_run_job(job):
+    """后台任务结束后，把结果与统计写回 labeling_progress，供统计区与下载页使用。"""
+    snapshot = job.snapshot()
+    st.session_state.labeling_progress = {
+        'is_running': False,
+        'completed': snapshot['completed'],
+        'total': snapshot['total'],
+        'results': job.results(),
+        'is_test_run': False
+    }
+    mark_results_changed()
+    if job.retry_policy is not None:
+        st.session_state.labeling_progress['run_metrics'] = job.retry_policy.metrics.summary(_model_prices())
+    if st.session_state.get('response_cache_enabled', True):
+        st.session_state.labeling_progress['cache_hits'] = job.cache_hits
+        st.session_state.labeling_progress['cache_misses'] = job.cache_misses
+    retry_policy = job.retry_policy
+    st.session_state.labeling_job_outcome = {
+        'status': snapshot['status'],
+        'error': job.error,
+        'breaker_times_opened': retry_policy.breaker.times_opened if retry_policy is not None and retry_policy.breaker is not None else 0,
+        'retries_denied': retry_policy.budget.retries_denied if retry_policy is not None and retry_policy.budget is not None else 0,
+        'retries_spent': retry_policy.budget.retries_spent if retry_policy is not None and retry_policy.budget is not None else 0,
+        'parse_stats': retry_policy.parse_stats.snapshot() if retry_policy is not None else None,
+    }
+
+@st.fragment(run_every=1.0)
+def _display_full_run_job(job_id):
+    """后台全量标注的进度与控制。作为 fragment 每秒单独刷新，不重跑整个页面。"""
+    job = get_job_manager().get(job_id)
+    if job is None: # 应用进程已重启，后台任务随之结束
+        st.session_state.labeling_progress['is_running'] = False
+        st.session_state.labeling_progress.pop('job_id', None)
+        st.warning("后台标注任务已不存在（应用可能已重启）。已完成的行保存在断点记录中，可从断点继续。")
+        return
+    if not job.is_active:
+        _finish_full_run_job(job)
+        st.rerun()
+
+    snapshot = job.snapshot()
+    total_rows = snapshot['total']
+    prog = snapshot['completed'] / total_rows if total_rows > 0 else 0
+    status_label = JOB_STATUS_LABELS.get(snapshot['status'], snapshot['status'])
+    st.progress(min(prog, 1.0), text=f"{status_label} · {prog*100:.0f}% ({snapshot['completed']}/{total_rows})")
+    eta_str = f"{snapshot['eta_seconds']:.0f}s" if snapshot['eta_seconds'] is not None else "-"
+    st.text(
+        f"本次成功: {snapshot['succeeded']}  失败: {snapshot['failed']}. 耗时: {snapshot['elapsed']:.1f}s. "
+        f"速度: {snapshot['rows_per_second']:.2f} 条/秒. 预计剩余: {eta_str}."
+    )
+    col_pause, col_cancel, _ = st.columns([1, 1, 3])
+    with col_pause:
+        if snapshot['status'] == JOB_PAUSED:
+            if st.button("▶️ 继续", key=f"resume_job_{job_id}"):
+                job.resume()
+        elif st.button("⏸️ 暂停", key=f"pause_job_{job_id}", disabled=(snapshot['status'] != JOB_RUNNING),
+                       help="暂停后不再发送新请求，已发出的请求会正常完成。"):
+            job.pause()
+    with col_cancel:
+        if st.button("🛑 取消", key=f"cancel_job_{job_id}", disabled=(snapshot['status'] == JOB_CANCELLING),
+                     help="已完成的行保存在断点记录中，之后可从断点继续。"):
+            job.cancel()
+
+def _display_full_run_outcome():
+    """显示最近一次后台全量标注的结束状态。"""
+    outcome = st.session_state.get('labeling_job_outcome')
+    if not outcome:
+        return
+    if outcome['status'] == JOB_COMPLETED:
+        st.success("全量标注完成！")
+    elif outcome['status'] == JOB_CANCELLED:
+        st.warning("全量标注已取消。已完成的行保存在断点记录中，可从断点继续。")
+    elif outcome['status'] == JOB_FAILED:
+        st.error(f"全量标注过程中发生严重错误: {outcome.get('error')}")
+    if outcome.get('breaker_times_opened', 0) > 0:
+        st.warning(f"运行期间错误率过高，熔断器共暂停工作池 {outcome['breaker_times_opened']} 次。请检查服务商状态或降低并发/速率限制。")
+    if outcome.get('retries_denied', 0) > 0:
+        st.warning(f"本次运行的重试预算已用尽，{outcome['retries_denied']} 次重试被跳过（已重试 {outcome.get('retries_spent', 0)} 次）。可稍后仅重新标注失败的行。")
+    parse_stats = outcome.get('parse_stats')
+    if parse_stats and any(parse_stats.values()):
+        st.caption(
+            f"响应解析：直接解析 {parse_stats['clean']} 次，本地修复 {parse_stats['repaired']} 次，"
+            f"截断后部分恢复 {parse_stats['partial']} 次，无法解析而重新请求 {parse_stats['retried']} 次。"
+        )
+
+def _rerun_target_indices(current_df, base_results, scope, output_columns):
+    """定向重新标注的行 (按数据中的顺序)，按 (results_version, data_version, 范围, 输出列) 缓存。"""
+    cache_key = (st.session_state.get('results_version', 0), st.session_state.get('data_version', 0), scope, tuple(output_columns))
+    cached = st.session_state.get('_rerun_targets_cache')
+    if cached is None or cached['key'] != cache_key:
+        if scope == RERUN_FAILED:
+            failed = failed_result_indices(base_results)
+            target_indices = list(current_df.index[current_df.index.isin(failed)]) if failed else []
+        elif scope == RERUN_EMPTY:
+            target_indices = empty_output_indices(base_results, current_df.index, output_columns)
+        else:
+            target_indices = list(current_df.index)
+        cached = {'key': cache_key, 'indices': target_indices}
+        st.session_state._rerun_targets_cache = cached
+    return cached['indices']
+
+def _start_targeted_rerun(current_df, final_prompt, flow_name, base_results, target_indices, scope, output_columns, subset):
+    """在后台启动定向重新标注：只处理 target_indices 中的行，新结果按列合并进 base_results。"""
+    labeling_tasks = st.session_state.get('labeling_tasks', [])
+    full_ordered_keys = st.session_state.get('ordered_input_cols_for_prompt', [])
+    if not full_ordered_keys:
+        st.error("错误：未能获取用于Prompt的有序输入列列表 (ordered_input_cols_for_prompt)。请确保在“生成AI指令”步骤中已正确生成。")
+        return
+    if subset: # 只包含所选任务的Prompt，参考信息也只含这些任务的输入列
+        subset_tasks = [task_def for task_def in labeling_tasks if task_def.get('output_column') in output_columns]
+        run_prompt = build_task_subset_prompt(st.session_state.get('generated_prompt_template', ""), labeling_tasks, output_columns)
+        if run_prompt is None:
+            st.error("无法从JSON Prompt模板中取出所选输出列的任务指令。请检查“生成AI指令”页面中的模板 (每个任务的 task 应为输出列名)。")
+            return
+        ordered_keys = prompt_input_columns(subset_tasks)
+        api_conf = with_output_schema(st.session_state.api_config, subset_tasks)
+    else:
+        run_prompt, ordered_keys, api_conf = final_prompt, full_ordered_keys, _run_api_config()
+    try:
+        compiled_prompt = compile_prompt_template(run_prompt, ordered_keys)
+    except (KeyError, IndexError, ValueError) as e:
+        st.error(f"最终用户Prompt编译失败: {e}。请检查Prompt中的占位符是否与有序输入列一致。")
+        return
+
+    total_rows = len(current_df)
+    target_set = set(target_indices)
+    already_done = sum(1 for idx, res_d in base_results.items() if res_d.get('success') and idx not in target_set)
+    st.session_state.labeling_progress = {
+        'is_running': True,
+        'completed': already_done,
+        'total': total_rows,
+        'results': dict(base_results),
+        'is_test_run': False
+    }
+    mark_results_changed()
+    rows_df = current_df[current_df.index.isin(target_indices)]
+    rows_to_run = len(rows_df)
+    st.info(f"开始定向重新标注 {rows_to_run} 条数据（输出列：{'、'.join(output_columns)}）...")
+    duplicate_groups = {}
+    if st.session_state.get('dedup_rows', True):
+        rows_df, duplicate_groups = deduplicate_rows(rows_df, ordered_keys)
+        if duplicate_groups:
+            st.caption(f"已合并输入相同的行：{rows_to_run} 行只需发送 {len(rows_df)} 个请求。")
+    # 输出为空的行之前已成功返回，相同Prompt的缓存会原样返回空值，因此不使用缓存
+    response_cache = None if scope == RERUN_EMPTY else _session_response_cache()
+    # 合并后的整行结果追加到当前数据与完整Prompt的断点记录中
+    data_fingerprint = _data_fingerprint(current_df, full_ordered_keys, final_prompt, st.session_state.api_config.get('model_name', ''))
+    run_journal = RunJournal.start(flow_name, data_fingerprint, total_rows, resume=True)
+    job = get_job_manager().start_job(
+        iter_row_items(rows_df, ordered_keys),
+        compiled_prompt, api_conf, _run_exec_config(), total_rows,
+        flow_name=flow_name, previous_results=base_results, journal=run_journal,
+        response_cache=response_cache, duplicate_groups=duplicate_groups,
+        already_done=already_done, merge_columns=output_columns,
+        all_output_columns=[task_def['output_column'] for task_def in labeling_tasks if task_def.get('output_column')]
+    )
+    st.session_state.labeling_progress['job_id'] = job.job_id
+    st.session_state.pop('labeling_job_outcome', None)
+
+def _display_targeted_rerun_section(current_df, final_prompt, flow_name):
+    """定向重新标注：只重新标注失败 / 输出为空的行，或只重新标注部分输出列，不重新标注整张表。"""
+    current_prog = st.session_state.get('labeling_progress', {})
+    base_results = current_prog.get('results') or {}
+    if current_prog.get('is_running') or current_prog.get('is_test_run') or not base_results:
+        return
+    output_columns = [task_def['output_column'] for task_def in st.session_state.get('labeling_tasks', []) if task_def.get('output_column')]
+    if not output_columns:
+        return
+    with st.expander("🎯 定向重新标注 (只处理失败 / 为空的行或部分输出列)"):
+        st.caption("基于最近一次全量标注的结果：新结果按列合并进已有结果，其他行和列保持不变；重新标注失败的行保留原有结果。")
+        col_scope, col_columns = st.columns([1, 2])
+        with col_scope:
+            scope = st.radio("重新标注的行", list(RERUN_SCOPES), format_func=RERUN_SCOPES.get, key="rerun_scope")
+        with col_columns:
+            selected_columns = st.multiselect(
+                "重新标注的输出列", output_columns, default=output_columns, key="rerun_output_columns",
+                help="只选部分列时，使用只包含这些任务指令的Prompt (参考信息也只含这些任务的输入列)，例如修改了某个任务的需求后。"
+            )
+        if not selected_columns:
+            st.info("请至少选择一个输出列。")
+            return
+        selected_columns = [col for col in output_columns if col in selected_columns]
+        subset = len(selected_columns) < len(output_columns)
+        target_indices = _rerun_target_indices(current_df, base_results, scope, selected_columns)
+        is_full_run = scope == RERUN_ALL and not subset
+        if is_full_run:
+            st.caption("全部行、全部输出列即为全量标注，请使用上方的按钮。")
+        else:
+            st.caption(f"将重新标注 {len(target_indices)} / {len(current_df)} 行。")
+        if st.button("🎯 开始定向重新标注", key="run_targeted_rerun_btn", disabled=(is_full_run or not target_indices)):
+            _start_targeted_rerun(current_df, final_prompt, flow_name, base_results, target_indices, scope, selected_columns, subset)
+
+def _display_batch_api_section(current_df, final_prompt):
+    """离线批处理：提交到服务商的 Batch API，后台轮询，完成后载入结果。"""
+    st.divider()
+    st.subheader("📦 离线批处理 (Batch API)")
+    st.caption("适用于超大数据量：所有Prompt写入JSONL一次性提交到服务商的批处理接口（需服务商支持OpenAI兼容的 /v1/files 与 /v1/batches），通常在24小时内完成，费用一般低于同步调用。提交后可关闭页面，结果在后台取回。")
+
+    flow_name = st.session_state.get('current_task_flow_name')
+    if st.button("提交离线批处理任务", key="submit_batch_api_job_btn"):
+        ordered_keys = st.session_state.get('ordered_input_cols_for_prompt', [])
+        if not ordered_keys:
+            st.error("错误：未能获取用于Prompt的有序输入列列表 (ordered_input_cols_for_prompt)。请确保在“生成AI指令”步骤中已正确生成。")
+            return
+        try:
+            compiled_prompt = compile_prompt_template(final_prompt, ordered_keys)
+        except (KeyError, IndexError, ValueError) as e:
+            st.error(f"最终用户Prompt编译失败: {e}。请检查Prompt中的占位符是否与有序输入列一致。")
+            return
+        rows_df, duplicate_groups = current_df, {}
+        if st.session_state.get('dedup_rows', True):
+            rows_df, duplicate_groups = deduplicate_rows(current_df, ordered_keys)
+        api_conf = _run_api_config()
+        with st.spinner(f"正在生成 {len(rows_df)} 个请求的输入文件并上传..."):
+            try:
+                job = submit_batch_job(
+                    iter_row_items(rows_df, ordered_keys),
+                    compiled_prompt, api_conf, flow_name=flow_name,
+                    total_rows=len(current_df), duplicate_groups=duplicate_groups
+                )
+                ensure_batch_polling(job['job_id'], api_conf)
+                st.success(f"离线批处理任务已提交 ({job['job_id']})，共 {job['total_requests']} 个请求。")
+            except Exception as e:
+                st.error(f"提交离线批处理任务失败: {e}")
+
+    batch_jobs = list_batch_jobs(flow_name)
+    if not batch_jobs:
+        return
+    for job in batch_jobs[:5]:
+        job_id = job['job_id']
+        if job.get('status') in ('submitted', 'in_progress'):
+            # 应用重启后恢复后台轮询
+            ensure_batch_polling(job_id, st.session_state.api_config)
+        completed_n = sum(b.get('request_counts', {}).get('completed', 0) for b in job.get('batches', []))
+        failed_n = sum(b.get('request_counts', {}).get('failed', 0) for b in job.get('batches', []))
+        status_label = BATCH_JOB_STATUS_LABELS.get(job.get('status'), job.get('status'))
+        with st.expander(f"{job_id} · {status_label} · 已完成 {completed_n}/{job.get('total_requests', 0)} 个请求", expanded=(job is batch_jobs[0])):
+            st.caption(f"提交于 {str(job.get('created_time', ''))[:19]}，模型 {job.get('model_name')}，覆盖 {job.get('total_rows', 0)} 行，失败请求 {failed_n} 个。")
+            if job.get('error'):
+                st.warning(f"最近一次查询状态出错: {job['error']}")
+            col_b1, col_b2, col_b3 = st.columns(3)
+            with col_b1:
+                if st.button("🔄 刷新状态", key=f"refresh_batch_job_{job_id}"):
+                    refresh_batch_job(job_id, st.session_state.api_config)
+                    st.rerun()
+            with col_b2:
+                if job.get('status') in ('submitted', 'in_progress') and st.button("🛑 取消", key=f"cancel_batch_job_{job_id}"):
+                    try:
+                        cancel_batch_job(job_id, st.session_state.api_config)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"取消失败: {e}")
+            with col_b3:
+                if batch_job_has_results(job) and st.button("📥 载入结果", key=f"load_batch_job_{job_id}", type="primary"):
+                    if st.session_state.get('labeling_progress', {}).get('is_running'):
+                        st.error("已有标注任务进行中，请等待完成。")
+                    else:
+                        job_results = map_journal_results_to_index(load_batch_job_results(job_id), current_df.index)
+                        st.session_state.labeling_progress = {
+                            'is_running': False,
+                            'completed': len(job_results),
+                            'total': len(current_df),
+                            'results': job_results,
+                            'is_test_run': False
+                        }
+                        mark_results_changed()
+                        st.success(f"已载入 {len(job_results)} 行结果。请前往“📥 5. 下载与总结”查看和下载。")
 
 def display_run_labeling_tab():
     """Displays the UI for running test and full labeling processes."""
     st.header("🏷️ 4. 执行AI标注")
 
     final_prompt = st.session_state.get('final_user_prompt', "").strip()
-    current_df = st.session_state.get('df')
+    data = current_data()
     api_key_present = st.session_state.get('api_config', {}).get('api_key')
 
     # --- Pre-requisite checks ---
     if not final_prompt:
         st.warning("最终用户Prompt尚未生成或为空。请先在“3. 生成AI指令”页面完成。")
         return
-    if current_df is None or current_df.empty:
+    if data is None or len(data) == 0:
         st.warning("数据尚未加载或为空。请先在“1. 数据加载与编辑”页面加载。")
         return
     if not api_key_present:
@@ -31,10 +372,12 @@ def display_run_labeling_tab():
     if not placeholders:
          st.error("❌ 最终用户Prompt中未找到任何数据占位符 (如 `{列名}`)。无法执行标注。请返回“生成Prompt”页面修改。")
          return
-    missing_cols = [ph for ph in placeholders if ph not in current_df.columns]
+    missing_cols = [ph for ph in placeholders if ph not in data.columns]
     if missing_cols:
         st.error(f"❌ **列名不匹配:** Prompt中的占位符 `{', '.join(missing_cols)}` 在数据中找不到。\n请修改Prompt或检查数据列名。")
         return
+    # 大数据集模式下只读取Prompt输入列 (行索引即行号)，不整体读入内存
+    current_df = labeling_input_frame(st.session_state.get('ordered_input_cols_for_prompt', []) or placeholders)
     st.success(f"✅ Prompt中的占位符 `{', '.join(placeholders)}` 均已在数据列中找到。可以开始标注。")
 
     # --- Test Labeling Section ---
@@ -91,6 +434,7 @@ def display_run_labeling_tab():
                     'results': {}, 
                     'is_test_run': True
                 }
+                mark_results_changed()
                 
                 st.info(f"开始对 {len(test_df)} 条数据（方式：{test_sample_method}）进行试标注...")
                 progress_bar_test = st.progress(0)
@@ -106,17 +450,30 @@ def display_run_labeling_tab():
                     return # Stop execution
 
                 try:
-                    for original_idx, row_series in test_df.iterrows():
-                        row_dict = row_series.to_dict()
+                    compiled_prompt = compile_prompt_template(final_prompt, ordered_keys)
+                except (KeyError, IndexError, ValueError) as e:
+                    st.error(f"最终用户Prompt编译失败: {e}。请检查Prompt中的占位符是否与有序输入列一致。")
+                    st.session_state.labeling_progress['is_running'] = False
+                    return
+
+                response_cache = _session_response_cache()
+                if response_cache is not None: # 命中数只统计本次试标注的查询，不含同时运行的后台任务
+                    response_cache = response_cache.scoped()
+                api_conf = _run_api_config()
+                trial_policy = RetryPolicy(max_retries=st.session_state.retry_attempts)
+                try:
+                    for original_idx, row_dict in iter_row_items(test_df, ordered_keys):
                         
-                        # Pass ordered_keys to process_single_row
+                        # Pass the compiled template and ordered_keys to process_single_row
                         actual_idx, result_data = process_single_row(
                             (original_idx, row_dict), 
-                            final_prompt, 
-                            st.session_state.api_config,
+                            compiled_prompt, 
+                            api_conf,
                             ordered_keys, # Pass the ordered list of column names
                             st.session_state.retry_attempts, 
-                            st.session_state.request_delay
+                            st.session_state.request_delay,
+                            retry_policy=trial_policy,
+                            response_cache=response_cache
                         )
                         
                         st.session_state.labeling_progress['results'][actual_idx] = result_data
@@ -157,12 +514,60 @@ def display_run_labeling_tab():
                 except Exception as e:
                     st.error(f"试标注过程中发生意外错误: {e}")
                 finally:
+                    _record_cache_counters(response_cache)
+                    st.session_state.labeling_progress['run_metrics'] = trial_policy.metrics.summary(_model_prices())
                     st.session_state.labeling_progress['is_running'] = False
+                    mark_results_changed() # 试标注结果是逐行原地写入的
     
     # --- Full Data Labeling Section ---
     st.divider()
     st.subheader("🚀 全量数据标注")
-    if st.button("开始全量标注所有数据", type="primary", key="run_full_labeling_btn"):
+    engine_name = LABELING_ENGINES.get(st.session_state.get('labeling_engine', ENGINE_THREAD), "多线程")
+    if st.session_state.get('labeling_engine', ENGINE_THREAD) == ENGINE_THREAD:
+        st.caption(f"执行引擎: {engine_name}，并发线程数 {st.session_state.concurrent_workers}（可在侧边栏“执行参数配置”中修改）。")
+    else:
+        st.caption(f"执行引擎: {engine_name}，最大在途请求数 {st.session_state.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)}（可在侧边栏“执行参数配置”中修改）。")
+    if st.session_state.get('batch_size', 1) > 1:
+        st.caption(f"批量标注已开启：每个请求标注 {st.session_state.batch_size} 行数据。")
+    flow_name = st.session_state.get('current_task_flow_name')
+    flow_journals = find_flow_journals(flow_name)
+    latest_journal_meta = read_journal_meta(flow_journals[0]) if flow_journals else None
+    if flow_name and not st.session_state.get('labeling_progress', {}).get('is_running'):
+        # 浏览器刷新后会话被重置，但后台任务仍在运行：重新接上其进度
+        active_job = get_job_manager().active_job(flow_name)
+        if active_job is not None:
+            st.session_state.labeling_progress = {
+                'is_running': True, 'completed': 0, 'total': active_job.total_rows,
+                'results': {}, 'is_test_run': False, 'job_id': active_job.job_id
+            }
+            mark_results_changed()
+    is_running_now = st.session_state.get('labeling_progress', {}).get('is_running')
+
+    if latest_journal_meta and not is_running_now:
+        recorded_rows = count_journal_rows(flow_journals[0])
+        st.info(
+            f"💾 发现任务流程“{latest_journal_meta.get('flow_name')}”的断点记录："
+            f"已记录 {recorded_rows} / {latest_journal_meta.get('total', '?')} 行结果"
+            f"（开始于 {str(latest_journal_meta.get('created_time', '未知'))[:19]}）。"
+            "继续运行时仅处理尚未成功的行。"
+        )
+
+    col_full_new, col_full_resume, col_full_discard = st.columns([2, 2, 1])
+    with col_full_new:
+        start_new_run = st.button("开始全量标注所有数据", type="primary", key="run_full_labeling_btn")
+    with col_full_resume:
+        resume_run = st.button(
+            "▶️ 从断点继续全量标注", key="resume_full_labeling_btn",
+            disabled=(latest_journal_meta is None),
+            help="跳过断点记录中已成功的行，仅标注剩余的行。数据、Prompt或模型变化后无法继续。"
+        )
+    with col_full_discard:
+        if st.button("🗑️ 删除断点记录", key="discard_run_journal_btn", disabled=(not flow_journals or bool(is_running_now))):
+            for journal_file in flow_journals:
+                journal_file.unlink(missing_ok=True)
+            st.rerun()
+
+    if start_new_run or resume_run:
         if st.session_state.get('labeling_progress', {}).get('is_running'):
             st.error("已有标注任务进行中，请等待完成。")
         else:
@@ -171,65 +576,72 @@ def display_run_labeling_tab():
                 st.info("无数据可标注。")
                 return
 
-            st.session_state.labeling_progress = {
-                'is_running': True, 
-                'completed': 0, 
-                'total': total_rows,
-                'results': {}, 
-                'is_test_run': False 
-            }
-            st.info(f"开始对全部 {total_rows} 条数据进行标注... 这可能需要一些时间。")
-            progress_bar_full = st.progress(0, text="0% 完成")
-            status_text_full = st.empty()
-            start_time = time.time()
-            
-            data_for_exec = [(idx, row.to_dict()) for idx, row in current_df.iterrows()]
-            
-            workers = st.session_state.concurrent_workers
-            api_conf = st.session_state.api_config.copy()
-            retries = st.session_state.retry_attempts
-            delay = st.session_state.request_delay
+            api_conf = _run_api_config()
+            exec_conf = _run_exec_config()
 
             # Get ordered_keys for process_single_row to be used by threads
             ordered_keys = st.session_state.get('ordered_input_cols_for_prompt', [])
             if not ordered_keys:
                 st.error("错误：未能获取用于Prompt的有序输入列列表 (ordered_input_cols_for_prompt)。请确保在“生成AI指令”步骤中已正确生成。")
-                st.session_state.labeling_progress['is_running'] = False # Stop the process
                 return # Stop execution
 
             try:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-                    # Pass ordered_keys to process_single_row in executor.submit
-                    future_to_idx_map = {
-                        executor.submit(process_single_row, item, final_prompt, api_conf, ordered_keys, retries, delay): item[0]
-                        for item in data_for_exec
-                    }
-                    for future in concurrent.futures.as_completed(future_to_idx_map):
-                        original_idx = future_to_idx_map[future]
-                        try:
-                            returned_idx, result_data = future.result()
-                            st.session_state.labeling_progress['results'][returned_idx] = result_data
-                        except Exception as exc:
-                            st.session_state.labeling_progress['results'][original_idx] = {
-                                'success': False, 'result': None, 'error': f"任务执行失败 (Future): {exc}",
-                                'prompt_sent': "获取失败，因任务在发送前出错或Future本身出错", 'raw_response': None
-                            }
-                        finally:
-                            st.session_state.labeling_progress['completed'] += 1
-                            prog = st.session_state.labeling_progress['completed'] / total_rows if total_rows > 0 else 0
-                            el_time = time.time() - start_time
-                            avg_t = el_time / st.session_state.labeling_progress['completed'] if st.session_state.labeling_progress['completed'] > 0 else 0
-                            eta = (total_rows - st.session_state.labeling_progress['completed']) * avg_t if avg_t > 0 else 0
-                            progress_bar_full.progress(prog, text=f"{prog*100:.0f}% ({st.session_state.labeling_progress['completed']}/{total_rows})")
-                            if status_text_full: 
-                                status_text_full.text(f"已处理: {st.session_state.labeling_progress['completed']}/{total_rows}. 耗时: {el_time:.1f}s. 平均: {avg_t:.2f}s/条. 预计剩余: {eta:.0f}s.")
-                st.success("全量标注完成！")
-            except Exception as e:
-                st.error(f"全量标注过程中发生严重错误: {e}")
-            finally:
-                st.session_state.labeling_progress['is_running'] = False
-                if status_text_full: 
-                    status_text_full.empty()
+                compiled_prompt = compile_prompt_template(final_prompt, ordered_keys)
+            except (KeyError, IndexError, ValueError) as e:
+                st.error(f"最终用户Prompt编译失败: {e}。请检查Prompt中的占位符是否与有序输入列一致。")
+                return
+
+            data_fingerprint = _data_fingerprint(current_df, ordered_keys, final_prompt, api_conf.get('model_name', ''))
+            previous_results = {}
+            if resume_run:
+                resume_path = journal_path(flow_name, data_fingerprint)
+                if not resume_path.exists():
+                    st.error("当前数据、Prompt或模型与断点记录不一致，无法从断点继续。请开始新的全量标注。")
+                    return
+                previous_results = map_journal_results_to_index(load_journal_results(resume_path), current_df.index)
+
+            done_indices = [idx for idx, res_d in previous_results.items() if res_d.get('success')]
+            st.session_state.labeling_progress = {
+                'is_running': True, 
+                'completed': len(done_indices), 
+                'total': total_rows,
+                'results': dict(previous_results), 
+                'is_test_run': False 
+            }
+            mark_results_changed()
+            rows_df = current_df[~current_df.index.isin(done_indices)] if done_indices else current_df
+            rows_to_run = len(rows_df)
+            if resume_run:
+                st.info(f"从断点继续：{len(done_indices)} 条数据已成功，开始标注剩余的 {rows_to_run} 条数据...")
+            else:
+                st.info(f"开始对全部 {total_rows} 条数据进行标注... 这可能需要一些时间。")
+            duplicate_groups = {}
+            if st.session_state.get('dedup_rows', True):
+                rows_df, duplicate_groups = deduplicate_rows(rows_df, ordered_keys)
+                if duplicate_groups:
+                    st.caption(f"已合并输入相同的行：{rows_to_run} 行只需发送 {len(rows_df)} 个请求。")
+            response_cache = _session_response_cache()
+            # 每行结果先追加写入磁盘上的断点记录，浏览器刷新或进程中断后可从断点继续
+            run_journal = RunJournal.start(flow_name, data_fingerprint, total_rows, resume=bool(resume_run))
+            # 在后台线程中运行，界面重跑、切换标签页都不会打断；下方的进度区域定时刷新
+            # The template is compiled once per run and shared by all workers / coroutines
+            job = get_job_manager().start_job(
+                iter_row_items(rows_df, ordered_keys),
+                compiled_prompt, api_conf, exec_conf, total_rows,
+                flow_name=flow_name, previous_results=previous_results, journal=run_journal,
+                response_cache=response_cache, duplicate_groups=duplicate_groups
+            )
+            st.session_state.labeling_progress['job_id'] = job.job_id
+            st.session_state.pop('labeling_job_outcome', None)
+
+    _display_targeted_rerun_section(current_df, final_prompt, flow_name)
+
+    running_job_id = st.session_state.get('labeling_progress', {}).get('job_id')
+    if running_job_id and st.session_state.labeling_progress.get('is_running'):
+        _display_full_run_job(running_job_id)
+    _display_full_run_outcome()
+
+    _display_batch_api_section(current_df, final_prompt)
 
     # --- Display Stats and Errors ---
     current_prog = st.session_state.get('labeling_progress', {})
@@ -249,6 +661,15 @@ def display_run_labeling_tab():
             m_c1, m_c2 = st.columns(2)
             m_c1.metric("成功", success_c)
             m_c2.metric("失败", error_c, delta=str(error_c) if error_c > 0 else "0", delta_color="inverse" if error_c > 0 else "normal")
+            if 'cache_hits' in current_prog:
+                cache_hits, cache_misses = current_prog.get('cache_hits', 0), current_prog.get('cache_misses', 0)
+                cache_lookups = cache_hits + cache_misses
+                hit_rate_str = f"{cache_hits / cache_lookups * 100:.0f}%" if cache_lookups > 0 else "-"
+                c_c1, c_c2, c_c3 = st.columns(3)
+                c_c1.metric("响应缓存命中", cache_hits)
+                c_c2.metric("响应缓存未命中", cache_misses)
+                c_c3.metric("缓存命中率", hit_rate_str)
+            display_run_metrics(current_prog.get('run_metrics'))
 
             if error_c > 0:
                 with st.expander(f"⚠️ 查看 {error_c} 条失败详情 (基于原始行索引)", expanded=False):
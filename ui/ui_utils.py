@@ -1,11 +1,164 @@
 # table_labeling_tool/ui/ui_utils.py
+import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from core import data_handler
+from core.arrow_dataset import open_arrow_dataset, should_open_as_dataset
 from core.config_manager import load_api_configs # 避免循环导入，仅用于初始化
+from core.export_cache import ExportCache
+from core.notifier import logger as core_logger, set_notifier
+from core.table_search import TableSearchIndex
+
+def _page_or_log(show, log):
+    """
+    只在当前会话的脚本线程中显示到页面上；工作线程、异步引擎与后台任务中没有脚本上下文
+    (st.* 会被丢弃，也无法确定属于哪个会话)，改为写入日志。这些线程中的错误随结果字典返回，由脚本线程显示。
+    """
+    def notify(message):
+        if get_script_run_ctx(suppress_warning=True) is None:
+            log(message)
+        else:
+            show(message)
+    return notify
+
+# core 模块的错误/警告/提示显示在页面上 (命令行下默认写入日志)
+set_notifier(
+    error=_page_or_log(st.error, core_logger.error),
+    warning=_page_or_log(st.warning, core_logger.warning),
+    info=_page_or_log(st.info, core_logger.info),
+)
+
+# 数据加载结果按文件内容/路径缓存 (core.data_handler 本身不依赖Streamlit)
+load_data_from_uploaded_file = st.cache_data(data_handler.load_data_from_uploaded_file)
+load_data_from_path = st.cache_data(data_handler.load_data_from_path)
 
 def refresh_data_editor():
     """增加数据编辑器的key以强制刷新。"""
     st.session_state.data_editor_key = st.session_state.get('data_editor_key', 0) + 1
 
+def mark_data_changed(changed_columns=None):
+    """
+    数据被替换或修改后调用：增加 data_version (只增不减)，依赖数据的缓存 (导出文件、合并后的结果表、
+    搜索索引、数据指纹等) 都以它为键，不再比较或哈希整表。
+    changed_columns：只修改了这些列的单元格 (未增删行列) 时传入，搜索索引保留其余列。
+    """
+    st.session_state.data_version = st.session_state.get('data_version', 0) + 1
+    search_cache = st.session_state.get('_search_index_cache')
+    if changed_columns is not None and search_cache is not None:
+        search_cache['index'].invalidate(changed_columns)
+        search_cache['key'] = st.session_state.data_version
+
+def mark_results_changed():
+    """标注结果被替换或新增后调用：增加 results_version，使合并后的结果表缓存失效。"""
+    st.session_state.results_version = st.session_state.get('results_version', 0) + 1
+
+def current_data():
+    """
+    当前数据：st.session_state.df，或以内存映射方式打开的大数据集 (st.session_state.arrow_dataset)，
+    未加载时为 None。两者都支持 len() 与 .columns。
+    """
+    df = st.session_state.get('df')
+    return df if df is not None else st.session_state.get('arrow_dataset')
+
+def set_current_data_from_path(file_path):
+    """从服务器路径载入数据：较大的 Parquet 文件以内存映射数据集打开，其余读入 DataFrame。返回载入的数据，失败时为 None。"""
+    dataset = open_arrow_dataset(file_path) if should_open_as_dataset(file_path) else None
+    if dataset is not None:
+        st.session_state.df = None
+    else:
+        df = load_data_from_path(file_path)
+        if df is None:
+            return None
+        st.session_state.df = df
+    st.session_state.arrow_dataset = dataset
+    mark_data_changed()
+    return current_data()
+
+def labeling_input_frame(input_columns):
+    """
+    标注所需的数据：DataFrame 模式下即 st.session_state.df；
+    大数据集模式下只读取Prompt输入列 (按 data_version 缓存)，行索引为行号。
+    """
+    df = st.session_state.get('df')
+    dataset = st.session_state.get('arrow_dataset')
+    if df is not None or dataset is None:
+        return df
+    cache_key = (st.session_state.get('data_version', 0), tuple(input_columns))
+    cached = st.session_state.get('_labeling_input_cache')
+    if cached is None or cached['key'] != cache_key:
+        cached = {'key': cache_key, 'df': dataset.read_columns(input_columns)}
+        st.session_state._labeling_input_cache = cached
+    return cached['df']
+
+def table_search_index(df):
+    """st.session_state.df 的搜索索引 (见 core.table_search)，按 data_version 缓存，数据修改后重建 (见 mark_data_changed)。"""
+    cache_key = st.session_state.get('data_version', 0)
+    cached = st.session_state.get('_search_index_cache')
+    if cached is None or cached['key'] != cache_key:
+        cached = {'key': cache_key, 'index': TableSearchIndex(df)}
+        st.session_state._search_index_cache = cached
+    return cached['index']
+
+def export_download_button(export_name, data, version_key, format_type, file_name, label, key, **button_kwargs):
+    """
+    按需导出：点击“生成”后才序列化 data，结果按 (version_key, 格式) 缓存在会话中，
+    其他控件变化引起的重跑不再重新编码整个文件。较大的文件只保存在服务器磁盘上，点击“准备下载”后才读入内存。
+    data 为 DataFrame，或 write(路径, 格式) -> bool 的写出函数 (如逐页写出的大数据集)。
+    """
+    if '_export_cache' not in st.session_state:
+        st.session_state._export_cache = ExportCache()
+    export_cache = st.session_state._export_cache
+    export = export_cache.get(export_name, version_key, format_type)
+    if export is None:
+        build_slot = st.empty()
+        if not build_slot.button(f"⚙️ 生成 {format_type.upper()} 文件", key=f"{key}_build"):
+            return
+        build_slot.empty()
+        with st.spinner(f"正在生成 {format_type.upper()} 文件..."):
+            export = export_cache.build(export_name, version_key, data, format_type)
+        if export is None:
+            st.error(f"无法生成 {format_type.upper()} 文件供下载。")
+            return
+    if export['data'] is not None:
+        st.download_button(label, export['data'], file_name, key=key, **button_kwargs)
+        return
+    # 较大的文件：download_button 每次渲染都会把整个文件读入内存并注册到媒体文件管理器，
+    # 因此平时只显示服务器路径，用户点击“准备下载”后才在这一次运行中读入并提供下载按钮
+    st.caption(f"文件较大 ({export['size'] / 1024 / 1024:.1f} MB)，已保存在服务器: {export['path'].resolve()}")
+    prepare_slot = st.empty()
+    if prepare_slot.button(f"📦 准备下载 {format_type.upper()} 文件", key=f"{key}_prepare",
+                           help="把文件读入服务器内存并提供浏览器下载；也可以直接从上面的服务器路径取用。"):
+        prepare_slot.empty()
+        with open(export['path'], 'rb') as export_file:
+            st.download_button(label, export_file.read(), file_name, key=key, **button_kwargs)
+
+def display_run_metrics(run_metrics):
+    """显示一次运行的API用量统计 (core.run_metrics.RunMetrics.summary 的结果)：Token、耗时分位数、吞吐量与估算费用。"""
+    if not run_metrics or not run_metrics.get('calls'):
+        return
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "-"
+    metric_cols = st.columns(4)
+    metric_cols[0].metric("API请求数", run_metrics['calls'], help=f"其中重试 {run_metrics['retried_calls']} 次")
+    metric_cols[1].metric("Token合计", f"{run_metrics['total_tokens']:,}",
+                          help=f"输入 {run_metrics['prompt_tokens']:,} (缓存命中 {run_metrics['cached_tokens']:,})，输出 {run_metrics['completion_tokens']:,}")
+    tokens_per_second = run_metrics.get('tokens_per_second')
+    metric_cols[2].metric("Token/秒", f"{tokens_per_second:,.0f}" if tokens_per_second is not None else "-",
+                          help="按第一次请求开始到最后一次请求结束的时间计算 (含输入与输出Token)。")
+    metric_cols[3].metric("估算费用", f"{run_metrics['cost']:.4f}" if run_metrics.get('cost') is not None else "-",
+                          help="按侧边栏中配置的模型价格 (每百万Token) 估算；未配置价格时不显示。")
+    status_str = "，".join(f"{status}: {count}" for status, count in sorted(run_metrics['status_counts'].items()))
+    st.caption(
+        f"单次请求耗时 p50 {seconds(run_metrics['latency_p50'])} / p95 {seconds(run_metrics['latency_p95'])} / "
+        f"p99 {seconds(run_metrics['latency_p99'])}，平均 {seconds(run_metrics['latency_mean'])}。HTTP状态: {status_str}。"
+    )
+    if len(run_metrics['models']) > 1:
+        st.dataframe(pd.DataFrame([
+            {"模型": model, "请求数": totals['calls'], "输入Token": totals['prompt_tokens'], "缓存命中Token": totals['cached_tokens'],
+             "输出Token": totals['completion_tokens'], "估算费用": totals['cost']}
+            for model, totals in run_metrics['models'].items()
+        ]), use_container_width=True, hide_index=True)
+
 def refresh_task_form():
     """增加任务表单的key以强制刷新并清空输入。"""
     st.session_state.task_form_key = st.session_state.get('task_form_key', 0) + 1
@@ -16,11 +169,16 @@ def init_session_state():
     # --- 核心数据和配置 ---
     if 'df' not in st.session_state:
         st.session_state.df = None
+    if 'arrow_dataset' not in st.session_state: # 以内存映射方式打开的大数据集 (此时 df 为 None)，见 core.arrow_dataset
+        st.session_state.arrow_dataset = None
     if 'current_data_path' not in st.session_state: # 存储从历史任务加载的数据路径
         st.session_state.current_data_path = None
     # 用于从上传文件名生成下载文件名
     if '_uploaded_file_name_for_download_' not in st.session_state:
         st.session_state._uploaded_file_name_for_download_ = None
+    # 当前任务流程名称 (保存或加载流程时设置)，用于定位全量标注的断点续跑记录
+    if 'current_task_flow_name' not in st.session_state:
+        st.session_state.current_task_flow_name = None
 
 
     # --- API配置 ---
@@ -60,6 +218,12 @@ def init_session_state():
             'is_test_run': False    # 标记是否为测试运行
         }
 
+    # 数据 / 标注结果的版本号，每次变化时加1 (见 mark_data_changed / mark_results_changed)
+    if 'data_version' not in st.session_state:
+        st.session_state.data_version = 0
+    if 'results_version' not in st.session_state:
+        st.session_state.results_version = 0
+
     # --- 执行参数 ---
     if 'concurrent_workers' not in st.session_state:
         st.session_state.concurrent_workers = 4
@@ -67,6 +231,20 @@ def init_session_state():
         st.session_state.retry_attempts = 3
     if 'request_delay' not in st.session_state:
         st.session_state.request_delay = 0.2 # 秒
+    if 'labeling_engine' not in st.session_state: # 全量标注执行引擎: "thread" 或 "async"
+        st.session_state.labeling_engine = "thread"
+    if 'max_in_flight' not in st.session_state: # 异步引擎的最大在途请求数
+        st.session_state.max_in_flight = 100
+    if 'batch_size' not in st.session_state: # 全量标注时每个请求携带的行数 (1 表示逐行请求)
+        st.session_state.batch_size = 1
+    if 'dedup_rows' not in st.session_state: # 全量标注时合并输入相同的行
+        st.session_state.dedup_rows = True
+    if 'response_cache_enabled' not in st.session_state: # 是否复用本地缓存中相同请求的结果
+        st.session_state.response_cache_enabled = True
+    if 'response_cache_ttl_days' not in st.session_state:
+        st.session_state.response_cache_ttl_days = 30
+    if 'response_cache_max_entries' not in st.session_state:
+        st.session_state.response_cache_max_entries = 200000
 
     # --- UI元素刷新用的Key ---
     if 'data_editor_key' not in st.session_state: